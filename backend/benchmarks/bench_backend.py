@@ -0,0 +1,322 @@
+"""バックエンドのベンチマーク・負荷試験 (プロセス内 / ローカルの uvicorn に HTTP 経由)
+
+使い方 (backend ディレクトリで):
+  python -m benchmarks.bench_backend [--http] [--output results.json] [--baseline previous.json]
+
+固定シードのコーパス (benchmarks/corpus.py) で calculate_score・apply_score_to_scores・
+parse_tile_response を計測し、スループットと p50/p95/p99 を表示して JSON に保存する。
+--http ではローカルに uvicorn と偽の Vision サーバーを起動し、/calculate・/apply-score・
+/recognize に並列でリクエストを送る。--baseline を指定すると保存済みの結果と比較し、
+スループットか p95 が --tolerance を超えて悪化した項目があれば終了コード 1 で終わる。
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from importlib import metadata
+from pathlib import Path
+from typing import Callable
+
+from benchmarks.corpus import build_hand_corpus, score_events, vision_responses
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULT_FORMAT_VERSION = 1
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    """最近傍順位法のパーセンタイル (sorted_values は昇順)"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies: list[float], elapsed: float, errors: int = 0) -> dict:
+    """1件ごとの所要時間 (秒) と全体の経過時間からスループットとパーセンタイルを求める"""
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "errors": errors,
+        "throughput_per_second": len(values) / elapsed if elapsed > 0 else 0.0,
+        "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 50) * 1000,
+        "p95_ms": percentile(values, 95) * 1000,
+        "p99_ms": percentile(values, 99) * 1000,
+    }
+
+
+def run_in_process(fn: Callable, inputs: list, iterations: int, warmup: int) -> dict:
+    for i in range(warmup):
+        fn(inputs[i % len(inputs)])
+    latencies = []
+    started = time.perf_counter()
+    for i in range(iterations):
+        call_started = time.perf_counter()
+        fn(inputs[i % len(inputs)])
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, time.perf_counter() - started)
+
+
+def in_process_benchmarks(hand_corpus: list[dict], args) -> dict:
+    from main import CalculateRequest, parse_tile_response, score_hand
+    from score_engine import apply_score_to_scores
+
+    # 計測前に期待値と一致するか確認する (速くなったが結果が変わった、を見逃さないため)
+    for entry in hand_corpus:
+        score = score_hand(CalculateRequest.model_validate(entry["request"]))
+        actual = {"han": score.han, "fu": score.fu, "cost": score.cost}
+        if actual != entry["expected"]:
+            raise AssertionError(f"score mismatch for {entry['request']}: {actual} != {entry['expected']}")
+
+    requests = [entry["request"] for entry in hand_corpus]
+    events = score_events(len(hand_corpus), args.seed)
+    responses = vision_responses(hand_corpus, args.seed)
+    return {
+        "calculate_score": run_in_process(
+            lambda request: score_hand(CalculateRequest.model_validate(request)).model_dump_json(),
+            requests, args.iterations, args.warmup,
+        ),
+        "apply_score_to_scores": run_in_process(
+            lambda event: apply_score_to_scores(**event), events, args.iterations, args.warmup,
+        ),
+        "parse_tile_response": run_in_process(parse_tile_response, responses, args.iterations, args.warmup),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(module_args: list[str], env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", *module_args],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **env},
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    """url が 200 を返すまで待つ (/ready はウォームアップが終わるまで 503)"""
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1.0).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(f"server did not become ready: {url}")
+
+
+def sample_images(count: int, seed: int) -> list[bytes]:
+    """/recognize に送る画像 (内容は偽サーバーが見ないので、サイズだけ実写に近づける)"""
+    from PIL import Image, ImageDraw
+
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        image = Image.new("RGB", (1600, 1200), (20, 90, 40))
+        draw = ImageDraw.Draw(image)
+        for x in range(14):
+            color = tuple(rng.randrange(256) for _ in range(3))
+            draw.rectangle((100 + x * 100, 500, 180 + x * 100, 620), fill=(240, 240, 230), outline=color, width=6)
+        buffer = io.BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        images.append(buffer.getvalue())
+    return images
+
+
+async def run_http(client, send: Callable, inputs: list, requests: int, concurrency: int, warmup: int) -> dict:
+    """send(client, input) を concurrency 並列で requests 回実行 (失敗は errors に数える)"""
+    for i in range(warmup):
+        await send(client, inputs[i % len(inputs)])
+
+    latencies = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in counter:
+            call_started = time.perf_counter()
+            try:
+                ok = await send(client, inputs[i % len(inputs)])
+            except Exception:
+                ok = False
+            latencies.append(time.perf_counter() - call_started)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - started, errors)
+
+
+async def http_benchmarks(base_url: str, hand_corpus: list[dict], args) -> dict:
+    import httpx
+
+    async def calculate(client, request) -> bool:
+        response = await client.post("/calculate", json=request)
+        return response.status_code == 200 and not response.json().get("error")
+
+    async def apply_score(client, event) -> bool:
+        return (await client.post("/apply-score", json=event)).status_code == 200
+
+    async def recognize(client, image) -> bool:
+        response = await client.post("/recognize", files={"image": ("hand.jpg", image, "image/jpeg")})
+        return response.status_code == 200 and bool(response.json().get("tiles"))
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60.0) as client:
+        return {
+            "http_calculate": await run_http(
+                client, calculate, [entry["request"] for entry in hand_corpus],
+                args.requests, args.concurrency, args.warmup,
+            ),
+            "http_apply_score": await run_http(
+                client, apply_score, score_events(len(hand_corpus), args.seed),
+                args.requests, args.concurrency, args.warmup,
+            ),
+            "http_recognize": await run_http(
+                client, recognize, sample_images(8, args.seed),
+                args.recognize_requests, args.concurrency, min(args.warmup, 4),
+            ),
+        }
+
+
+def run_http_benchmarks(hand_corpus: list[dict], args) -> dict:
+    vision_port = free_port()
+    api_port = free_port()
+    vision = start_server([
+        "benchmarks.fake_vision_server", "--port", str(vision_port),
+        "--latency-ms", str(args.vision_latency_ms), "--seed", str(args.seed),
+    ], {})
+    api = start_server(
+        ["uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(api_port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        {
+            # キャッシュとレート制限を外し、毎回計算・Vision API 呼び出しを行わせる
+            "SCORE_CACHE_MAX_SIZE": "0",
+            "RECOGNITION_CACHE_MAX_SIZE": "0",
+            "CALCULATE_RATE_LIMIT_COUNT": "0",
+            "RECOGNIZE_RATE_LIMIT_COUNT": "0",
+            "API_AUTH_TOKEN": "",
+            "GAME_SESSION_SNAPSHOT_PATH": "",
+            "VISION_BACKEND": "openai",
+            "OPENAI_API_KEY": "benchmark",
+            "VISION_BASE_URL": f"http://127.0.0.1:{vision_port}/v1",
+        },
+    )
+    try:
+        wait_until_ready(f"http://127.0.0.1:{vision_port}/docs", vision)
+        # 計測がウォームアップと重ならないよう、/ready が 200 になってから始める
+        wait_until_ready(f"http://127.0.0.1:{api_port}/ready", api)
+        return asyncio.run(http_benchmarks(f"http://127.0.0.1:{api_port}", hand_corpus, args))
+    finally:
+        for process in (api, vision):
+            process.terminate()
+            process.wait(timeout=10)
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def environment_info(args) -> dict:
+    return {
+        "git_revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "mahjong": metadata.version("mahjong"),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "args": vars(args),
+    }
+
+
+def compare_results(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """両方にある項目について、スループットの低下か p95 の増加が tolerance (割合) を超えたものを返す"""
+    regressions = []
+    for name, result in current["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        if result["throughput_per_second"] < previous["throughput_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {previous['throughput_per_second']:.1f} -> {result['throughput_per_second']:.1f}/s"
+            )
+        if result["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']:.3f} -> {result['p95_ms']:.3f} ms")
+    return regressions
+
+
+def print_results(results: dict) -> None:
+    print(f"{'benchmark':24} {'count':>7} {'errors':>6} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, result in results.items():
+        print(
+            f"{name:24} {result['count']:7d} {result['errors']:6d} {result['throughput_per_second']:10.1f} "
+            f"{result['p50_ms']:9.3f} {result['p95_ms']:9.3f} {result['p99_ms']:9.3f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--per-category", type=int, default=50, help="コーパスのカテゴリごとの手牌数")
+    parser.add_argument("--iterations", type=int, default=5000, help="プロセス内の計測回数")
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--http", action="store_true", help="uvicorn を起動して HTTP 経由でも計測する")
+    parser.add_argument("--requests", type=int, default=2000, help="HTTP の計測回数")
+    parser.add_argument("--recognize-requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn のワーカー数")
+    parser.add_argument("--vision-latency-ms", type=float, default=300.0)
+    parser.add_argument("--output", help="結果を保存する JSON ファイル")
+    parser.add_argument("--baseline", help="比較対象の JSON ファイル")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="悪化とみなす割合")
+    parser.add_argument("--dump-corpus", help="生成したコーパスを書き出す JSON ファイル")
+    args = parser.parse_args()
+
+    hand_corpus = build_hand_corpus(args.per_category, args.seed)
+    if args.dump_corpus:
+        Path(args.dump_corpus).write_text(json.dumps(hand_corpus, ensure_ascii=False, indent=1), encoding="utf-8")
+
+    results = in_process_benchmarks(hand_corpus, args)
+    if args.http:
+        results.update(run_http_benchmarks(hand_corpus, args))
+    print_results(results)
+
+    report = {"version": RESULT_FORMAT_VERSION, "environment": environment_info(args), "results": results}
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare_results(report, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""事前計算テーブルと mahjong ライブラリの和了判定・向聴数・待ち牌列挙の速度比較
+
+使い方 (backend ディレクトリで): python -m benchmarks.bench_hand_tables [--hands 2000]
+テーブルが無い場合は先に python build_hand_tables.py を実行すること。
+"""
+import argparse
+import random
+import time
+
+from mahjong.agari import Agari
+from mahjong.hand_calculating.hand import HandCalculator
+from mahjong.shanten import Shanten
+from mahjong.tile import TilesConverter
+
+from hand_tables import load_hand_tables
+
+
+def near_complete_hands(count: int, seed: int) -> list[list[int]]:
+    """和了形から0-2枚入れ替えた14枚の手牌 (実戦で判定対象になりやすい形)"""
+    rng = random.Random(seed)
+    hands = []
+    while len(hands) < count:
+        tiles_34 = [0] * 34
+        for _ in range(4):
+            if rng.random() < 0.6:
+                start = rng.randrange(3) * 9 + rng.randrange(7)
+                blocks = (start, start + 1, start + 2)
+            else:
+                blocks = (rng.randrange(34),) * 3
+            for tile_34 in blocks:
+                tiles_34[tile_34] += 1
+        pair = rng.randrange(34)
+        tiles_34[pair] += 2
+        for _ in range(rng.randrange(3)):
+            tiles_34[rng.choice([i for i in range(34) if tiles_34[i]])] -= 1
+            tiles_34[rng.randrange(34)] += 1
+        if max(tiles_34) <= 4:
+            hands.append(tiles_34)
+    return hands
+
+
+def drop_one(hands: list[list[int]], seed: int) -> list[list[int]]:
+    rng = random.Random(seed)
+    dropped = []
+    for tiles_34 in hands:
+        tiles_34 = list(tiles_34)
+        tiles_34[rng.choice([i for i in range(34) if tiles_34[i]])] -= 1
+        dropped.append(tiles_34)
+    return dropped
+
+
+def calculator_is_agari(calculator: HandCalculator, tiles_34: list[int]) -> bool:
+    """HandCalculator による判定 (和了形でなければ hand_not_winning が返る)"""
+    tiles = TilesConverter.to_136_array(tiles_34)
+    result = calculator.estimate_hand_value(tiles, tiles[-1])
+    return result.error != "hand_not_winning"
+
+
+def library_waits(agari: Agari, tiles_34: list[int]) -> list[int]:
+    waits = []
+    for tile_34 in range(34):
+        if tiles_34[tile_34] >= 4:
+            continue
+        tiles_34[tile_34] += 1
+        if agari.is_agari(tiles_34):
+            waits.append(tile_34)
+        tiles_34[tile_34] -= 1
+    return waits
+
+
+def measure(label: str, fn, hands) -> float:
+    started = time.perf_counter()
+    for tiles_34 in hands:
+        fn(tiles_34)
+    elapsed = time.perf_counter() - started
+    print(f"{label:<36} {elapsed * 1e6 / len(hands):9.1f} us/hand")
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hands", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    tables = load_hand_tables()
+    if tables is None:
+        raise SystemExit("hand tables not found: run python build_hand_tables.py first")
+
+    agari = Agari()
+    shanten = Shanten()
+    calculator = HandCalculator()
+    complete_hands = near_complete_hands(args.hands, args.seed)
+    waiting_hands = drop_one(complete_hands, args.seed)
+
+    for name, library_fn, table_fn, hands in (
+        ("agari vs HandCalculator", lambda tiles_34: calculator_is_agari(calculator, tiles_34), tables.is_agari, complete_hands),
+        ("agari vs Agari", agari.is_agari, tables.is_agari, complete_hands),
+        ("shanten", shanten.calculate_shanten, tables.shanten, waiting_hands),
+        ("waits", lambda tiles_34: library_waits(agari, tiles_34), tables.waits, waiting_hands),
+    ):
+        library = measure(f"{name} (mahjong)", library_fn, hands)
+        table = measure(f"{name} (tables)", table_fn, hands)
+        print(f"{name + ' speedup':<36} {library / table:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
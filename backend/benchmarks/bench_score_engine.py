@@ -0,0 +1,65 @@
+"""apply_score_to_scores と apply_scores_batch / replay_games の速度比較
+
+使い方 (backend ディレクトリで): python -m benchmarks.bench_score_engine [--games 10000]
+"""
+import argparse
+import time
+
+import numpy as np
+
+from score_engine import apply_score_to_scores, replay_games
+
+RESULTS_PER_GAME = 10
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    size = args.games * RESULTS_PER_GAME
+    is_tsumo = rng.random(size) < 0.4
+    winner = rng.integers(0, 4, size)
+    events = {
+        "winner_index": winner,
+        "dealer_index": rng.integers(0, 4, size),
+        "main_cost": rng.choice([1000, 2000, 3900, 8000, 12000], size),
+        "additional_cost": rng.choice([0, 500, 1000, 2000, 4000], size),
+        "is_tsumo": is_tsumo,
+        "honba": rng.integers(0, 4, size),
+        "riichi_sticks": rng.integers(0, 3, size),
+        "loser_index": np.where(is_tsumo, -1, (winner + rng.integers(1, 4, size)) % 4),
+    }
+    game_index = np.repeat(np.arange(args.games), RESULTS_PER_GAME)
+    initial = np.full((args.games, 4), 25000)
+
+    started = time.perf_counter()
+    scalar_scores = initial.tolist()
+    columns = {name: values.tolist() for name, values in events.items()}
+    for i, game in enumerate(game_index.tolist()):
+        scalar_scores[game] = apply_score_to_scores(
+            scores=scalar_scores[game],
+            winner_index=columns["winner_index"][i],
+            dealer_index=columns["dealer_index"][i],
+            cost={"main": columns["main_cost"][i], "additional": columns["additional_cost"][i]},
+            is_tsumo=columns["is_tsumo"][i],
+            honba=columns["honba"][i],
+            riichi_sticks=columns["riichi_sticks"][i],
+            loser_index=None if columns["is_tsumo"][i] else columns["loser_index"][i],
+        )["scores"]
+    scalar = time.perf_counter() - started
+
+    started = time.perf_counter()
+    replay = replay_games(initial, game_index, **events)
+    batch = time.perf_counter() - started
+
+    assert replay["scores"].tolist() == scalar_scores
+    print(f"{size} results / {args.games} games")
+    print(f"scalar  {scalar * 1000:9.1f} ms")
+    print(f"batch   {batch * 1000:9.1f} ms  ({scalar / batch:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""ローカル牌認識 (tile_classifier.py) の精度と速度の計測
+
+使い方 (backend ディレクトリで):
+  python -m benchmarks.bench_tile_classifier [--min-confidence 0.8] [--output results.json]
+  python -m benchmarks.bench_tile_classifier --write-samples   # サンプル画像を作り直す
+
+benchmarks/tile_samples/ のサンプル画像 (labels.json に正解) を分類し、牌単位の正解率、
+枚数の切り分けが合った割合、全牌が --min-confidence 以上で Vision API を呼ばずに済む割合と
+その場合の正解率、1枚あたりの処理時間を表示する。サンプルは合成テンプレートと同じ図柄を
+大きさ・ぼかし・ノイズ・JPEG 圧縮を変えて描いたもの (--write-samples で再生成できる)で、実際の写真での精度は別途確認が必要。
+"""
+import argparse
+import json
+import random
+import time
+from pathlib import Path
+
+from benchmarks.bench_backend import summarize
+from tile_classifier import TILE_IDS, load_tile_classifier, min_confidence, render_strip
+
+SAMPLES_DIR = Path(__file__).resolve().parent / "tile_samples"
+# (牌の高さ, ノイズの標準偏差, ぼかしの半径) の組み合わせ
+SAMPLE_CONDITIONS = [
+    (48, 0, 0.0), (48, 6, 0.6), (64, 0, 0.6), (64, 8, 1.0),
+    (96, 0, 0.0), (96, 6, 1.0), (120, 8, 0.6), (120, 4, 1.4),
+]
+
+
+def random_hand(rng: random.Random, size: int = 14) -> list[str]:
+    """同じ牌は4枚までの、萬子・筒子・索子・字牌の順に並べた手牌"""
+    pool = [tile_id for tile_id in TILE_IDS for _ in range(4)]
+    return sorted(rng.sample(pool, size), key=TILE_IDS.index)
+
+
+def write_samples(directory: Path, per_condition: int, seed: int) -> None:
+    rng = random.Random(seed)
+    directory.mkdir(parents=True, exist_ok=True)
+    labels = {}
+    for condition_index, (tile_height, noise, blur) in enumerate(SAMPLE_CONDITIONS):
+        for index in range(per_condition):
+            tile_ids = random_hand(rng)
+            name = f"h{tile_height}_n{noise}_b{blur:g}_{index}.jpg"
+            strip = render_strip(
+                tile_ids, tile_height=tile_height, seed=condition_index * 100 + index, noise=noise, blur=blur,
+            )
+            strip.convert("RGB").save(directory / name, format="JPEG", quality=80)
+            labels[name] = tile_ids
+    (directory / "labels.json").write_text(json.dumps(labels, indent=1) + "\n", encoding="utf-8")
+
+
+def load_samples(directory: Path = SAMPLES_DIR) -> list[tuple[str, bytes, list[str]]]:
+    labels = json.loads((directory / "labels.json").read_text(encoding="utf-8"))
+    return [(name, (directory / name).read_bytes(), tile_ids) for name, tile_ids in sorted(labels.items())]
+
+
+def evaluate(classifier, samples, threshold: float, repeat: int = 5) -> dict:
+    """サンプルごとに repeat 回分類し、精度と処理時間をまとめる"""
+    latencies = []
+    tiles = correct = segmented = accepted = accepted_correct = 0
+    failures = []
+    started = time.perf_counter()
+    for name, data, expected in samples:
+        for _ in range(repeat):
+            call_started = time.perf_counter()
+            result = classifier.classify_bytes(data)
+            latencies.append(time.perf_counter() - call_started)
+        predicted = [tile.tile_id for tile in result]
+        tiles += len(expected)
+        if len(predicted) == len(expected):
+            segmented += 1
+            correct += sum(a == b for a, b in zip(predicted, expected))
+        if result and min_confidence(result) >= threshold:
+            accepted += 1
+            accepted_correct += predicted == expected
+        if predicted != expected:
+            failures.append({"sample": name, "expected": expected, "predicted": predicted})
+
+    report = summarize(latencies, time.perf_counter() - started)
+    report.update({
+        "samples": len(samples),
+        "tile_accuracy": correct / tiles if tiles else 0.0,
+        "segmentation_accuracy": segmented / len(samples) if samples else 0.0,
+        "min_confidence": threshold,
+        "accepted_rate": accepted / len(samples) if samples else 0.0,
+        "accepted_accuracy": accepted_correct / accepted if accepted else 0.0,
+        "failures": failures,
+    })
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--samples", default=str(SAMPLES_DIR))
+    parser.add_argument("--templates", help="テンプレート画像 (未指定なら合成テンプレート)")
+    parser.add_argument("--min-confidence", type=float, default=0.8)
+    parser.add_argument("--repeat", type=int, default=5, help="サンプルごとの計測回数")
+    parser.add_argument("--output", help="結果を保存する JSON ファイル")
+    parser.add_argument("--write-samples", action="store_true", help="サンプル画像を生成して終了する")
+    parser.add_argument("--per-condition", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.write_samples:
+        write_samples(Path(args.samples), args.per_condition, args.seed)
+        return
+
+    load_started = time.perf_counter()
+    classifier = load_tile_classifier(args.templates)
+    load_ms = (time.perf_counter() - load_started) * 1000
+    report = evaluate(classifier, load_samples(Path(args.samples)), args.min_confidence, args.repeat)
+    report["template_load_ms"] = load_ms
+
+    print(f"samples               {report['samples']}")
+    print(f"template load         {load_ms:.1f} ms")
+    print(f"latency p50 / p95     {report['p50_ms']:.2f} / {report['p95_ms']:.2f} ms per image")
+    print(f"tile accuracy         {report['tile_accuracy']:.2%}")
+    print(f"segmentation          {report['segmentation_accuracy']:.2%}")
+    print(f"accepted locally      {report['accepted_rate']:.2%} (confidence >= {args.min_confidence})")
+    print(f"accepted accuracy     {report['accepted_accuracy']:.2%}")
+    for failure in report["failures"]:
+        print(f"  {failure['sample']}: expected {' '.join(failure['expected'])}")
+        print(f"  {' ' * len(failure['sample'])}  got      {' '.join(failure['predicted'])}")
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
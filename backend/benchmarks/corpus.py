@@ -0,0 +1,217 @@
+"""ベンチマーク・負荷試験用の固定シードのコーパス
+
+和了形の手牌 (門前 / 副露 / 槓が多い手 / 役満 / 七対子)、Vision API の応答テキスト、
+点数移動のイベントを生成する。手牌は実際に点数計算して役が付くものだけを採用し、
+期待値 (翻・符・点数) も一緒に持つ。同じシード・同じ mahjong ライブラリなら同じ内容になる。
+"""
+import json
+import random
+
+CATEGORIES = ("closed", "open", "kan", "yakuman", "chiitoitsu")
+SUITS = ("man", "pin", "sou", "honors")
+WINDS = ("east", "south", "west", "north")
+
+# 役満の形: (刻子にする牌の候補, 刻子の数, 残りの面子に使う順子の先頭, 雀頭の候補)。34形式の牌番号
+GREEN_TILES = [19, 20, 21, 23, 25, 32]
+YAKUMAN_PATTERNS = {
+    "daisangen": ([31, 32, 33], 3, None, range(34)),
+    "daisuushii": ([27, 28, 29, 30], 4, None, range(27, 34)),
+    "tsuuiisou": (list(range(27, 34)), 4, None, range(27, 34)),
+    "chinroutou": ([0, 8, 9, 17, 18, 26], 4, None, [0, 8, 9, 17, 18, 26]),
+    "ryuuiisou": (GREEN_TILES, 3, 19, GREEN_TILES),
+}
+KOKUSHI_TILES = [0, 8, 9, 17, 18, 26, 27, 28, 29, 30, 31, 32, 33]
+
+
+def to_tile_input(tiles_34: list[int]) -> dict:
+    """34形式の牌のリストを TileInput の形 ({"man": "123", ...}) に変換"""
+    parts = {suit: "" for suit in SUITS}
+    for tile_34 in sorted(tiles_34):
+        parts[SUITS[tile_34 // 9]] += str(tile_34 % 9 + 1)
+    return {suit: text for suit, text in parts.items() if text}
+
+
+class HandBuilder:
+    """同じ牌を5枚以上使わないように面子を積み上げる"""
+
+    def __init__(self, rng: random.Random) -> None:
+        self.rng = rng
+        self.counts = [0] * 34
+        self.closed: list[list[int]] = []  # 門前の面子・雀頭
+        self.melds: list[dict] = []
+
+    def fits(self, tiles: list[int]) -> bool:
+        return all(self.counts[t] + tiles.count(t) <= 4 for t in set(tiles))
+
+    def add(self, tiles: list[int], meld_type: str = "", opened: bool = True) -> bool:
+        if not self.fits(tiles):
+            return False
+        for tile_34 in tiles:
+            self.counts[tile_34] += 1
+        if meld_type:
+            self.melds.append({"type": meld_type, "tiles": to_tile_input(tiles), "opened": opened})
+        else:
+            self.closed.append(tiles)
+        return True
+
+    def random_set(self) -> list[int]:
+        if self.rng.random() < 0.6:
+            start = self.rng.randrange(3) * 9 + self.rng.randrange(7)
+            return [start, start + 1, start + 2]
+        return [self.rng.randrange(34)] * 3
+
+    def add_random_sets(self, count: int, meld_probability: float = 0.0) -> None:
+        while count > 0:
+            tiles = self.random_set()
+            meld_type = ""
+            if self.rng.random() < meld_probability:
+                meld_type = "pon" if tiles[0] == tiles[1] else "chi"
+            if self.add(tiles, meld_type):
+                count -= 1
+
+    def add_pair(self, candidates: list[int] = range(34)) -> None:
+        while not self.add([self.rng.choice(candidates)] * 2):
+            pass
+
+    def request(self, **flags) -> dict:
+        # 和了牌は門前部分から選ぶ (副露した牌では和了できない)
+        win_tile = self.rng.choice(self.rng.choice(self.closed))
+        all_tiles = [t for t_34, count in enumerate(self.counts) for t in [t_34] * count]
+        return {
+            "hand": to_tile_input(all_tiles),
+            "win_tile": to_tile_input([win_tile]),
+            "melds": self.melds,
+            "dora_indicators": to_tile_input([self.rng.randrange(34)]),
+            "player_wind": self.rng.choice(WINDS),
+            "round_wind": self.rng.choice(WINDS[:2]),
+            **flags,
+        }
+
+
+def generate_hand(category: str, rng: random.Random) -> dict:
+    """カテゴリに応じた和了形を1つ生成 (役の有無は build_hand_corpus で確認する)"""
+    builder = HandBuilder(rng)
+    is_tsumo = rng.random() < 0.4
+
+    if category == "closed":
+        builder.add_random_sets(4)
+        builder.add_pair()
+        return builder.request(is_tsumo=is_tsumo, is_riichi=rng.random() < 0.6)
+
+    if category == "open":
+        builder.add_random_sets(1)
+        builder.add_random_sets(3, meld_probability=0.7)
+        builder.add_pair()
+        return builder.request(is_tsumo=is_tsumo)
+
+    if category == "kan":
+        kans = rng.randint(2, 4)
+        while kans > 0:
+            tile_34 = rng.randrange(34)
+            concealed = rng.random() < 0.5
+            if builder.add([tile_34] * 4, "ankan" if concealed else "kan", opened=not concealed):
+                kans -= 1
+        builder.add_random_sets(4 - len(builder.melds), meld_probability=0.3)
+        builder.add_pair()
+        return builder.request(is_tsumo=is_tsumo, is_rinshan=is_tsumo and rng.random() < 0.3)
+
+    if category == "chiitoitsu":
+        for tile_34 in rng.sample(range(34), 7):
+            builder.add([tile_34] * 2)
+        return builder.request(is_tsumo=is_tsumo, is_riichi=rng.random() < 0.6)
+
+    if category == "yakuman":
+        name = rng.choice(sorted(YAKUMAN_PATTERNS) + ["kokushi", "suuankou"])
+        if name == "kokushi":
+            builder.add(KOKUSHI_TILES)
+            builder.add([rng.choice(KOKUSHI_TILES)])
+            return builder.request(is_tsumo=is_tsumo)
+        if name == "suuankou":
+            for tile_34 in rng.sample(range(34), 4):
+                builder.add([tile_34] * 3)
+            builder.add_pair()
+            return builder.request(is_tsumo=True)
+
+        triplets, triplet_count, sequence_start, pair_candidates = YAKUMAN_PATTERNS[name]
+        for tile_34 in rng.sample(triplets, triplet_count):
+            builder.add([tile_34] * 3, "pon" if rng.random() < 0.3 else "")
+        if triplet_count < 4:
+            if sequence_start is None:
+                builder.add_random_sets(1)
+            else:
+                builder.add([sequence_start, sequence_start + 1, sequence_start + 2])
+        builder.add_pair(list(pair_candidates))
+        return builder.request(is_tsumo=is_tsumo)
+
+    raise ValueError(f"unknown category: {category}")
+
+
+def build_hand_corpus(per_category: int = 50, seed: int = 0, max_attempts: int = 200) -> list[dict]:
+    """各カテゴリ per_category 件の、役が付く和了形と期待値のリスト"""
+    from main import CalculateRequest, score_hand
+
+    corpus = []
+    for category_index, category in enumerate(CATEGORIES):
+        rng = random.Random(seed * len(CATEGORIES) + category_index)
+        accepted = 0
+        for _ in range(per_category * max_attempts):
+            if accepted == per_category:
+                break
+            request = generate_hand(category, rng)
+            score = score_hand(CalculateRequest.model_validate(request))
+            if score.error:
+                continue
+            if category == "yakuman" and score.han < 13:
+                continue
+            corpus.append({
+                "category": category,
+                "request": request,
+                "expected": {"han": score.han, "fu": score.fu, "cost": score.cost},
+            })
+            accepted += 1
+        if accepted < per_category:
+            raise RuntimeError(f"could not generate {per_category} {category} hands")
+    return corpus
+
+
+def vision_responses(hand_corpus: list[dict], seed: int = 0) -> list[str]:
+    """手牌から Vision API の応答テキストを作る (JSON 配列 / 信頼度付き / 文章の3形式)"""
+    rng = random.Random(seed)
+    responses = []
+    for entry in hand_corpus:
+        tile_ids = [
+            f"{digit}{suit[0] if suit != 'honors' else 'z'}"
+            for suit, digits in entry["request"]["hand"].items()
+            for digit in digits
+        ]
+        style = rng.randrange(3)
+        if style == 0:
+            responses.append(json.dumps(tile_ids))
+        elif style == 1:
+            responses.append(json.dumps([
+                {"id": tile_id, "confidence": round(rng.uniform(0.6, 1.0), 2)} for tile_id in tile_ids
+            ]))
+        else:
+            responses.append(f"左から順に {' '.join(tile_ids)} です。")
+    return responses
+
+
+def score_events(count: int, seed: int = 0) -> list[dict]:
+    """apply_score_to_scores の引数 (持ち点は毎回 25000 点から)"""
+    rng = random.Random(seed)
+    events = []
+    for _ in range(count):
+        winner_index = rng.randrange(4)
+        is_tsumo = rng.random() < 0.4
+        events.append({
+            "scores": [25000] * 4,
+            "winner_index": winner_index,
+            "loser_index": None if is_tsumo else (winner_index + rng.randint(1, 3)) % 4,
+            "dealer_index": rng.randrange(4),
+            "cost": {"main": rng.choice([1000, 2000, 3900, 8000, 12000]),
+                     "additional": rng.choice([0, 500, 1000, 2000, 4000]) if is_tsumo else 0},
+            "is_tsumo": is_tsumo,
+            "honba": rng.randrange(4),
+            "riichi_sticks": rng.randrange(3),
+        })
+    return events
@@ -0,0 +1,107 @@
+"""負荷試験用の OpenAI 互換 Vision API の偽サーバー (ネットワーク不要)
+
+/v1/chat/completions に対して、固定シードで生成した手牌の認識結果を一定の遅延の後に返す。
+stream=true の場合は SSE で数文字ずつ返す。
+
+使い方 (backend ディレクトリで): python -m benchmarks.fake_vision_server [--port 8100] [--latency-ms 300]
+バックエンドは OPENAI_API_KEY=dummy VISION_BASE_URL=http://127.0.0.1:8100/v1 で起動する。
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.corpus import CATEGORIES, generate_hand, vision_responses
+
+STREAM_CHUNK_CHARS = 8
+
+
+def fake_responses(count: int, seed: int) -> list[str]:
+    """役の確認はせずに和了形から応答テキストを作る (main を読み込まずに済ませるため)"""
+    rng = random.Random(seed)
+    hands = [{"request": generate_hand(CATEGORIES[i % len(CATEGORIES)], rng)} for i in range(count)]
+    return vision_responses(hands, seed)
+
+
+def completion_body(content: str, model: str) -> dict:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+def chunk_body(content: str, model: str, finish_reason=None) -> str:
+    delta = {"content": content} if content else {}
+    return "data: " + json.dumps({
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }) + "\n\n"
+
+
+def create_app(
+    latency_ms: float = 300.0,
+    jitter_ms: float = 100.0,
+    error_rate: float = 0.0,
+    seed: int = 0,
+    responses: int = 200,
+) -> FastAPI:
+    app = FastAPI(title="Fake Vision API")
+    rng = random.Random(seed)
+    contents = itertools.cycle(fake_responses(responses, seed))
+    app.state.requests = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        app.state.requests += 1
+        await asyncio.sleep(max(0.0, latency_ms + rng.uniform(-jitter_ms, jitter_ms)) / 1000)
+        if rng.random() < error_rate:
+            return JSONResponse({"error": {"message": "fake overload", "type": "server_error"}}, status_code=500)
+
+        content = next(contents)
+        if not body.get("stream"):
+            return completion_body(content, model)
+
+        async def stream():
+            for i in range(0, len(content), STREAM_CHUNK_CHARS):
+                yield chunk_body(content[i:i + STREAM_CHUNK_CHARS], model)
+                await asyncio.sleep(0)
+            yield chunk_body("", model, finish_reason="stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency-ms", type=float, default=300.0)
+    parser.add_argument("--jitter-ms", type=float, default=100.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    app = create_app(args.latency_ms, args.jitter_ms, args.error_rate, args.seed)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
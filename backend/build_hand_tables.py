@@ -0,0 +1,78 @@
+"""手牌分解テーブルの生成スクリプト
+
+使い方: python build_hand_tables.py [--output data/hand_tables.bin]
+
+各色 (萬子/筒子/索子) の枚数ベクトル 5^9 通りと字牌 5^7 通りについて、
+「面子 m 個 (0-4) + 雀頭 h 個 (0-1) を完成させるのに足りない牌の最小枚数」を
+動的計画法でまとめて求め、hand_tables.HandTables が読める形式で書き出す。
+"""
+import argparse
+import time
+
+import numpy as np
+
+from hand_tables import DEFAULT_TABLES_PATH, MAX_MENTSU, write_tables
+
+# 実際の距離は最大 14 なので、到達不能な状態は 4bit に収まらない値で表す
+INF = 64
+MAX_DISTANCE = 15
+
+
+def build_distance_table(size: int, allow_sequences: bool) -> np.ndarray:
+    """枚数ベクトル (5進数のインデックス) ごとの距離表 shape=(5**size, 5, 2) を生成
+
+    左から1牌ずつ処理し、状態として「1つ前で始めた順子の数 a」「2つ前で始めた順子の数 b」
+    「使った面子数 m (作りかけの順子を含む)」「雀頭数 h」を持つ。
+    """
+    # cost[prefix, a, b, m, h]。順子を始められない位置では a の次元を 1 に潰してメモリを抑える
+    cost = np.full((1, 1, 1, MAX_MENTSU + 1, 2), INF, dtype=np.uint8)
+    cost[0, 0, 0, 0, 0] = 0
+
+    for position in range(size):
+        # 順子は 7 以降から始められない
+        can_start_sequence = allow_sequences and position <= size - 3
+        prefixes, a_size, b_size = cost.shape[:3]
+        next_a_size = 5 if can_start_sequence else 1
+        next_cost = np.full((5, prefixes, next_a_size, a_size, MAX_MENTSU + 1, 2), INF, dtype=np.uint8)
+
+        for a in range(a_size):
+            for b in range(min(b_size, 5 - a)):
+                for m in range(a + b, MAX_MENTSU + 1):
+                    for h in range(2):
+                        current = cost[:, a, b, m, h]
+                        if not (current < INF).any():
+                            continue
+                        for sequences in range(MAX_MENTSU - m + 1 if can_start_sequence else 1):
+                            for triplet in range(2):
+                                for pair in range(2 - h):
+                                    used = a + b + sequences + 3 * triplet + 2 * pair
+                                    mentsu = m + sequences + triplet
+                                    if used > 4 or mentsu > MAX_MENTSU:
+                                        continue
+                                    for count in range(5):
+                                        candidate = current + max(0, used - count)
+                                        target = next_cost[count, :, sequences, a, mentsu, h + pair]
+                                        np.minimum(target, candidate, out=target)
+
+        np.minimum(next_cost, INF, out=next_cost)
+        # 新しい牌の枚数を最上位の桁として prefix に追加する (little endian の5進数)
+        cost = next_cost.reshape(5 * prefixes, next_a_size, a_size, MAX_MENTSU + 1, 2)
+
+    # 末尾で作りかけの順子が残っていない状態のみ有効
+    return np.minimum(cost[:, 0, 0, :, :], MAX_DISTANCE)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=str(DEFAULT_TABLES_PATH))
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    suit_table = build_distance_table(9, allow_sequences=True)
+    honor_table = build_distance_table(7, allow_sequences=False)
+    write_tables(args.output, suit_table.reshape(-1), honor_table.reshape(-1))
+    print(f"wrote {args.output} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""/calculate/compact 用のコンパクトな手牌表現
+
+JSON の CalculateRequest と同じ内容を、MPSZ 表記の文字列またはバイナリで受け取る。
+pydantic を経由せず、34種の枚数ベクトルから直接 136 形式の牌番号を作る。
+
+MPSZ 表記: 門前の牌 "+" 和了牌 [ "/" 副露 ]... [ "#" ドラ表示牌 ] [ "@" 自風 場風 フラグ ]
+    例: "123m456p789s11z77z+7z"、"11z77z+7z/p789s/a1111m#5z@sert"
+    - 門前の牌には和了牌と副露の牌を含めない (JSON の hand はそれらを含めた全体)
+    - 副露は種類 (c=チー, p=ポン, k=明槓, a=暗槓) と牌
+    - 風は e/s/w/n、フラグは FLAG_LETTERS の文字 (省略時は東場の東家・フラグ無し)
+
+バイナリ (リトルエンディアン):
+    34 バイト  手牌の枚数 (JSON の hand と同じく和了牌・副露の牌を含む)
+    1 バイト   和了牌 (34形式)
+    2 バイト   下位9ビットが FLAGS の順の状況フラグ、9-10 ビットが自風、11-12 ビットが場風
+    1 バイト   ドラ表示牌の数 n、続けて n バイトのドラ表示牌 (34形式)
+    1 バイト   副露の数 m、続けて m 個の (種類 0-3 = MELD_TYPES の順, 先頭の牌) の2バイト
+"""
+import re
+from dataclasses import dataclass, field
+
+SUIT_LETTERS = "mpsz"
+SUIT_FIELDS = ("man", "pin", "sou", "honors")
+WINDS = ("east", "south", "west", "north")
+WIND_LETTERS = "eswn"
+FLAGS = (
+    "is_tsumo", "is_riichi", "is_ippatsu", "is_rinshan", "is_chankan",
+    "is_haitei", "is_daburu_riichi", "is_tenhou", "is_chiihou",
+)
+FLAG_LETTERS = "trikchdTC"
+MELD_TYPES = ("chi", "pon", "kan", "ankan")
+MELD_LETTERS = "cpka"
+MELD_SIZES = {"chi": 3, "pon": 3, "kan": 4, "ankan": 4}
+
+# "1m" -> 0 のような MPSZ 表記の1牌 -> 34形式
+MPSZ_TILE_34 = {
+    f"{number}{suit}": index * 9 + number - 1
+    for index, suit in enumerate(SUIT_LETTERS)
+    for number in range(1, 8 if suit == "z" else 10)
+}
+MPSZ_GROUP = re.compile(r"([0-9]+)([mpsz])")
+
+# 34形式 -> 136形式 (n 枚目の牌の番号)。枚数から変換するので入力の並び順に依存しない
+TILE_136 = tuple(tuple(range(tile_34 * 4, tile_34 * 4 + 4)) for tile_34 in range(34))
+
+
+class CompactFormatError(ValueError):
+    """コンパクト表現として不正な入力"""
+
+
+@dataclass
+class CompactHand:
+    """CalculateRequest と同じ内容を34形式で持つ (build_hand_config にそのまま渡せる)"""
+    hand_counts: list[int]
+    win_tile: int
+    melds: list[tuple[str, int]] = field(default_factory=list)  # (種類, 先頭の牌)
+    dora_counts: list[int] = field(default_factory=lambda: [0] * 34)
+    player_wind: str = "east"
+    round_wind: str = "east"
+    is_tsumo: bool = False
+    is_riichi: bool = False
+    is_ippatsu: bool = False
+    is_rinshan: bool = False
+    is_chankan: bool = False
+    is_haitei: bool = False
+    is_daburu_riichi: bool = False
+    is_tenhou: bool = False
+    is_chiihou: bool = False
+
+    def __post_init__(self) -> None:
+        if not 0 <= self.win_tile < 34:
+            raise CompactFormatError("invalid win tile")
+        if max(self.hand_counts) > 4 or max(self.dora_counts) > 4:
+            raise CompactFormatError("more than 4 copies of a tile")
+        for meld_type, first in self.melds:
+            if meld_type == "chi" and (first >= 27 or first % 9 > 6):
+                raise CompactFormatError("invalid chi")
+            if not 0 <= first < 34:
+                raise CompactFormatError("invalid meld tile")
+
+    @staticmethod
+    def meld_tiles_34(meld_type: str, first: int) -> list[int]:
+        if meld_type == "chi":
+            return [first, first + 1, first + 2]
+        return [first] * MELD_SIZES[meld_type]
+
+    @staticmethod
+    def counts_to_136(counts: list[int]) -> list[int]:
+        return [tile for tile_34, count in enumerate(counts) if count for tile in TILE_136[tile_34][:count]]
+
+    def tiles_136(self) -> list[int]:
+        return self.counts_to_136(self.hand_counts)
+
+    def win_tile_136(self) -> int:
+        # JSON でも和了牌は1枚目の番号になる
+        return TILE_136[self.win_tile][0]
+
+    def meld_counts(self, meld_type: str, first: int) -> list[int]:
+        counts = [0] * 34
+        for tile_34 in self.meld_tiles_34(meld_type, first):
+            counts[tile_34] += 1
+        return counts
+
+    def flags(self) -> tuple[bool, ...]:
+        return tuple(getattr(self, name) for name in FLAGS)
+
+    def to_request_dict(self) -> dict:
+        """同じ内容の JSON 形式 (CalculateRequest) の辞書"""
+        return {
+            "hand": counts_to_tile_input(self.hand_counts),
+            "win_tile": counts_to_tile_input([int(i == self.win_tile) for i in range(34)]),
+            "melds": [
+                {
+                    "type": meld_type,
+                    "tiles": counts_to_tile_input(self.meld_counts(meld_type, first)),
+                    "opened": meld_type != "ankan",
+                }
+                for meld_type, first in self.melds
+            ],
+            "dora_indicators": counts_to_tile_input(self.dora_counts),
+            "player_wind": self.player_wind,
+            "round_wind": self.round_wind,
+            **{name: getattr(self, name) for name in FLAGS},
+        }
+
+    @classmethod
+    def from_request(cls, request) -> "CompactHand":
+        """CalculateRequest (または同じ属性を持つもの) から変換
+
+        JSON では槓の明暗は opened で決まる (type の kan / ankan は区別されない) のでそれに合わせる。
+        """
+        melds = []
+        for meld in request.melds:
+            counts = tile_input_counts(meld.tiles)
+            if meld.type in ("kan", "ankan"):
+                meld_type = "kan" if meld.opened else "ankan"
+            elif meld.type in ("chi", "pon") and meld.opened:
+                meld_type = meld.type
+            else:
+                raise CompactFormatError(f"unsupported meld: {meld.type}")
+            melds.append((meld_type, next(i for i, count in enumerate(counts) if count)))
+        win_counts = tile_input_counts(request.win_tile)
+        if not any(win_counts):
+            raise CompactFormatError("missing win tile")
+        return cls(
+            hand_counts=tile_input_counts(request.hand),
+            win_tile=next(i for i, count in enumerate(win_counts) if count),
+            melds=melds,
+            dora_counts=tile_input_counts(request.dora_indicators),
+            # JSON では未知の風は東として扱われる
+            player_wind=request.player_wind if request.player_wind in WINDS else "east",
+            round_wind=request.round_wind if request.round_wind in WINDS else "east",
+            **{name: getattr(request, name) for name in FLAGS},
+        )
+
+
+def tile_input_counts(tile_input) -> list[int]:
+    counts = [0] * 34
+    for offset, suit in zip((0, 9, 18, 27), SUIT_FIELDS):
+        for char in getattr(tile_input, suit):
+            if char not in "123456789" or offset + int(char) - 1 >= 34:
+                raise CompactFormatError(f"invalid tile: {char}")
+            counts[offset + int(char) - 1] += 1
+    return counts
+
+
+def counts_to_tile_input(counts: list[int]) -> dict:
+    tile_input = {}
+    for suit_index, suit in enumerate(SUIT_FIELDS):
+        chars = "".join(str(i + 1) * counts[suit_index * 9 + i] for i in range(7 if suit == "honors" else 9))
+        if chars:
+            tile_input[suit] = chars
+    return tile_input
+
+
+def parse_mpsz_tiles(text: str) -> list[int]:
+    """"123m11z" -> 34形式の牌のリスト"""
+    tiles = []
+    end = 0
+    for match in MPSZ_GROUP.finditer(text):
+        if match.start() != end:
+            break
+        digits, suit = match.groups()
+        for digit in digits:
+            tile_34 = MPSZ_TILE_34.get(digit + suit)
+            if tile_34 is None:
+                raise CompactFormatError(f"invalid tiles: {text}")
+            tiles.append(tile_34)
+        end = match.end()
+    if end != len(text):
+        raise CompactFormatError(f"invalid tiles: {text}")
+    return tiles
+
+
+def format_mpsz_tiles(counts: list[int]) -> str:
+    parts = []
+    for suit in range(4):
+        chars = "".join(str(i + 1) * counts[suit * 9 + i] for i in range(7 if suit == 3 else 9))
+        if chars:
+            parts.append(chars + SUIT_LETTERS[suit])
+    return "".join(parts)
+
+
+def parse_mpsz(text: str) -> CompactHand:
+    text = text.strip()
+    text, _, situation = text.partition("@")
+    text, _, dora = text.partition("#")
+    hand, *melds_text = text.split("/")
+    closed, plus, win = hand.partition("+")
+    if not plus:
+        raise CompactFormatError("missing win tile")
+
+    win_tiles = parse_mpsz_tiles(win)
+    if len(win_tiles) != 1:
+        raise CompactFormatError("win tile must be a single tile")
+    counts = [0] * 34
+    for tile_34 in parse_mpsz_tiles(closed) + win_tiles:
+        counts[tile_34] += 1
+
+    melds = []
+    for meld_text in melds_text:
+        meld_type = MELD_TYPES[MELD_LETTERS.index(meld_text[:1])] if meld_text[:1] in MELD_LETTERS else None
+        tiles = parse_mpsz_tiles(meld_text[1:]) if meld_type else []
+        if not tiles or len(tiles) != MELD_SIZES[meld_type] or tiles != CompactHand.meld_tiles_34(meld_type, min(tiles)):
+            raise CompactFormatError(f"invalid meld: {meld_text}")
+        melds.append((meld_type, min(tiles)))
+        for tile_34 in tiles:
+            counts[tile_34] += 1
+
+    dora_counts = [0] * 34
+    for tile_34 in parse_mpsz_tiles(dora) if dora else []:
+        dora_counts[tile_34] += 1
+
+    situation_fields = {}
+    if situation:
+        if len(situation) < 2 or situation[0] not in WIND_LETTERS or situation[1] not in WIND_LETTERS:
+            raise CompactFormatError("situation must start with player and round wind")
+        situation_fields["player_wind"] = WINDS[WIND_LETTERS.index(situation[0])]
+        situation_fields["round_wind"] = WINDS[WIND_LETTERS.index(situation[1])]
+        for letter in situation[2:]:
+            if letter not in FLAG_LETTERS:
+                raise CompactFormatError(f"unknown flag: {letter}")
+            situation_fields[FLAGS[FLAG_LETTERS.index(letter)]] = True
+
+    return CompactHand(
+        hand_counts=counts,
+        win_tile=win_tiles[0],
+        melds=melds,
+        dora_counts=dora_counts,
+        **situation_fields,
+    )
+
+
+def format_mpsz(hand: CompactHand) -> str:
+    closed = list(hand.hand_counts)
+    closed[hand.win_tile] -= 1
+    for meld_type, first in hand.melds:
+        for tile_34 in CompactHand.meld_tiles_34(meld_type, first):
+            closed[tile_34] -= 1
+    if min(closed) < 0:
+        raise CompactFormatError("hand does not contain the win tile and meld tiles")
+
+    text = format_mpsz_tiles(closed) + "+" + format_mpsz_tiles([int(i == hand.win_tile) for i in range(34)])
+    for meld_type, first in hand.melds:
+        text += "/" + MELD_LETTERS[MELD_TYPES.index(meld_type)] + format_mpsz_tiles(hand.meld_counts(meld_type, first))
+    if any(hand.dora_counts):
+        text += "#" + format_mpsz_tiles(hand.dora_counts)
+    flags = "".join(letter for letter, flag in zip(FLAG_LETTERS, hand.flags()) if flag)
+    if flags or (hand.player_wind, hand.round_wind) != ("east", "east"):
+        text += "@" + WIND_LETTERS[WINDS.index(hand.player_wind)] + WIND_LETTERS[WINDS.index(hand.round_wind)] + flags
+    return text
+
+
+def parse_packed(data: bytes) -> CompactHand:
+    if len(data) < 39:
+        raise CompactFormatError("packed hand too short")
+    hand_counts = list(data[:34])
+    win_tile = data[34]
+    bits = int.from_bytes(data[35:37], "little")
+    dora_end = 38 + data[37]
+    meld_end = dora_end + 1 + 2 * (data[dora_end] if dora_end < len(data) else 0)
+    if dora_end >= len(data) or meld_end != len(data):
+        raise CompactFormatError("packed hand length mismatch")
+
+    dora_counts = [0] * 34
+    for tile_34 in data[38:dora_end]:
+        if tile_34 >= 34:
+            raise CompactFormatError("invalid dora indicator")
+        dora_counts[tile_34] += 1
+    melds = []
+    for offset in range(dora_end + 1, meld_end, 2):
+        if data[offset] >= len(MELD_TYPES):
+            raise CompactFormatError("invalid meld type")
+        melds.append((MELD_TYPES[data[offset]], data[offset + 1]))
+
+    return CompactHand(
+        hand_counts=hand_counts,
+        win_tile=win_tile,
+        melds=melds,
+        dora_counts=dora_counts,
+        player_wind=WINDS[(bits >> 9) & 3],
+        round_wind=WINDS[(bits >> 11) & 3],
+        **{name: bool(bits >> i & 1) for i, name in enumerate(FLAGS)},
+    )
+
+
+def format_packed(hand: CompactHand) -> bytes:
+    bits = sum(1 << i for i, flag in enumerate(hand.flags()) if flag)
+    bits |= WINDS.index(hand.player_wind) << 9 | WINDS.index(hand.round_wind) << 11
+    dora = [tile_34 for tile_34, count in enumerate(hand.dora_counts) for _ in range(count)]
+    return b"".join([
+        bytes(hand.hand_counts),
+        bytes([hand.win_tile]),
+        bits.to_bytes(2, "little"),
+        bytes([len(dora), *dora]),
+        bytes([len(hand.melds), *(value for meld_type, first in hand.melds for value in (MELD_TYPES.index(meld_type), first))]),
+    ])
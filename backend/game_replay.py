@@ -0,0 +1,260 @@
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Annotated, AsyncIterator, Literal, Optional, Union
+
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, model_validator
+
+from score_engine import apply_score_to_scores
+
+INITIAL_SCORE = 25000
+
+# 和了の点数 (/calculate の cost と同じキー。total は反映には使わない)
+WinCost = dict[Literal["main", "additional", "total"], Annotated[int, Field(ge=0)]]
+
+
+class StartEvent(BaseModel):
+    """対局開始 (省略時は 25000 点・半荘戦)"""
+    type: Literal["start"]
+    scores: list[int] = Field(default_factory=lambda: [INITIAL_SCORE] * 4, min_length=4, max_length=4)
+    game_mode: Literal["hanchan", "tonpu"] = "hanchan"
+    enable_30000_rule: bool = False
+
+
+class RonEvent(BaseModel):
+    type: Literal["ron"]
+    winner_index: int = Field(ge=0, le=3)
+    loser_index: int = Field(ge=0, le=3)
+    cost: WinCost
+
+    @model_validator(mode="after")
+    def check_loser_is_not_winner(self) -> "RonEvent":
+        # 自分からのロンは点数が相殺されて記録上は何も起きないので、不正な行として扱う
+        if self.winner_index == self.loser_index:
+            raise ValueError("loser_index must differ from winner_index")
+        return self
+
+
+class TsumoEvent(BaseModel):
+    type: Literal["tsumo"]
+    winner_index: int = Field(ge=0, le=3)
+    cost: WinCost
+
+
+class DrawEvent(BaseModel):
+    type: Literal["draw"]
+    tenpai_players: list[int] = []
+
+
+class RiichiEvent(BaseModel):
+    type: Literal["riichi"]
+    player_index: int = Field(ge=0, le=3)
+
+
+GameEvent = Annotated[Union[StartEvent, RonEvent, TsumoEvent, DrawEvent, RiichiEvent], Field(discriminator="type")]
+game_event_adapter = TypeAdapter(GameEvent)
+
+
+class GameReplayError(ValueError):
+    """ログの行が不正、または終局後のイベント"""
+
+
+@dataclass
+class GameState:
+    """対局の進行状態 (フロントエンドの gameStore と同じ規則で局を進める)"""
+    scores: list[int] = field(default_factory=lambda: [INITIAL_SCORE] * 4)
+    round: int = 1
+    honba: int = 0
+    riichi_sticks: int = 0
+    round_wind: str = "east"
+    dealer_index: int = 0
+    game_mode: str = "hanchan"
+    enable_30000_rule: bool = False
+    ended: bool = False
+    end_reason: Optional[str] = None
+    # 現在の局でリーチ宣言済みのプレイヤー
+    riichi_players: list[int] = field(default_factory=list)
+
+    def round_info(self) -> dict:
+        return {
+            "round": self.round,
+            "honba": self.honba,
+            "riichi_sticks": self.riichi_sticks,
+            "round_wind": self.round_wind,
+            "dealer_index": self.dealer_index,
+        }
+
+    def standings(self) -> list[int]:
+        """順位順のプレイヤーインデックス (同点は席順)"""
+        return sorted(range(4), key=lambda i: (-self.scores[i], i))
+
+    def apply(self, event) -> dict:
+        """イベントを1件適用し、点数移動を返す"""
+        if isinstance(event, StartEvent):
+            self.scores = list(event.scores)
+            self.game_mode = event.game_mode
+            self.enable_30000_rule = event.enable_30000_rule
+            return {"diff": [0, 0, 0, 0]}
+
+        if self.ended:
+            raise GameReplayError("game already ended")
+
+        if isinstance(event, RiichiEvent):
+            return self.declare_riichi(event.player_index)
+        if isinstance(event, DrawEvent):
+            return self.apply_draw(event.tenpai_players)
+        return self.apply_win(event)
+
+    def apply_win(self, event: Union[RonEvent, TsumoEvent]) -> dict:
+        is_tsumo = isinstance(event, TsumoEvent)
+        result = apply_score_to_scores(
+            scores=self.scores,
+            winner_index=event.winner_index,
+            dealer_index=self.dealer_index,
+            cost=event.cost,
+            is_tsumo=is_tsumo,
+            honba=self.honba,
+            riichi_sticks=self.riichi_sticks,
+            loser_index=None if is_tsumo else event.loser_index,
+        )
+        self.scores = result["scores"]
+        self.riichi_sticks = 0
+        self.advance_round(dealer_kept=event.winner_index == self.dealer_index, is_draw=False)
+        return {"diff": result["diff"]}
+
+    def apply_draw(self, tenpai_players: list[int]) -> dict:
+        tenpai = sorted(set(tenpai_players))
+        if any(i < 0 or i > 3 for i in tenpai):
+            raise GameReplayError("tenpai_players must be between 0 and 3")
+
+        # ノーテン罰符 (場に 3000 点)
+        diff = [0, 0, 0, 0]
+        if 0 < len(tenpai) < 4:
+            for i in range(4):
+                diff[i] = 3000 // len(tenpai) if i in tenpai else -(3000 // (4 - len(tenpai)))
+        self.scores = [score + delta for score, delta in zip(self.scores, diff)]
+        self.advance_round(dealer_kept=self.dealer_index in tenpai, is_draw=True)
+        return {"diff": diff}
+
+    def declare_riichi(self, player_index: int) -> dict:
+        # 同じ局で2回目の宣言、または持ち点 1000 点未満の宣言は無視する
+        if player_index in self.riichi_players or self.scores[player_index] < 1000:
+            return {"diff": [0, 0, 0, 0], "rejected": True}
+
+        self.scores[player_index] -= 1000
+        self.riichi_sticks += 1
+        self.riichi_players.append(player_index)
+        diff = [0, 0, 0, 0]
+        diff[player_index] = -1000
+        return {"diff": diff}
+
+    def end(self, reason: str) -> None:
+        self.ended = True
+        self.end_reason = reason
+
+    def advance_round(self, dealer_kept: bool, is_draw: bool) -> None:
+        """和了/流局後の終局判定と局の進行 (advanceRound / advanceRoundAfterDraw と同じ)"""
+        self.riichi_players = []
+        top_score = max(self.scores)
+        dealer_score = self.scores[self.dealer_index]
+        is_east4 = self.round_wind == "east" and self.round >= 4
+        is_south4 = self.round_wind == "south" and self.round >= 8
+        suffix = "流局" if is_draw else ""
+        stay = "テンパイやめ" if is_draw else "アガリやめ"
+
+        if any(score < 0 for score in self.scores):
+            return self.end("トビ終了")
+
+        if self.game_mode == "tonpu" and is_east4:
+            if not dealer_kept:
+                # 30000点ルールで30000点未満なら南場へ延長
+                if not (self.enable_30000_rule and top_score < 30000):
+                    if not is_draw:
+                        self.honba = 0
+                    return self.end(f"東4局{suffix} 30000点終了条件" if self.enable_30000_rule else f"東4局{suffix}終了")
+            elif self.enable_30000_rule and dealer_score >= 30000 and dealer_score >= top_score:
+                return self.end(f"東4局 親{stay}")
+
+        if self.game_mode == "hanchan" and is_south4:
+            if not dealer_kept:
+                if not is_draw:
+                    self.honba = 0
+                return self.end(f"南4局{suffix}終了")
+            if dealer_score >= top_score:
+                return self.end(f"南4局 親{stay}")
+
+        if dealer_kept:
+            self.honba += 1
+            return
+
+        # 親流れ (流局時は本場を積む)
+        self.honba = self.honba + 1 if is_draw else 0
+        self.dealer_index = (self.dealer_index + 1) % 4
+        self.round += 1
+        if self.round > 4 and self.round_wind == "east":
+            self.round_wind = "south"
+
+    def snapshot(self) -> dict:
+        return asdict(self)
+
+
+def parse_game_event(line: bytes | str):
+    try:
+        return game_event_adapter.validate_json(line)
+    except ValidationError as e:
+        raise GameReplayError(e.errors(include_url=False)[0]["msg"]) from e
+
+
+async def iter_ndjson_lines(chunks: AsyncIterator[bytes], max_line_bytes: int) -> AsyncIterator[bytes]:
+    """バイト列のストリームを1行ずつに分割 (保持するのは未完成の1行分のみ)"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buffer) > max_line_bytes:
+            raise GameReplayError("line too long")
+    if buffer:
+        yield buffer
+
+
+async def replay_game_log(lines: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """NDJSON の対局ログを1イベントずつ畳み込み、各イベント後の持ち点を NDJSON で返す
+
+    不正な行や終局後のイベントがあればエラー行を出して打ち切る。最後に summary 行を返す。
+    """
+    state = GameState()
+    events = 0
+    line_number = 0
+    try:
+        async for line in lines:
+            line_number += 1
+            if not line.strip():
+                continue
+            event = parse_game_event(line)
+            if isinstance(event, StartEvent) and events:
+                raise GameReplayError("start must be the first event")
+            result = state.apply(event)
+            events += 1
+            yield json.dumps({
+                "line": line_number,
+                "type": event.type,
+                **result,
+                "scores": state.scores,
+                "standings": state.standings(),
+                **state.round_info(),
+                "ended": state.ended,
+                "end_reason": state.end_reason,
+            }, ensure_ascii=False) + "\n"
+    except GameReplayError as e:
+        yield json.dumps({"line": line_number, "type": "error", "error": str(e)}, ensure_ascii=False) + "\n"
+
+    yield json.dumps({
+        "type": "summary",
+        "events": events,
+        "scores": state.scores,
+        "standings": state.standings(),
+        **state.round_info(),
+        "ended": state.ended,
+        "end_reason": state.end_reason,
+    }, ensure_ascii=False) + "\n"
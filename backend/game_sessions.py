@@ -0,0 +1,207 @@
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from game_replay import GameState, StartEvent
+
+SNAPSHOT_FORMAT_VERSION = 1
+
+
+@dataclass
+class GameSession:
+    """サーバー側で保持する1対局分の状態と、Undo 用の履歴 (イベント適用前の状態)"""
+    state: GameState
+    history: deque = field(default_factory=deque)
+    last_access: float = 0.0
+
+
+class GameSessionNotFound(KeyError):
+    """セッションが存在しない (期限切れで破棄された場合を含む)"""
+
+
+class GameSessionStore:
+    """対局セッションのインメモリストア
+
+    一定時間アクセスの無いセッションは破棄し、save_snapshot でファイルに書き出した
+    内容を次回起動時に読み込む。時刻は壁時計 (time.time) を使い、再起動をまたいでも
+    期限が引き継がれるようにしている。
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        max_sessions: int,
+        history_limit: int = 200,
+        snapshot_path: Optional[str] = None,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.history_limit = history_limit
+        self.snapshot_path = snapshot_path
+        self._clock = clock
+        self._sessions: OrderedDict[str, GameSession] = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.evictions = 0
+        self.expirations = 0
+
+    def create(self, start: StartEvent) -> tuple[str, GameState]:
+        state = GameState()
+        state.apply(start)
+        session_id = secrets.token_urlsafe(12)
+        with self._lock:
+            self._sessions[session_id] = GameSession(
+                state=state,
+                history=deque(maxlen=self.history_limit),
+                last_access=self._clock(),
+            )
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+            self._dirty = True
+        return session_id, state
+
+    def _get(self, session_id: str) -> GameSession:
+        """ロック取得済みの状態で呼ぶ"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise GameSessionNotFound(session_id)
+        now = self._clock()
+        if self.ttl_seconds > 0 and now - session.last_access > self.ttl_seconds:
+            del self._sessions[session_id]
+            self.expirations += 1
+            self._dirty = True
+            raise GameSessionNotFound(session_id)
+        session.last_access = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def get(self, session_id: str) -> GameState:
+        with self._lock:
+            return self._get(session_id).state
+
+    def apply(self, session_id: str, event) -> tuple[dict, GameState]:
+        """イベントを適用して点数移動と適用後の状態を返す (GameReplayError は呼び出し側で処理)"""
+        with self._lock:
+            session = self._get(session_id)
+            before = session.state.snapshot()
+            result = session.state.apply(event)
+            if not result.get("rejected"):
+                session.history.append(before)
+                self._dirty = True
+            return result, session.state
+
+    def undo(self, session_id: str) -> Optional[GameState]:
+        """直前のイベントを取り消す (履歴が無い場合は None)"""
+        with self._lock:
+            session = self._get(session_id)
+            if not session.history:
+                return None
+            session.state = GameState(**session.history.pop())
+            self._dirty = True
+            return session.state
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            self._dirty = True
+            return self._sessions.pop(session_id, None) is not None
+
+    def evict_expired(self) -> int:
+        if self.ttl_seconds <= 0:
+            return 0
+        now = self._clock()
+        with self._lock:
+            expired = [
+                session_id for session_id, session in self._sessions.items()
+                if now - session.last_access > self.ttl_seconds
+            ]
+            for session_id in expired:
+                del self._sessions[session_id]
+            self.expirations += len(expired)
+            self._dirty = self._dirty or bool(expired)
+        return len(expired)
+
+    def save_snapshot(self, force: bool = False) -> bool:
+        """全セッションを JSON で書き出す (変更が無ければ何もしない)"""
+        if not self.snapshot_path:
+            return False
+        with self._lock:
+            if not (self._dirty or force):
+                return False
+            data = {
+                "version": SNAPSHOT_FORMAT_VERSION,
+                "sessions": {
+                    session_id: {
+                        "state": session.state.snapshot(),
+                        "history": list(session.history),
+                        "last_access": session.last_access,
+                    }
+                    for session_id, session in self._sessions.items()
+                },
+            }
+            self._dirty = False
+
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        os.makedirs(directory, exist_ok=True)
+        # 同じパスに書く別のプロセスと一時ファイルを取り合わないよう pid を付ける
+        temporary_path = f"{self.snapshot_path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temporary_path, self.snapshot_path)
+        return True
+
+    def load_snapshot(self) -> int:
+        """スナップショットを読み込む (ファイルが無い・形式が違う場合は何もしない)
+
+        読めない・壊れている場合は .corrupt を付けて退避し、空の状態で始める。
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return 0
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != SNAPSHOT_FORMAT_VERSION:
+                return 0
+            # 最終アクセスの古い順に並べて LRU の順序を復元する
+            entries = sorted(data["sessions"].items(), key=lambda item: item[1]["last_access"])
+            sessions = [
+                (session_id, GameSession(
+                    state=GameState(**entry["state"]),
+                    history=deque(entry["history"], maxlen=self.history_limit),
+                    last_access=entry["last_access"],
+                ))
+                for session_id, entry in entries
+            ]
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            self._set_aside_snapshot(e)
+            return 0
+
+        with self._lock:
+            for session_id, session in sessions:
+                self._sessions[session_id] = session
+        self.evict_expired()
+        return len(self._sessions)
+
+    def _set_aside_snapshot(self, error: Exception) -> None:
+        corrupt_path = f"{self.snapshot_path}.corrupt"
+        print(f"game session snapshot {self.snapshot_path} is unreadable ({error!r}), moved to {corrupt_path}")
+        try:
+            os.replace(self.snapshot_path, corrupt_path)
+        except OSError as e:
+            print(f"could not move game session snapshot aside: {e}")
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,163 @@
+"""テンパイ形の和了率・点数期待値のモンテカルロ推定 (/calculate/ev)
+
+見えていない牌 (自分の手牌・捨て牌・他家の見えている牌・ドラ表示牌を除いた牌) を
+ランダムに並べて山とみなし、残りのツモ番を次のモデルで進める。
+  1巡 = 他家3人が1枚ずつ切る → 自分がツモる
+  他家の捨て牌は見えていない牌からランダムに出るものとし、和了牌が出ても deal_in_rate の確率でしか
+  切られない (それ以外は止められる)。リーチ後は他家が降りるので、ダマより低い値を既定にしている
+  各巡の最初に opponent_win_rate の確率で他家が和了し、その局は和了できずに終わる
+  和了牌でも、フリテン (自分の捨て牌に和了牌がある) のロンと役の無い和了はしない
+  リーチ時は最初の1巡の和了を一発とし、並びの末尾の牌を裏ドラ表示牌とする
+王牌 14 枚と他家の手牌は山から引かない。既定の率は大まかな目安で、流局時のテンパイ料・
+自分の放銃・供託は扱わない。
+
+1回分の山を行列の1行として NumPy でまとめて処理し、(和了牌, ツモか, 一発か, 裏ドラの枚数) の
+組み合わせごとの回数だけを返す。点数は組み合わせごとに main 側で HandCalculator を1回ずつ呼ぶ。
+シャードの乱数は (seed, シャード番号) から決まるので、ワーカー数や実行順によらず同じ結果になる。
+"""
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Sequence
+
+import numpy as np
+
+# 一度に並べる山の数 (メモリと速度の兼ね合い)
+CHUNK_SIZE = 4096
+# 1巡でめくる牌の枚数 (他家3人 + 自分)
+TILES_PER_TURN = 4
+# 他家3人の手牌 (見えていないが山からは引かれない牌)
+OPPONENT_HAND_TILES = 39
+# 王牌 (嶺上牌・ドラ表示牌を含む。山からは引かれない)
+DEAD_WALL_TILES = 14
+# 他家が和了牌を切る確率 (リーチ / ダマ) と、1巡ごとに他家が和了して局が終わる確率の既定値
+DEFAULT_DEAL_IN_RATE_RIICHI = 0.25
+DEFAULT_DEAL_IN_RATE_DAMA = 0.6
+DEFAULT_OPPONENT_WIN_RATE = 0.06
+
+# 表示牌 (34形式) → ドラ
+DORA_NEXT = np.array(
+    [start + (i + 1) % size for start, size in ((0, 9), (9, 9), (18, 9), (27, 4), (31, 3)) for i in range(size)],
+    dtype=np.int64,
+)
+
+# (和了牌, ツモか, 一発か, 裏ドラの枚数)
+Outcome = tuple[int, bool, bool, int]
+
+
+@dataclass(frozen=True)
+class EvSetup:
+    """シミュレーションの入力 (プロセスプールに渡すので tuple で持つ)"""
+    unseen: tuple[int, ...]  # 見えていない牌 (34形式、枚数分)
+    ron_tiles: tuple[int, ...]  # ロンで和了できる牌
+    tsumo_tiles: tuple[int, ...]  # ツモで和了できる牌
+    hand_counts: tuple[int, ...]  # 副露を含む手牌の34種の枚数 (裏ドラを数える用)
+    turns: int  # 自分のツモ回数
+    riichi: bool = False
+    ura_indicators: int = 0  # 裏ドラ表示牌の枚数
+    deal_in_rate: float = 1.0  # 他家が和了牌を切る確率
+    opponent_win_rate: float = 0.0  # 1巡ごとに他家が和了する確率
+
+
+@dataclass
+class EvShardResult:
+    """シャード1つ分の結果 (ura_examples は組み合わせごとの裏ドラ表示牌の例)"""
+    simulations: int
+    counts: dict[Outcome, int] = field(default_factory=dict)
+    ura_examples: dict[Outcome, tuple[int, ...]] = field(default_factory=dict)
+
+
+def max_turns(unseen_count: int, dora_indicators: int = 1) -> int:
+    """他家の手牌と王牌を残して山から引ける巡数
+
+    王牌のうちドラ表示牌 (見えている) は unseen_count に含まれないので、その分は差し引かない。
+    裏ドラ表示牌は王牌の中にあるので、ここで別に数える必要はない。
+    """
+    hidden_dead_wall = DEAD_WALL_TILES - dora_indicators
+    return max(0, (unseen_count - OPPONENT_HAND_TILES - hidden_dead_wall) // TILES_PER_TURN)
+
+
+def simulate(setup: EvSetup, seed: int, shard: int, simulations: int) -> EvShardResult:
+    """シャード1つ分 (simulations 回) の山を作って和了の組み合わせを数える"""
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(shard,)))
+    unseen = np.array(setup.unseen, dtype=np.int64)
+    draws = setup.turns * TILES_PER_TURN
+    is_tsumo_position = np.arange(draws) % TILES_PER_TURN == TILES_PER_TURN - 1
+    position_turn = np.arange(draws)[None, :] // TILES_PER_TURN
+    ron = np.zeros(34, dtype=bool)
+    ron[list(setup.ron_tiles)] = True
+    tsumo = np.zeros(34, dtype=bool)
+    tsumo[list(setup.tsumo_tiles)] = True
+    hand_counts = np.array(setup.hand_counts, dtype=np.int64)
+    ura_count = setup.ura_indicators if setup.riichi else 0
+
+    result = EvShardResult(simulations=simulations)
+    done = 0
+    while done < simulations:
+        n = min(CHUNK_SIZE, simulations - done)
+        done += n
+        walls = rng.permuted(np.tile(unseen, (n, 1)), axis=1)
+        drawn = walls[:, :draws]
+        dealt_in = rng.random((n, draws)) < setup.deal_in_rate
+        hits = np.where(is_tsumo_position, tsumo[drawn], ron[drawn] & dealt_in)
+        if setup.opponent_win_rate > 0:
+            # 他家が和了する巡 (その巡以降は和了できない)
+            ended_turn = rng.geometric(setup.opponent_win_rate, size=n) - 1
+            hits &= position_turn < ended_turn[:, None]
+        rows = np.flatnonzero(hits.any(axis=1))
+        if rows.size == 0:
+            continue
+        first = hits[rows].argmax(axis=1)
+        tiles = drawn[rows, first]
+        tsumo_flags = is_tsumo_position[first]
+        ippatsu = (first < TILES_PER_TURN) & setup.riichi
+        if ura_count:
+            ura = walls[rows, -ura_count:]
+            ura_dora = DORA_NEXT[ura]
+            ura_han = hand_counts[ura_dora].sum(axis=1) + (ura_dora == tiles[:, None]).sum(axis=1)
+        else:
+            ura = np.zeros((rows.size, 0), dtype=np.int64)
+            ura_han = np.zeros(rows.size, dtype=np.int64)
+
+        # 組み合わせを整数にまとめて数える (裏ドラは表示牌5枚 × 同じ牌4枚までなので 64 未満)
+        codes = ((tiles * 2 + tsumo_flags) * 2 + ippatsu) * 64 + ura_han
+        _, index, counts = np.unique(codes, return_index=True, return_counts=True)
+        for i, count in zip(index, counts):
+            key = (int(tiles[i]), bool(tsumo_flags[i]), bool(ippatsu[i]), int(ura_han[i]))
+            result.counts[key] = result.counts.get(key, 0) + int(count)
+            result.ura_examples.setdefault(key, tuple(int(tile) for tile in ura[i]))
+    return result
+
+
+def simulate_shards(
+    setup: EvSetup, seed: int, shards: Sequence[tuple[int, int]], deadline: float,
+) -> list[EvShardResult]:
+    """(シャード番号, 回数) を順に実行し、time.monotonic() の deadline を過ぎたら打ち切る (最初の1つは必ず実行)"""
+    results = []
+    for shard, simulations in shards:
+        if results and time.monotonic() >= deadline:
+            break
+        results.append(simulate(setup, seed, shard, simulations))
+    return results
+
+
+def merge_shards(results: Sequence[EvShardResult]) -> EvShardResult:
+    """シャードの結果を合算する (裏ドラ表示牌の例は番号の小さいシャードのものを使う)"""
+    merged = EvShardResult(simulations=0)
+    for result in results:
+        merged.simulations += result.simulations
+        for key, count in result.counts.items():
+            merged.counts[key] = merged.counts.get(key, 0) + count
+            merged.ura_examples.setdefault(key, result.ura_examples[key])
+    return merged
+
+
+def wilson_interval(successes: int, trials: int, z: float = 1.96) -> tuple[float, float]:
+    """二項分布の割合の信頼区間 (Wilson スコア区間、z=1.96 で 95%)"""
+    if trials == 0:
+        return 0.0, 1.0
+    p = successes / trials
+    denominator = 1 + z * z / trials
+    center = (p + z * z / (2 * trials)) / denominator
+    half = z * math.sqrt(p * (1 - p) / trials + z * z / (4 * trials * trials)) / denominator
+    return max(0.0, center - half), min(1.0, center + half)
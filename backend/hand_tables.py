@@ -0,0 +1,261 @@
+"""手牌分解の事前計算テーブル
+
+build_hand_tables.py が生成したバイナリファイルを mmap で読み込み、
+和了判定・向聴数・待ち牌の列挙を表引きで行う。ファイルは読み取り専用で
+マップするため、同じホスト上の uvicorn ワーカー間でページが共有される。
+
+テーブルの各エントリは「その色の牌だけで面子 m 個 + 雀頭 h 個を完成させるのに
+足りない牌の最小枚数」で、4bit ずつ詰めて格納している。
+"""
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Optional, Sequence
+
+TABLES_FORMAT_VERSION = 1
+TABLES_MAGIC = b"MJHT"
+HEADER = struct.Struct("<4sHHII")
+DEFAULT_TABLES_PATH = Path(__file__).resolve().parent / "data" / "hand_tables.bin"
+
+MAX_MENTSU = 4
+SUIT_SIZE = 9
+HONOR_SIZE = 7
+# 1エントリ = 面子数 5 通り × 雀頭 2 通り を 4bit ずつ → 5 バイト
+ENTRY_BYTES = MAX_MENTSU + 1
+
+TERMINAL_AND_HONOR_INDICES = (0, 8, 9, 17, 18, 26, 27, 28, 29, 30, 31, 32, 33)
+TERMINAL_AND_HONOR_SET = frozenset(TERMINAL_AND_HONOR_INDICES)
+# 色ごとの (開始インデックス, 牌の種類数)。萬子・筒子・索子・字牌の順
+SUIT_LAYOUT = ((0, SUIT_SIZE), (9, SUIT_SIZE), (18, SUIT_SIZE), (27, HONOR_SIZE))
+INF = 99
+
+
+def pack_distances(values) -> bytes:
+    """距離の配列 (エントリごとに [m0h0, m0h1, m1h0, ...]) を 4bit ずつ詰める"""
+    values = bytes(values)
+    return bytes(low | (high << 4) for low, high in zip(values[0::2], values[1::2]))
+
+
+def write_tables(path, suit_values, honor_values) -> None:
+    suit = pack_distances(suit_values)
+    honor = pack_distances(honor_values)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(HEADER.pack(TABLES_MAGIC, TABLES_FORMAT_VERSION, 0, len(suit), len(honor)))
+        f.write(suit)
+        f.write(honor)
+    os.replace(temporary_path, path)
+
+
+class HandTables:
+    """事前計算テーブルによる和了判定・向聴数計算"""
+
+    def __init__(self, suit_table, honor_table) -> None:
+        self._tables = (suit_table, suit_table, suit_table, honor_table)
+
+    @classmethod
+    def load(cls, path) -> "HandTables":
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, suit_length, honor_length = HEADER.unpack_from(mapped)
+        if magic != TABLES_MAGIC or version != TABLES_FORMAT_VERSION:
+            raise ValueError(f"unsupported hand table file: {path}")
+
+        view = memoryview(mapped)
+        suit = view[HEADER.size:HEADER.size + suit_length]
+        honor = view[HEADER.size + suit_length:HEADER.size + suit_length + honor_length]
+        if len(suit) != 5 ** SUIT_SIZE * ENTRY_BYTES or len(honor) != 5 ** HONOR_SIZE * ENTRY_BYTES:
+            raise ValueError(f"truncated hand table file: {path}")
+        return cls(suit, honor)
+
+    @staticmethod
+    def suit_keys(tiles_34: Sequence[int]) -> list[int]:
+        """34種の枚数から色ごとのテーブルインデックス (5進数) を求める"""
+        keys = []
+        for start, size in SUIT_LAYOUT:
+            key = 0
+            for count in reversed(tiles_34[start:start + size]):
+                key = key * 5 + count
+            keys.append(key)
+        return keys
+
+    def distance(self, suit: int, key: int, mentsu: int, pair: int) -> int:
+        packed = self._tables[suit][key * ENTRY_BYTES + mentsu]
+        return (packed >> 4) if pair else (packed & 0x0F)
+
+    def regular_distance(self, keys: Sequence[int], mentsu: int) -> int:
+        """面子 mentsu 個 + 雀頭を完成させるのに足りない最小枚数 (4色を min-plus で合成)"""
+        # without_pair[m] / with_pair[m]: ここまでの色で面子 m 個 (+ 雀頭) を作る最小コスト
+        row = self._row(0, keys[0], mentsu)
+        without_pair = [packed & 0x0F for packed in row]
+        with_pair = [packed >> 4 for packed in row]
+        for suit in (1, 2):
+            row = self._row(suit, keys[suit], mentsu)
+            next_without = [INF] * (mentsu + 1)
+            next_with = [INF] * (mentsu + 1)
+            for used in range(mentsu + 1):
+                base_without = without_pair[used]
+                base_with = with_pair[used]
+                for extra in range(mentsu + 1 - used):
+                    packed = row[extra]
+                    low = packed & 0x0F
+                    total = used + extra
+                    cost = base_without + low
+                    if cost < next_without[total]:
+                        next_without[total] = cost
+                    cost = base_without + (packed >> 4)
+                    if base_with + low < cost:
+                        cost = base_with + low
+                    if cost < next_with[total]:
+                        next_with[total] = cost
+            without_pair, with_pair = next_without, next_with
+
+        # 字牌は最後なので、面子数がちょうど mentsu になる組み合わせだけ見ればよい
+        row = self._row(3, keys[3], mentsu)
+        best = INF
+        for extra in range(mentsu + 1):
+            packed = row[extra]
+            cost = without_pair[mentsu - extra] + (packed >> 4)
+            if cost < best:
+                best = cost
+            cost = with_pair[mentsu - extra] + (packed & 0x0F)
+            if cost < best:
+                best = cost
+        return best
+
+    def _row(self, suit: int, key: int, mentsu: int):
+        offset = key * ENTRY_BYTES
+        return self._tables[suit][offset:offset + mentsu + 1]
+
+    def is_agari(self, tiles_34: Sequence[int], meld_count: int = 0) -> bool:
+        """門前部分の牌 (副露を除く) が和了形かどうか"""
+        if sum(tiles_34) != (MAX_MENTSU - meld_count) * 3 + 2:
+            return False
+        if self._is_regular_agari(tiles_34):
+            return True
+        return meld_count == 0 and (is_chiitoitsu(tiles_34) or is_kokushi(tiles_34))
+
+    def _suit_is_complete(self, suit: int, suit_tiles: Sequence[int]) -> Optional[bool]:
+        """1色が面子 + (雀頭) に分解できるか。枚数が 3n+1 の色は None"""
+        count = sum(suit_tiles)
+        remainder = count % 3
+        if remainder == 1:
+            return None
+        key = 0
+        for tile_count in reversed(suit_tiles):
+            key = key * 5 + tile_count
+        return self.distance(suit, key, count // 3, remainder == 2) == 0
+
+    def _is_regular_agari(self, tiles_34: Sequence[int]) -> bool:
+        pairs = 0
+        for suit, (start, size) in enumerate(SUIT_LAYOUT):
+            suit_tiles = tiles_34[start:start + size]
+            count = sum(suit_tiles)
+            if count % 3 == 1:
+                return False
+            if count % 3 == 2:
+                pairs += 1
+                if pairs > 1:
+                    return False
+        if pairs != 1:
+            return False
+        return all(
+            self._suit_is_complete(suit, tiles_34[start:start + size])
+            for suit, (start, size) in enumerate(SUIT_LAYOUT)
+        )
+
+    def shanten(self, tiles_34: Sequence[int]) -> int:
+        """向聴数 (和了形は -1)。通常手・七対子・国士無双の最小値"""
+        mentsu = min(MAX_MENTSU, sum(tiles_34) // 3)
+        regular = self.regular_distance(self.suit_keys(tiles_34), mentsu) - 1
+        return min(regular, chiitoitsu_shanten(tiles_34), kokushi_shanten(tiles_34))
+
+    def waits(self, tiles_34: Sequence[int], meld_count: int = 0, visible_34: Optional[Sequence[int]] = None) -> list[int]:
+        """門前部分 (3n+1 枚) の和了牌を34形式のインデックスで列挙
+
+        visible_34 (副露を含む自分の手牌など) で4枚見えている牌は除外する。
+        """
+        visible_34 = visible_34 if visible_34 is not None else tiles_34
+        # 和了牌を加えた色以外はそのままで完成していなければならないので、色ごとに判定を使い回す
+        complete = [
+            self._suit_is_complete(suit, tiles_34[start:start + size])
+            for suit, (start, size) in enumerate(SUIT_LAYOUT)
+        ]
+        waits = set()
+        for suit, (start, size) in enumerate(SUIT_LAYOUT):
+            others = complete[:suit] + complete[suit + 1:]
+            if not all(others):
+                continue
+            # 他の色で雀頭を使っているなら、この色は雀頭なしで完成する必要がある
+            other_pairs = sum(
+                sum(tiles_34[other_start:other_start + other_size]) % 3 == 2
+                for other, (other_start, other_size) in enumerate(SUIT_LAYOUT)
+                if other != suit
+            )
+            suit_tiles = list(tiles_34[start:start + size])
+            if (sum(suit_tiles) + 1) % 3 != (0 if other_pairs else 2):
+                continue
+            for i in range(size):
+                if visible_34[start + i] >= 4:
+                    continue
+                suit_tiles[i] += 1
+                if self._suit_is_complete(suit, suit_tiles):
+                    waits.add(start + i)
+                suit_tiles[i] -= 1
+
+        if meld_count == 0:
+            waits.update(
+                tile_34 for tile_34 in special_waits(tiles_34) if visible_34[tile_34] < 4
+            )
+        return sorted(waits)
+
+
+def special_waits(tiles_34: Sequence[int]) -> list[int]:
+    """七対子・国士無双の待ち牌 (門前13枚)"""
+    if sum(tiles_34) != 13:
+        return []
+    singles = [tile_34 for tile_34, count in enumerate(tiles_34) if count == 1]
+    if len(singles) == 1 and all(count in (0, 1, 2) for count in tiles_34):
+        return singles
+    if any(tiles_34[i] for i in range(34) if i not in TERMINAL_AND_HONOR_SET):
+        return []
+    missing = [i for i in TERMINAL_AND_HONOR_INDICES if not tiles_34[i]]
+    if not missing:
+        return list(TERMINAL_AND_HONOR_INDICES)
+    if len(missing) == 1:
+        return missing
+    return []
+
+
+def is_chiitoitsu(tiles_34: Sequence[int]) -> bool:
+    return all(count in (0, 2) for count in tiles_34) and sum(tiles_34) == 14
+
+
+def is_kokushi(tiles_34: Sequence[int]) -> bool:
+    return all(tiles_34[i] for i in TERMINAL_AND_HONOR_INDICES) and sum(
+        tiles_34[i] for i in TERMINAL_AND_HONOR_INDICES
+    ) == sum(tiles_34) == 14
+
+
+def chiitoitsu_shanten(tiles_34: Sequence[int]) -> int:
+    kinds = len(tiles_34) - tiles_34.count(0)
+    pairs = kinds - tiles_34.count(1)
+    if pairs == 7:
+        return -1
+    return 6 - pairs + (7 - kinds if kinds < 7 else 0)
+
+
+def kokushi_shanten(tiles_34: Sequence[int]) -> int:
+    terminals = sum(1 for i in TERMINAL_AND_HONOR_INDICES if tiles_34[i])
+    has_pair = any(tiles_34[i] >= 2 for i in TERMINAL_AND_HONOR_INDICES)
+    return 13 - terminals - has_pair
+
+
+def load_hand_tables(path=None) -> Optional[HandTables]:
+    """テーブルを読み込む (ファイルが無い場合は None)"""
+    path = path or os.getenv("HAND_TABLES_PATH") or DEFAULT_TABLES_PATH
+    if not os.path.exists(path):
+        return None
+    return HandTables.load(path)
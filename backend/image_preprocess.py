@@ -0,0 +1,104 @@
+import hashlib
+import io
+from dataclasses import dataclass
+from typing import Optional
+
+OUTPUT_CONTENT_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+
+class ImageTooLarge(ValueError):
+    """アップロードがサイズ上限を超えた"""
+
+
+class InvalidImage(ValueError):
+    """画像としてデコードできない"""
+
+
+@dataclass
+class PreprocessedImage:
+    """Vision API 送信用に縮小・再エンコードした画像"""
+    data: bytes
+    content_type: str
+    width: int
+    height: int
+    original_bytes: int
+    dhash: int
+    thumbnail: bytes  # 認識結果キャッシュで牌単位の違いを確かめるためのグレースケール縮小画像
+    digest: bytes  # 縮小・再エンコード後の画像の内容のハッシュ
+    local_tiles: Optional[tuple[str, ...]] = None  # ローカル認識の牌の並び (main で設定し、キャッシュの照合に使う)
+
+    @property
+    def processed_bytes(self) -> int:
+        return len(self.data)
+
+
+async def read_upload_limited(upload, max_bytes: int, chunk_size: int = 64 * 1024) -> bytes:
+    """アップロードをチャンク単位で読み、上限を超えた時点で ImageTooLarge を送出"""
+    size: Optional[int] = getattr(upload, "size", None)
+    if size is not None and size > max_bytes:
+        raise ImageTooLarge()
+
+    chunks = []
+    total = 0
+    while True:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise ImageTooLarge()
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def dhash(image, hash_size: int = 8) -> int:
+    """差分ハッシュ (dHash)。ほぼ同じ画像はハミング距離の小さい値になる"""
+    from PIL import Image
+
+    pixels = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR).tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def gray_thumbnail(image, size: int = 64) -> bytes:
+    """縦横比を無視して size x size に縮小したグレースケール画素列 (区画ごとの比較用)"""
+    from PIL import Image
+
+    return image.convert("L").resize((size, size), Image.Resampling.BOX).tobytes()
+
+
+def preprocess_image(data: bytes, max_edge: int, output_format: str = "JPEG", quality: int = 85) -> PreprocessedImage:
+    """EXIF の向きを補正し、長辺 max_edge 以下に縮小して再エンコード"""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            # JPEG はデコード時点で縮小させる (1/2, 1/4, 1/8)
+            image.draft("RGB", (max_edge, max_edge))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+
+            output = io.BytesIO()
+            image.save(output, format=output_format, quality=quality, optimize=True)
+            width, height = image.size
+            image_hash = dhash(image)
+            thumbnail = gray_thumbnail(image)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e)) from e
+
+    return PreprocessedImage(
+        data=output.getvalue(),
+        content_type=OUTPUT_CONTENT_TYPES[output_format],
+        width=width,
+        height=height,
+        original_bytes=len(data),
+        dhash=image_hash,
+        thumbnail=thumbnail,
+        digest=hashlib.blake2b(output.getvalue(), digest_size=16).digest(),
+    )
@@ -1,35 +1,267 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.requests import ClientDisconnect
 from pydantic import BaseModel, Field
+from pydantic_core import to_json
 from typing import Optional
 from mahjong.hand_calculating.hand import HandCalculator
 from mahjong.hand_calculating.hand_config import HandConfig, OptionalRules
 from mahjong.tile import TilesConverter
+from mahjong.agari import Agari
+from mahjong.shanten import Shanten
 from mahjong.constants import EAST, SOUTH, WEST, NORTH
+from mahjong.meld import Meld
+import asyncio
 import base64
+import importlib
+import io
 import os
 import json
+import math
 import re
 import time
 import secrets
-from collections import defaultdict, deque
-from openai import OpenAI
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from importlib import metadata
+import metrics
+from metrics import NULL_TRACE, MetricsMiddleware, RequestTrace, start_trace
 from score_engine import apply_score_to_scores
-
-app = FastAPI(title="Mahjong Calculator API")
-
-# OpenAI client (環境変数 OPENAI_API_KEY から読み込み)
-openai_client = OpenAI() if os.getenv("OPENAI_API_KEY") else None
+from score_cache import DiskScoreCache, ScoreCache, make_fingerprint
+from scoring_executor import BoundedExecutor, ExecutorSaturated
+from image_preprocess import ImageTooLarge, InvalidImage, PreprocessedImage, preprocess_image, read_upload_limited
+from rate_limiter import RateLimiter, create_rate_limiter
+from singleflight import SingleFlight
+from recognition_cache import PerceptualCache
+from game_replay import GameEvent, GameReplayError, StartEvent, iter_ndjson_lines, replay_game_log
+from game_sessions import GameSessionNotFound, GameSessionStore
+from compact_hand import CompactFormatError, CompactHand, parse_mpsz, parse_packed
+from hand_ev import (
+    DEFAULT_DEAL_IN_RATE_DAMA, DEFAULT_DEAL_IN_RATE_RIICHI, DEFAULT_OPPONENT_WIN_RATE,
+    EvSetup, EvShardResult, max_turns, merge_shards, simulate, simulate_shards, wilson_interval,
+)
+from hand_tables import HandTables, load_hand_tables
+from tile_classifier import TileClassifier, load_tile_classifier, min_confidence
+from tile_tokenizer import TILE_ID_TO_NAME, TILE_NAME_TO_ID, TileTokenizer, tokenize_tiles
+from vision_client import VisionClient, build_vision_messages, create_vision_backend
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global vision_client
+    # serve.py で fork 前に済ませていない場合は、リクエストを受けながら別スレッドでウォームアップする
+    warmup_task = None if warmup_state["ready"] else asyncio.create_task(asyncio.to_thread(warm_up))
+    # fork したワーカーではディスクキャッシュを開き直す (最初のリクエストで待たせないよう先に開く)
+    if score_disk_cache is not None:
+        await asyncio.to_thread(score_disk_cache.open)
+    maintenance_task = None
+    if GAME_SESSIONS_ENABLED:
+        game_sessions.load_snapshot()
+        maintenance_task = asyncio.create_task(maintain_game_sessions())
+    yield
+    if maintenance_task is not None:
+        maintenance_task.cancel()
+        await asyncio.to_thread(game_sessions.save_snapshot)
+    if warmup_task is not None:
+        await warmup_task
+    if vision_client is not None:
+        await vision_client.aclose()
+        vision_client = None
+    scoring_executor.shutdown()
+    reset_batch_executor()
+
+
+async def maintain_game_sessions() -> None:
+    """期限切れセッションの破棄とスナップショットの書き出しを定期的に行う"""
+    while True:
+        await asyncio.sleep(GAME_SESSION_SNAPSHOT_INTERVAL_SECONDS)
+        try:
+            game_sessions.evict_expired()
+            await asyncio.to_thread(game_sessions.save_snapshot)
+        except Exception as e:
+            print(f"game session maintenance failed: {e}")
+
+
+app = FastAPI(title="Mahjong Calculator API", lifespan=lifespan)
+
+# Vision API クライアント (環境変数 OPENAI_API_KEY から読み込み、起動時に生成)
+VISION_BACKEND = os.getenv("VISION_BACKEND", "openai")
+VISION_MODEL = os.getenv("VISION_MODEL", "gpt-4o")
+VISION_BASE_URL = os.getenv("VISION_BASE_URL") or None
+VISION_MAX_CONCURRENCY = int(os.getenv("VISION_MAX_CONCURRENCY", "8"))
+VISION_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("VISION_ATTEMPT_TIMEOUT_SECONDS", "20"))
+VISION_DEADLINE_SECONDS = float(os.getenv("VISION_DEADLINE_SECONDS", "45"))
+VISION_MAX_RETRIES = int(os.getenv("VISION_MAX_RETRIES", "2"))
+# Vision API クライアントは最初に必要になった時点で生成する (openai の import が重いため)
+vision_client: Optional[VisionClient] = None
+vision_client_lock = threading.Lock()
 
 # Security configuration
 API_AUTH_TOKEN = os.getenv("API_AUTH_TOKEN", "").strip()
 RECOGNIZE_RATE_LIMIT_COUNT = int(os.getenv("RECOGNIZE_RATE_LIMIT_COUNT", "10"))
 RECOGNIZE_RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("RECOGNIZE_RATE_LIMIT_WINDOW_SECONDS", "60"))
+# /calculate 系のレート制限 (回数 0 で無効)
+CALCULATE_RATE_LIMIT_COUNT = int(os.getenv("CALCULATE_RATE_LIMIT_COUNT", "0"))
+CALCULATE_RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("CALCULATE_RATE_LIMIT_WINDOW_SECONDS", "60"))
+# "memory" はワーカーごと、"shared" は RATE_LIMIT_SHARED_PATH を全ワーカーで共有
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_SHARED_PATH = os.getenv("RATE_LIMIT_SHARED_PATH", "/tmp/mahjong-rate-limit.bin")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "65536"))
 MAX_IMAGE_SIZE_BYTES = int(os.getenv("MAX_IMAGE_SIZE_BYTES", str(5 * 1024 * 1024)))
 ALLOWED_IMAGE_CONTENT_TYPES = {"image/jpeg", "image/jpg", "image/png", "image/webp"}
 
-# In-memory, per-IP rate limiter for /recognize
-recognize_request_history: dict[str, deque[float]] = defaultdict(deque)
+# Vision API 送信前の画像縮小・再エンコード設定
+RECOGNIZE_IMAGE_MAX_EDGE = int(os.getenv("RECOGNIZE_IMAGE_MAX_EDGE", "1280"))
+RECOGNIZE_IMAGE_FORMAT = os.getenv("RECOGNIZE_IMAGE_FORMAT", "JPEG").upper()
+RECOGNIZE_IMAGE_QUALITY = int(os.getenv("RECOGNIZE_IMAGE_QUALITY", "85"))
+
+# 認識結果キャッシュ (知覚ハッシュのハミング距離で近似一致、0 で無効)
+RECOGNITION_CACHE_MAX_SIZE = int(os.getenv("RECOGNITION_CACHE_MAX_SIZE", "256"))
+RECOGNITION_CACHE_MAX_DISTANCE = int(os.getenv("RECOGNITION_CACHE_MAX_DISTANCE", "4"))
+RECOGNITION_CACHE_MAX_BLOCK_DIFF = float(os.getenv("RECOGNITION_CACHE_MAX_BLOCK_DIFF", "8"))
+recognition_cache = PerceptualCache(
+    max_size=RECOGNITION_CACHE_MAX_SIZE,
+    max_distance=RECOGNITION_CACHE_MAX_DISTANCE,
+    max_block_diff=RECOGNITION_CACHE_MAX_BLOCK_DIFF,
+)
+
+# ローカル牌認識 (CPU のみ、起動時にテンプレートを用意)。Vision API が使えない場合はこの結果を返す
+RECOGNIZE_LOCAL_ENABLED = os.getenv("RECOGNIZE_LOCAL_ENABLED", "true").lower() == "true"
+RECOGNIZE_LOCAL_MIN_CONFIDENCE = float(os.getenv("RECOGNIZE_LOCAL_MIN_CONFIDENCE", "0.8"))
+# 実際の牌から切り出したテンプレート画像 (空なら合成テンプレート)
+TILE_TEMPLATES_PATH = os.getenv("TILE_TEMPLATES_PATH", "")
+# Vision API が使える場合も、全牌の信頼度が閾値以上ならローカル認識の結果を返す
+# (合成テンプレートは実際の写真での精度を確かめていないため、既定ではテンプレート画像がある場合のみ)
+RECOGNIZE_LOCAL_FIRST = os.getenv("RECOGNIZE_LOCAL_FIRST", "true" if TILE_TEMPLATES_PATH else "false").lower() == "true"
+tile_classifier: Optional[TileClassifier] = None
+tile_classifier_lock = threading.Lock()
+
+# /recognize/batch の1リクエストあたりの画像数と、その中での Vision API への同時リクエスト数
+RECOGNIZE_BATCH_MAX_IMAGES = int(os.getenv("RECOGNIZE_BATCH_MAX_IMAGES", "8"))
+RECOGNIZE_BATCH_CONCURRENCY = max(1, int(os.getenv("RECOGNIZE_BATCH_CONCURRENCY", "4")))
+
+# /games/replay の1行 (1イベント) あたりの上限
+GAME_REPLAY_MAX_LINE_BYTES = int(os.getenv("GAME_REPLAY_MAX_LINE_BYTES", str(64 * 1024)))
+
+# 対局セッション (/games)。スナップショットのパスが空なら再起動で破棄される
+# セッションはプロセスのメモリにあるため、有効な間は serve.py を複数ワーカーで起動できない
+GAME_SESSIONS_ENABLED = os.getenv("GAME_SESSIONS_ENABLED", "true").lower() == "true"
+GAME_SESSION_TTL_SECONDS = float(os.getenv("GAME_SESSION_TTL_SECONDS", str(6 * 60 * 60)))
+GAME_SESSION_MAX_SESSIONS = int(os.getenv("GAME_SESSION_MAX_SESSIONS", "10000"))
+GAME_SESSION_HISTORY_LIMIT = int(os.getenv("GAME_SESSION_HISTORY_LIMIT", "200"))
+GAME_SESSION_SNAPSHOT_PATH = os.getenv("GAME_SESSION_SNAPSHOT_PATH", "")
+GAME_SESSION_SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("GAME_SESSION_SNAPSHOT_INTERVAL_SECONDS", "30"))
+game_sessions = GameSessionStore(
+    ttl_seconds=GAME_SESSION_TTL_SECONDS,
+    max_sessions=GAME_SESSION_MAX_SESSIONS,
+    history_limit=GAME_SESSION_HISTORY_LIMIT,
+    snapshot_path=GAME_SESSION_SNAPSHOT_PATH or None,
+)
+
+# /calculate 結果キャッシュ (0 で無効)
+SCORE_CACHE_MAX_SIZE = int(os.getenv("SCORE_CACHE_MAX_SIZE", "4096"))
+SCORE_CACHE_TTL_SECONDS = float(os.getenv("SCORE_CACHE_TTL_SECONDS", "3600"))
+score_cache = ScoreCache(max_size=SCORE_CACHE_MAX_SIZE, ttl_seconds=SCORE_CACHE_TTL_SECONDS)
+
+# 再起動後も残り、同じホストの全ワーカーで共有する計算結果キャッシュ (SQLite、パスが空なら無効)
+SCORE_CACHE_DISK_PATH = os.getenv("SCORE_CACHE_DISK_PATH", "")
+SCORE_CACHE_DISK_MAX_ENTRIES = int(os.getenv("SCORE_CACHE_DISK_MAX_ENTRIES", "200000"))
+# ScoreResult の形式や計算の設定 (build_hand_config) を変えたら上げる (保存済みの結果が破棄される)
+SCORE_CACHE_SCHEMA_VERSION = 1
+
+
+def score_cache_version() -> str:
+    """ディスクキャッシュの互換性を表す文字列 (mahjong ライブラリの更新でも変わる)"""
+    return f"{SCORE_CACHE_SCHEMA_VERSION}:mahjong-{metadata.version('mahjong')}"
+
+
+# 他のワーカーや warm_score_cache.py が書き込み中でも起動を長く待たせないよう、接続時の待ちは短くする
+SCORE_CACHE_DISK_CONNECT_TIMEOUT_SECONDS = 1.0
+score_disk_cache: Optional[DiskScoreCache] = (
+    DiskScoreCache(
+        SCORE_CACHE_DISK_PATH, SCORE_CACHE_DISK_MAX_ENTRIES, score_cache_version(),
+        connect_timeout=SCORE_CACHE_DISK_CONNECT_TIMEOUT_SECONDS,
+    )
+    if SCORE_CACHE_DISK_PATH else None
+)
+
+# 点数計算用のスレッドプール (イベントループをブロックしないため)
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "4"))
+SCORING_MAX_QUEUE = int(os.getenv("SCORING_MAX_QUEUE", "64"))
+SCORING_RETRY_AFTER_SECONDS = int(os.getenv("SCORING_RETRY_AFTER_SECONDS", "1"))
+scoring_executor = BoundedExecutor(max_workers=SCORING_WORKERS, max_queue=SCORING_MAX_QUEUE)
+
+# /calculate/batch のプロセスプール設定 (ワーカー数 0 でプロセス内計算、空なら CPU 数)
+CALCULATE_BATCH_WORKERS = int(os.getenv("CALCULATE_BATCH_WORKERS", "").strip() or os.cpu_count() or 1)
+CALCULATE_BATCH_CHUNK_SIZE = max(1, int(os.getenv("CALCULATE_BATCH_CHUNK_SIZE", "32")))
+CALCULATE_BATCH_MAX_HANDS = int(os.getenv("CALCULATE_BATCH_MAX_HANDS", "1000"))
+batch_executor: Optional[ProcessPoolExecutor] = None
+
+# /calculate/scenarios の1リクエストあたりのシナリオ数の上限
+CALCULATE_SCENARIOS_MAX = int(os.getenv("CALCULATE_SCENARIOS_MAX", "64"))
+
+# /calculate/ev のモンテカルロ (既定・上限の回数、時間の上限、1シャードの回数。プロセスプールは /calculate/batch と共有)
+CALCULATE_EV_SIMULATIONS = int(os.getenv("CALCULATE_EV_SIMULATIONS", "20000"))
+CALCULATE_EV_MAX_SIMULATIONS = int(os.getenv("CALCULATE_EV_MAX_SIMULATIONS", "200000"))
+CALCULATE_EV_TIME_BUDGET_SECONDS = float(os.getenv("CALCULATE_EV_TIME_BUDGET_SECONDS", "2"))
+CALCULATE_EV_SHARD_SIZE = max(1, int(os.getenv("CALCULATE_EV_SHARD_SIZE", "2000")))
+
+
+def reset_batch_executor() -> None:
+    global batch_executor
+    if batch_executor is not None:
+        batch_executor.shutdown(wait=False, cancel_futures=True)
+        batch_executor = None
+
+
+# 手牌分解の事前計算テーブル (build_hand_tables.py で生成、無ければ mahjong ライブラリで判定)
+hand_tables: Optional[HandTables] = load_hand_tables()
+
+
+# クライアント IP ごとのレート制限 (トークンバケット)
+recognize_rate_limiter = create_rate_limiter(
+    RATE_LIMIT_BACKEND, RECOGNIZE_RATE_LIMIT_COUNT, RECOGNIZE_RATE_LIMIT_WINDOW_SECONDS,
+    RATE_LIMIT_MAX_KEYS, RATE_LIMIT_SHARED_PATH,
+)
+calculate_rate_limiter = create_rate_limiter(
+    RATE_LIMIT_BACKEND, CALCULATE_RATE_LIMIT_COUNT, CALCULATE_RATE_LIMIT_WINDOW_SECONDS,
+    RATE_LIMIT_MAX_KEYS, RATE_LIMIT_SHARED_PATH,
+)
+
+# 同じ内容の同時リクエストは1回だけ計算・認識して結果を共有する
+calculate_flight = SingleFlight()
+recognize_flight = SingleFlight()
+
+# 計測 (/metrics)。METRICS_SAMPLE_RATE > 0 で一部のリクエストのステージ内訳を記録し、
+# 遅い順に METRICS_SLOW_REQUESTS_KEEP 件を /metrics/slow で返す
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "0"))
+METRICS_SLOW_REQUESTS_KEEP = int(os.getenv("METRICS_SLOW_REQUESTS_KEEP", "20"))
+METRICS_PROFILE = os.getenv("METRICS_PROFILE", "false").lower() == "true"
+metrics.configure_sampling(METRICS_SAMPLE_RATE, METRICS_SLOW_REQUESTS_KEEP, METRICS_PROFILE)
+metrics.registry.register(metrics.Gauge(
+    "mahjong_scoring_executor_in_flight", "Scoring jobs running or queued.",
+    callback=lambda: {(): scoring_executor.stats()["in_flight"]},
+))
+metrics.registry.register(metrics.Gauge(
+    "mahjong_vision_in_flight", "Vision API calls in flight.",
+    callback=lambda: {(): vision_client.stats()["in_flight"]} if vision_client else {},
+))
+RECOGNIZE_LOCAL = metrics.registry.register(metrics.Counter(
+    "mahjong_recognize_local_total", "Local tile classifier outcomes (accepted, escalated to the vision API, or offline).",
+    ("result",),
+))
+metrics.registry.register(metrics.Counter(
+    "mahjong_singleflight_requests_total", "Requests by whether they ran or joined an identical in-flight request.",
+    ("endpoint", "result"),
+    callback=lambda: {
+        (endpoint, result): value
+        for endpoint, flight in (("calculate", calculate_flight), ("recognize", recognize_flight))
+        for result, value in (("executed", flight.calls - flight.coalesced), ("coalesced", flight.coalesced))
+    },
+))
 
 cors_origins_env = os.getenv(
     "CORS_ALLOW_ORIGINS",
@@ -48,9 +280,20 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
 
 # 風の変換マップ
 WIND_MAP = {"east": EAST, "south": SOUTH, "west": WEST, "north": NORTH}
+MELD_TYPE_MAP = {"chi": Meld.CHI, "pon": Meld.PON, "kan": Meld.KAN, "ankan": Meld.KAN}
+
+# HandConfig に渡す状況フラグ
+HAND_CONFIG_FLAGS = (
+    "is_tsumo", "is_riichi", "is_ippatsu", "is_rinshan", "is_chankan",
+    "is_haitei", "is_daburu_riichi", "is_tenhou", "is_chiihou",
+)
+# ロン/ツモの片方でしか成立しない状況フラグ
+TSUMO_ONLY_FLAGS = ("is_rinshan", "is_haitei", "is_tenhou", "is_chiihou")
+RON_ONLY_FLAGS = ("is_chankan",)
 
 
 class TileInput(BaseModel):
@@ -97,6 +340,125 @@ class ScoreResult(BaseModel):
     error: Optional[str] = None
 
 
+class WaitsRequest(BaseModel):
+    """待ち牌分析リクエスト (和了牌を含まないテンパイ形)"""
+    hand: TileInput  # 手牌 (13枚 + 槓の枚数分、副露を含む)
+    melds: list[MeldInput] = []  # 副露
+    dora_indicators: TileInput = TileInput()  # ドラ表示牌
+    player_wind: str = "east"  # 自風 (east/south/west/north)
+    round_wind: str = "east"  # 場風
+    is_riichi: bool = False  # リーチ
+    is_ippatsu: bool = False  # 一発
+    is_rinshan: bool = False  # 嶺上開花 (ツモ時のみ適用)
+    is_chankan: bool = False  # 槍槓 (ロン時のみ適用)
+    is_haitei: bool = False  # 海底/河底 (ツモ時のみ適用)
+    is_daburu_riichi: bool = False  # ダブルリーチ
+    is_tenhou: bool = False  # 天和 (ツモ時のみ適用)
+    is_chiihou: bool = False  # 地和 (ツモ時のみ適用)
+
+
+class WaitResult(BaseModel):
+    """待ち牌ごとの点数"""
+    tile: str  # "1m", "7z" など
+    ron: ScoreResult
+    tsumo: ScoreResult
+
+
+class WaitsResponse(BaseModel):
+    """待ち牌分析結果"""
+    shanten: Optional[int] = None  # 0 = テンパイ
+    waits: list[WaitResult] = []
+    error: Optional[str] = None
+
+
+class CalculateBatchRequest(BaseModel):
+    """一括計算リクエスト"""
+    hands: list[CalculateRequest]
+
+
+class CalculateBatchResponse(BaseModel):
+    """一括計算結果 (hands と同じ順序)"""
+    results: list[ScoreResult]
+
+
+class ScenarioOverrides(BaseModel):
+    """シナリオごとに上書きする状況 (未指定の項目は元のリクエストの値を使う)"""
+    label: Optional[str] = None  # 結果に付ける名前 (省略時は上書きした項目から生成)
+    player_wind: Optional[str] = None
+    round_wind: Optional[str] = None
+    is_tsumo: Optional[bool] = None
+    is_riichi: Optional[bool] = None
+    is_ippatsu: Optional[bool] = None
+    is_rinshan: Optional[bool] = None
+    is_chankan: Optional[bool] = None
+    is_haitei: Optional[bool] = None
+    is_daburu_riichi: Optional[bool] = None
+    is_tenhou: Optional[bool] = None
+    is_chiihou: Optional[bool] = None
+
+
+class CalculateScenariosRequest(CalculateRequest):
+    """1つの手牌を複数の状況で計算するリクエスト"""
+    scenarios: list[ScenarioOverrides] = Field(min_length=1)
+
+
+class CalculateScenariosResponse(BaseModel):
+    """シナリオごとの計算結果 (各リストは scenarios と同じ順序)"""
+    labels: list[str]
+    han: list[int]
+    fu: list[int]
+    main: list[int]
+    additional: list[int]
+    total: list[int]
+    yaku: list[list[str]]
+    errors: list[Optional[str]]
+
+
+class EvRequest(BaseModel):
+    """和了率・点数期待値の推定リクエスト (和了牌を含まないテンパイ形)"""
+    hand: TileInput  # 手牌 (13枚 + 槓の枚数分、副露を含む)
+    melds: list[MeldInput] = []  # 副露
+    dora_indicators: TileInput = TileInput()  # ドラ表示牌
+    discards: TileInput = TileInput()  # 自分の捨て牌 (フリテンの判定にも使う)
+    visible: TileInput = TileInput()  # 他家の捨て牌・副露など、その他の見えている牌
+    player_wind: str = "east"  # 自風 (east/south/west/north)
+    round_wind: str = "east"  # 場風
+    is_riichi: bool = False  # リーチする (一発・裏ドラを含めて計算)
+    is_daburu_riichi: bool = False  # ダブルリーチ
+    turns_left: int = Field(default=12, ge=1, le=24)  # 自分の残りツモ回数
+    # 他家が和了牌を切る確率 (省略時はリーチ 0.25 / ダマ 0.6) と、1巡ごとに他家が和了する確率
+    deal_in_rate: Optional[float] = Field(default=None, ge=0, le=1)
+    opponent_win_rate: float = Field(default=DEFAULT_OPPONENT_WIN_RATE, ge=0, lt=1)
+    simulations: Optional[int] = Field(default=None, ge=1)  # 省略時は CALCULATE_EV_SIMULATIONS
+    time_budget_seconds: Optional[float] = Field(default=None, gt=0)  # 省略時・上限は CALCULATE_EV_TIME_BUDGET_SECONDS
+    seed: int = 0  # 同じ seed・回数なら同じ結果になる
+
+
+class EvBucket(BaseModel):
+    """和了点ごとの出現確率と 95% 信頼区間"""
+    points: int
+    probability: float
+    ci_low: float
+    ci_high: float
+
+
+class EvResponse(BaseModel):
+    """和了率・点数期待値の推定結果 (点数はロンなら放銃者から、ツモなら3人分の合計。本場・供託は含まない)"""
+    waits: list[str] = []
+    furiten: bool = False
+    turns: int = 0  # 山の残り枚数で制限した後の自分のツモ回数
+    simulations: int = 0  # 実際に行った回数
+    complete: bool = False  # 時間の上限までに要求した回数を終えたか
+    win_rate: float = 0.0
+    win_rate_ci: list[float] = []  # 95% 信頼区間 [下限, 上限]
+    tsumo_rate: float = 0.0
+    ron_rate: float = 0.0
+    expected_value: float = 0.0  # 1局あたりの和了点の期待値 (和了しなければ 0)
+    expected_value_ci: list[float] = []
+    distribution: list[EvBucket] = []
+    error: Optional[str] = None
+
+
 class ApplyScoreRequest(BaseModel):
     """点数適用リクエスト"""
     scores: list[int]  # 4人の現在点 [東, 南, 西, 北]
@@ -119,6 +481,69 @@ def tiles_to_136(tile_input: TileInput) -> list[int]:
     )
 
 
+def tile_input_counts(tile_input: TileInput) -> Optional[list[int]]:
+    """TileInputを34種の枚数ベクトルに変換 (不正な文字を含む場合は None)"""
+    counts = [0] * 34
+    for offset, chars in ((0, tile_input.man), (9, tile_input.pin), (18, tile_input.sou), (27, tile_input.honors)):
+        for char in chars:
+            if char not in "123456789" or offset + int(char) - 1 >= 34:
+                return None
+            counts[offset + int(char) - 1] += 1
+    return counts
+
+
+def calculate_fingerprint(request: CalculateRequest) -> Optional[str]:
+    """計算結果キャッシュ用の正規化キー (正規化できない入力は None でキャッシュ対象外)"""
+    hand_counts = tile_input_counts(request.hand)
+    win_counts = tile_input_counts(request.win_tile)
+    dora_counts = tile_input_counts(request.dora_indicators)
+    if hand_counts is None or win_counts is None or dora_counts is None or not any(win_counts):
+        return None
+
+    # 和了牌は変換後の先頭牌 (萬子→筒子→索子→字牌の順) が使われる
+    win_tile = next(
+        offset + int(chars[0]) - 1
+        for offset, chars in ((0, request.win_tile.man), (9, request.win_tile.pin),
+                              (18, request.win_tile.sou), (27, request.win_tile.honors))
+        if chars
+    )
+
+    melds = []
+    for meld in request.melds:
+        meld_counts = tile_input_counts(meld.tiles)
+        if meld_counts is None:
+            return None
+        meld_type = "c" if meld.type == "chi" else "k" if meld.type in ("kan", "ankan") else "p"
+        melds.append((meld_type, meld.opened, meld_counts))
+
+    return make_fingerprint(
+        hand_counts=hand_counts,
+        win_tile=win_tile,
+        melds=melds,
+        dora_counts=dora_counts,
+        player_wind=WIND_MAP.get(request.player_wind, EAST),
+        round_wind=WIND_MAP.get(request.round_wind, EAST),
+        flags=tuple(getattr(request, name) for name in HAND_CONFIG_FLAGS),
+    )
+
+
+def compact_fingerprint(hand: CompactHand) -> str:
+    """calculate_fingerprint と同じキー (JSON 形式と結果キャッシュを共有する)"""
+    return make_fingerprint(
+        hand_counts=hand.hand_counts,
+        win_tile=hand.win_tile,
+        melds=[
+            ("c" if meld_type == "chi" else "p" if meld_type == "pon" else "k",
+             meld_type != "ankan", hand.meld_counts(meld_type, first))
+            for meld_type, first in hand.melds
+        ],
+        dora_counts=hand.dora_counts,
+        player_wind=WIND_MAP[hand.player_wind],
+        round_wind=WIND_MAP[hand.round_wind],
+        flags=hand.flags(),
+    )
+
+
 def verify_api_auth(x_api_key: Optional[str]) -> None:
     """Validate API auth token when API_AUTH_TOKEN is configured."""
     if not API_AUTH_TOKEN:
@@ -127,17 +552,104 @@ def verify_api_auth(x_api_key: Optional[str]) -> None:
         raise HTTPException(status_code=401, detail="Unauthorized")
 
 
-def enforce_recognize_rate_limit(client_ip: str) -> None:
-    now = time.time()
-    request_times = recognize_request_history[client_ip]
+def enforce_rate_limit(limiter: RateLimiter, scope: str, request: Request) -> None:
+    """クライアント IP ごとのレート制限 (超過時は 429 + Retry-After)"""
+    client_ip = request.client.host if request.client else "unknown"
+    # shared バックエンドでは全制限が同じ表を使うため、キーに用途を含める
+    retry_after = limiter.acquire(f"{scope}:{client_ip}")
+    if retry_after > 0:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests",
+            headers={"Retry-After": str(max(1, math.ceil(min(retry_after, 86400))))},
+        )
 
-    while request_times and now - request_times[0] > RECOGNIZE_RATE_LIMIT_WINDOW_SECONDS:
-        request_times.popleft()
 
-    if len(request_times) >= RECOGNIZE_RATE_LIMIT_COUNT:
-        raise HTTPException(status_code=429, detail="Too many requests")
+def vision_configured() -> bool:
+    """Vision API を使うか (openai バックエンドは OPENAI_API_KEY が必要)"""
+    return VISION_BACKEND != "openai" or bool(os.getenv("OPENAI_API_KEY"))
 
-    request_times.append(now)
+
+def create_vision_client() -> VisionClient:
+    global vision_client
+    with vision_client_lock:
+        if vision_client is None:
+            vision_client = VisionClient(
+                create_vision_backend(VISION_BACKEND, VISION_MODEL, VISION_BASE_URL, VISION_MAX_CONCURRENCY),
+                max_concurrency=VISION_MAX_CONCURRENCY,
+                attempt_timeout_seconds=VISION_ATTEMPT_TIMEOUT_SECONDS,
+                deadline_seconds=VISION_DEADLINE_SECONDS,
+                max_retries=VISION_MAX_RETRIES,
+            )
+    return vision_client
+
+
+async def get_vision_client() -> VisionClient:
+    """初回だけイベントループを止めないよう別スレッドで生成する"""
+    if vision_client is not None:
+        return vision_client
+    return await asyncio.to_thread(create_vision_client)
+
+
+def get_tile_classifier() -> Optional[TileClassifier]:
+    """ローカル牌認識の分類器 (初回にテンプレートを用意する。無効なら None)"""
+    global tile_classifier
+    if tile_classifier is None and RECOGNIZE_LOCAL_ENABLED:
+        with tile_classifier_lock:
+            if tile_classifier is None:
+                tile_classifier = load_tile_classifier(TILE_TEMPLATES_PATH or None)
+    return tile_classifier
+
+
+# 点数計算のウォームアップに使う代表的な手牌 (MPSZ 形式)
+WARMUP_HANDS = [
+    "234m345p678s2234s+5s@eer",  # 門前・リーチ・平和
+    "5679m222999s555z+9m#1p@we",  # 役牌・暗刻
+    "6888s555666z+7s/p222s#7p@nst",  # 副露・ツモ
+    "888s6z+6z/a6666m/k2222p/p222s#6z@we",  # 暗槓・明槓
+    "2224466z+4z/p333z/p555z#4z@net",  # 役満
+    "11335577m88s334z+4z#6p@wstr",  # 七対子
+    "1359m2468p1357s1z+5z",  # 和了形でない手牌
+]
+warmup_state = {"ready": False, "seconds": None, "error": None}
+
+
+def warm_up() -> None:
+    """初回リクエストで払うはずの初期化を先に済ませる
+
+    serve.py では fork 前に親プロセスで1回だけ実行し、読み込んだモジュールやテーブルを
+    ワーカー間で copy-on-write で共有する。uvicorn で直接起動した場合は lifespan から
+    別スレッドで実行する。終わるまで /ready は 503 を返す。
+    """
+    started = time.perf_counter()
+    try:
+        for text in WARMUP_HANDS:
+            hand = parse_mpsz(text)
+            slim_score_json(score_hand(hand))
+            score_hand(CalculateRequest.model_validate(hand.to_request_dict())).model_dump_json()
+        find_waits(WaitsRequest(hand=TileInput(man="234", pin="345", sou="6782234"))).model_dump_json()
+
+        # 画像処理 (Pillow) とローカル牌認識のテンプレート
+        from PIL import Image
+
+        upload = io.BytesIO()
+        Image.new("RGB", (64, 32), "white").save(upload, format="PNG")
+        prepared = preprocess_image(
+            upload.getvalue(), RECOGNIZE_IMAGE_MAX_EDGE, RECOGNIZE_IMAGE_FORMAT, RECOGNIZE_IMAGE_QUALITY,
+        )
+        classifier = get_tile_classifier()
+        if classifier is not None:
+            classifier.classify_bytes(prepared.data)
+
+        # クライアント自体は接続プールを持つのでワーカーごとに作り、モジュールだけ読み込んでおく
+        if vision_configured() and VISION_BACKEND == "openai":
+            importlib.import_module("openai")
+    except Exception as e:
+        print(f"warm-up failed: {e}")
+        warmup_state["error"] = str(e)
+        return
+    warmup_state["seconds"] = round(time.perf_counter() - started, 3)
+    warmup_state["ready"] = True
 
 
 @app.get("/")
@@ -145,104 +657,200 @@ async def root():
     return {"message": "Mahjong Calculator API", "version": "1.0.0"}
 
 
-@app.post("/calculate", response_model=ScoreResult)
-async def calculate_score(request: CalculateRequest, x_api_key: Optional[str] = Header(default=None)):
-    """手牌から点数を計算"""
+@app.get("/ready")
+async def ready():
+    """ウォームアップが終わるまで 503 を返す (レディネスチェック用)"""
+    if not warmup_state["ready"]:
+        raise HTTPException(status_code=503, detail="Warm-up failed" if warmup_state["error"] else "Warming up")
+    return {"ready": True, "warmup_seconds": warmup_state["seconds"]}
+
+
+def image_stats() -> dict:
+    """アップロード画像の累計 (1枚ごとのサイズは /metrics の mahjong_image_bytes)"""
+    return {
+        "images": metrics.IMAGE_BYTES.count("original"),
+        "original_bytes": int(metrics.IMAGE_BYTES.total("original")),
+        "processed_bytes": int(metrics.IMAGE_BYTES.total("processed")),
+    }
+
+
+@app.get("/stats")
+async def stats(x_api_key: Optional[str] = Header(default=None)):
+    """キャッシュなどの内部統計"""
     verify_api_auth(x_api_key)
-    try:
-        calculator = HandCalculator()
+    return {
+        "score_cache": score_cache.stats(),
+        "score_disk_cache": await asyncio.to_thread(score_disk_cache.stats) if score_disk_cache is not None else None,
+        "scoring_executor": scoring_executor.stats(),
+        "vision_client": vision_client.stats() if vision_client else None,
+        "images": image_stats(),
+        "recognition_cache": recognition_cache.stats(),
+        "game_sessions": game_sessions.stats(),
+        "singleflight": {
+            "calculate": calculate_flight.stats(),
+            "recognize": recognize_flight.stats(),
+        },
+        "rate_limits": {
+            "recognize": recognize_rate_limiter.stats(),
+            "calculate": calculate_rate_limiter.stats(),
+        },
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics(x_api_key: Optional[str] = Header(default=None)):
+    """Prometheus テキスト形式のメトリクス"""
+    verify_api_auth(x_api_key)
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
 
-        # 牌を変換
-        tiles = TilesConverter.string_to_136_array(
-            man=request.hand.man,
-            pin=request.hand.pin,
-            sou=request.hand.sou,
-            honors=request.hand.honors
-        )
 
-        win_tile = TilesConverter.string_to_136_array(
-            man=request.win_tile.man,
-            pin=request.win_tile.pin,
-            sou=request.win_tile.sou,
-            honors=request.win_tile.honors
-        )[0]
-
-        # ドラ
-        dora_indicators = TilesConverter.string_to_136_array(
-            man=request.dora_indicators.man,
-            pin=request.dora_indicators.pin,
-            sou=request.dora_indicators.sou,
-            honors=request.dora_indicators.honors
-        ) if (request.dora_indicators.man or request.dora_indicators.pin or
-              request.dora_indicators.sou or request.dora_indicators.honors) else []
-
-        # 副露の変換
-        melds = []
-        for meld in request.melds:
-            from mahjong.meld import Meld
-            meld_tiles = TilesConverter.string_to_136_array(
-                man=meld.tiles.man,
-                pin=meld.tiles.pin,
-                sou=meld.tiles.sou,
-                honors=meld.tiles.honors
-            )
-            meld_type = {
-                "chi": Meld.CHI,
-                "pon": Meld.PON,
-                "kan": Meld.KAN,
-                "ankan": Meld.KAN
-            }.get(meld.type, Meld.PON)
-            melds.append(Meld(meld_type, meld_tiles, opened=meld.opened))
-
-        # 設定
-        config = HandConfig(
-            is_tsumo=request.is_tsumo,
-            is_riichi=request.is_riichi,
-            is_ippatsu=request.is_ippatsu,
-            is_rinshan=request.is_rinshan,
-            is_chankan=request.is_chankan,
-            is_haitei=request.is_haitei,
-            is_daburu_riichi=request.is_daburu_riichi,
-            is_tenhou=request.is_tenhou,
-            is_chiihou=request.is_chiihou,
-            player_wind=WIND_MAP.get(request.player_wind, EAST),
-            round_wind=WIND_MAP.get(request.round_wind, EAST),
-            options=OptionalRules(
-                has_open_tanyao=True,
-                has_aka_dora=False,  # 赤ドラは現在未対応（UIで指定できないため）
-            )
+@app.get("/metrics/slow")
+async def get_slow_requests(x_api_key: Optional[str] = Header(default=None)):
+    """サンプリングしたリクエストのうち遅いものから順に (METRICS_SAMPLE_RATE > 0 の場合のみ)"""
+    verify_api_auth(x_api_key)
+    return {"sample_rate": metrics.sampler.sample_rate, "requests": metrics.sampler.slowest()}
+
+
+def convert_tiles(request: CalculateRequest | WaitsRequest) -> tuple[list[int], list, list[int]]:
+    """手牌・副露・ドラ表示牌を136形式に変換 (和了牌を除く)"""
+    tiles = TilesConverter.string_to_136_array(
+        man=request.hand.man,
+        pin=request.hand.pin,
+        sou=request.hand.sou,
+        honors=request.hand.honors
+    )
+
+    # ドラ
+    dora_indicators = TilesConverter.string_to_136_array(
+        man=request.dora_indicators.man,
+        pin=request.dora_indicators.pin,
+        sou=request.dora_indicators.sou,
+        honors=request.dora_indicators.honors
+    ) if (request.dora_indicators.man or request.dora_indicators.pin or
+          request.dora_indicators.sou or request.dora_indicators.honors) else []
+
+    # 副露の変換
+    melds = []
+    for meld in request.melds:
+        meld_tiles = TilesConverter.string_to_136_array(
+            man=meld.tiles.man,
+            pin=meld.tiles.pin,
+            sou=meld.tiles.sou,
+            honors=meld.tiles.honors
         )
+        meld_type = MELD_TYPE_MAP.get(meld.type, Meld.PON)
+        melds.append(Meld(meld_type, meld_tiles, opened=meld.opened))
 
-        # 計算
-        result = calculator.estimate_hand_value(
-            tiles=tiles,
-            win_tile=win_tile,
-            melds=melds if melds else None,
-            dora_indicators=dora_indicators if dora_indicators else None,
-            config=config
+    return tiles, melds, dora_indicators
+
+
+def convert_hand(request: CalculateRequest) -> tuple[list[int], int, list, list[int]]:
+    """リクエストの牌を136形式に変換 (手牌, 和了牌, 副露, ドラ表示牌)"""
+    tiles, melds, dora_indicators = convert_tiles(request)
+
+    win_tile = TilesConverter.string_to_136_array(
+        man=request.win_tile.man,
+        pin=request.win_tile.pin,
+        sou=request.win_tile.sou,
+        honors=request.win_tile.honors
+    )[0]
+
+    return tiles, win_tile, melds, dora_indicators
+
+
+def convert_compact(hand: CompactHand) -> tuple[list[int], int, list, list[int]]:
+    """convert_hand と同じ結果を、枚数ベクトルから事前計算表で直接作る"""
+    melds = [
+        Meld(
+            MELD_TYPE_MAP[meld_type],
+            CompactHand.counts_to_136(hand.meld_counts(meld_type, first)),
+            opened=meld_type != "ankan",
+        )
+        for meld_type, first in hand.melds
+    ]
+    return hand.tiles_136(), hand.win_tile_136(), melds, CompactHand.counts_to_136(hand.dora_counts)
+
+
+def build_hand_config(request: CalculateRequest | WaitsRequest | CompactHand, **overrides) -> HandConfig:
+    """リクエストの状況フラグから HandConfig を構築 (overrides で個別に上書き可能)"""
+    situation = {name: getattr(request, name, False) for name in HAND_CONFIG_FLAGS}
+    situation["player_wind"] = request.player_wind
+    situation["round_wind"] = request.round_wind
+    situation.update(overrides)
+    return HandConfig(
+        is_tsumo=situation["is_tsumo"],
+        is_riichi=situation["is_riichi"],
+        is_ippatsu=situation["is_ippatsu"],
+        is_rinshan=situation["is_rinshan"],
+        is_chankan=situation["is_chankan"],
+        is_haitei=situation["is_haitei"],
+        is_daburu_riichi=situation["is_daburu_riichi"],
+        is_tenhou=situation["is_tenhou"],
+        is_chiihou=situation["is_chiihou"],
+        player_wind=WIND_MAP.get(situation["player_wind"], EAST),
+        round_wind=WIND_MAP.get(situation["round_wind"], EAST),
+        options=OptionalRules(
+            has_open_tanyao=True,
+            has_aka_dora=False,  # 赤ドラは現在未対応（UIで指定できないため）
         )
+    )
 
-        if result.error:
-            return ScoreResult(
-                han=0,
-                fu=0,
-                cost={},
-                yaku=[],
-                error=str(result.error)
-            )
 
+def to_score_result(result, melds: list) -> ScoreResult:
+    """estimate_hand_value の結果を ScoreResult に変換"""
+    if result.error:
         return ScoreResult(
-            han=result.han,
-            fu=result.fu,
-            cost={
-                "main": result.cost.get("main", 0) if isinstance(result.cost, dict) else result.cost["main"],
-                "additional": result.cost.get("additional", 0) if isinstance(result.cost, dict) else result.cost.get("additional", 0),
-                "total": result.cost.get("main", 0) + result.cost.get("additional", 0) * 2 if isinstance(result.cost, dict) else 0
-            },
-            yaku=[{"name": str(y), "han": y.han_open if melds else y.han_closed} for y in result.yaku]
+            han=0,
+            fu=0,
+            cost={},
+            yaku=[],
+            error=str(result.error)
         )
 
-    except Exception:
+    return ScoreResult(
+        han=result.han,
+        fu=result.fu,
+        cost={
+            "main": result.cost.get("main", 0) if isinstance(result.cost, dict) else result.cost["main"],
+            "additional": result.cost.get("additional", 0) if isinstance(result.cost, dict) else result.cost.get("additional", 0),
+            "total": result.cost.get("main", 0) + result.cost.get("additional", 0) * 2 if isinstance(result.cost, dict) else 0
+        },
+        yaku=[{"name": str(y), "han": y.han_open if melds else y.han_closed} for y in result.yaku]
+    )
+
+
+def score_hand(request: CalculateRequest | CompactHand, trace: RequestTrace = NULL_TRACE) -> ScoreResult:
+    """手牌から点数を計算 (/calculate・/calculate/batch・/calculate/compact で共通)"""
+    try:
+        calculator = HandCalculator()
+        with trace.stage("convert"):
+            if isinstance(request, CompactHand):
+                tiles, win_tile, melds, dora_indicators = convert_compact(request)
+            else:
+                tiles, win_tile, melds, dora_indicators = convert_hand(request)
+        with trace.stage("config"):
+            config = build_hand_config(request)
+
+        # 計算 (事前計算テーブルで和了形でないと分かる手牌はライブラリを呼ばずに返す)
+        with trace.stage("estimate"):
+            if known_not_winning(tiles, win_tile, melds, config):
+                trace.error(HandCalculator.ERR_HAND_NOT_WINNING)
+                return not_winning_result()
+            result = trace.profiled(
+                calculator.estimate_hand_value,
+                tiles=tiles,
+                win_tile=win_tile,
+                melds=melds if melds else None,
+                dora_indicators=dora_indicators if dora_indicators else None,
+                config=config
+            )
+
+        if result.error:
+            trace.error(str(result.error))
+        return to_score_result(result, melds)
+
+    except Exception as e:
+        trace.error("calculation_failed", e)
         return ScoreResult(
             han=0,
             fu=0,
@@ -252,6 +860,572 @@ async def calculate_score(request: CalculateRequest, x_api_key: Optional[str] =
         )
 
 
+# ライブラリが和了判定より先に検証する状況フラグ (立っていれば判定をライブラリに任せる)
+PRE_AGARI_CHECKED_FLAGS = (
+    "is_ippatsu", "is_rinshan", "is_chankan", "is_haitei", "is_houtei", "is_daburu_riichi",
+    "is_nagashi_mangan", "is_tenhou", "is_renhou", "is_chiihou",
+)
+
+
+def known_not_winning(tiles: list[int], win_tile: int, melds: list, config: HandConfig) -> bool:
+    """事前計算テーブルで和了形でないと分かり、estimate_hand_value も hand_not_winning を返す手牌か
+
+    ライブラリは和了牌の有無や状況フラグの矛盾を和了判定より先にエラーにするので、
+    それらが起こりうる場合と枚数が合わない場合は False (ライブラリで判定する) を返す。
+    """
+    if hand_tables is None or win_tile not in tiles:
+        return False
+    if any(getattr(config, flag, False) for flag in PRE_AGARI_CHECKED_FLAGS):
+        return False
+    if config.is_riichi and any(meld.opened for meld in melds):
+        return False
+    closed = closed_tiles_34(TilesConverter.to_34_array(tiles), melds)
+    if sum(closed) != (4 - len(melds)) * 3 + 2:
+        return False
+    return not hand_tables.is_agari(closed, len(melds))
+
+
+def not_winning_result() -> ScoreResult:
+    return ScoreResult(han=0, fu=0, cost={}, yaku=[], error=HandCalculator.ERR_HAND_NOT_WINNING)
+
+
+def closed_tiles_34(tiles_34: list[int], melds: list) -> list[int]:
+    """34種の枚数から副露の牌を除いた門前部分"""
+    closed = list(tiles_34)
+    for meld in melds:
+        for tile_34 in meld.tiles_34:
+            closed[tile_34] -= 1
+    return closed
+
+
+def tile_index_to_id(tile_34: int) -> str:
+    """34形式のインデックスを "1m" 形式の牌IDに変換"""
+    return f"{tile_34 % 9 + 1}{'mpsz'[tile_34 // 9]}"
+
+
+def find_wait_tiles(tiles_34: list[int], meld_tiles_34: list[list[int]]) -> list[int]:
+    """mahjong ライブラリの和了判定で待ち牌を列挙 (事前計算テーブルが無い場合)"""
+    agari = Agari()
+    wait_tiles = []
+    for tile_34 in range(34):
+        # 自分の手牌で4枚使い切っている牌は和了牌になりえない
+        if tiles_34[tile_34] >= 4:
+            continue
+        tiles_34[tile_34] += 1
+        if agari.is_agari(tiles_34, meld_tiles_34):
+            wait_tiles.append(tile_34)
+        tiles_34[tile_34] -= 1
+    return wait_tiles
+
+
+def is_tenpai_size(tiles: list[int], melds: list) -> bool:
+    """和了牌を含まない枚数 (13枚 + 槓の枚数分) か"""
+    kan_count = sum(1 for meld in melds if len(meld.tiles) == 4)
+    return len(tiles) - kan_count == 13
+
+
+def hand_waits(tiles: list[int], melds: list) -> tuple[list[int], int, list[int]]:
+    """副露を含む手牌の34種の枚数・門前部分の向聴数・待ち牌"""
+    tiles_34 = TilesConverter.to_34_array(tiles)
+    meld_tiles_34 = [meld.tiles_34 for meld in melds]
+    closed = closed_tiles_34(tiles_34, melds)
+    if hand_tables is not None:
+        shanten = hand_tables.shanten(closed)
+        wait_tiles = hand_tables.waits(closed, len(melds), visible_34=tiles_34)
+    else:
+        shanten = Shanten().calculate_shanten(closed)
+        wait_tiles = find_wait_tiles(tiles_34, meld_tiles_34)
+    return tiles_34, shanten, wait_tiles
+
+
+def find_waits(request: WaitsRequest) -> WaitsResponse:
+    """テンパイ形の待ち牌を列挙し、待ち牌ごとにロン/ツモの点数を計算"""
+    try:
+        # 牌の変換・HandConfig の構築は全候補で共有する
+        tiles, melds, dora_indicators = convert_tiles(request)
+        if not is_tenpai_size(tiles, melds):
+            return WaitsResponse(error="invalid_tile_count")
+
+        _, shanten, wait_tiles = hand_waits(tiles, melds)
+        if not wait_tiles:
+            return WaitsResponse(shanten=shanten, waits=[])
+
+        ron_config = build_hand_config(request, is_tsumo=False, **{flag: False for flag in TSUMO_ONLY_FLAGS})
+        tsumo_config = build_hand_config(request, is_tsumo=True, **{flag: False for flag in RON_ONLY_FLAGS})
+        calculator = HandCalculator()
+
+        waits = []
+        for tile_34 in wait_tiles:
+            win_tile = next(tile for tile in range(tile_34 * 4, tile_34 * 4 + 4) if tile not in tiles)
+            winning_tiles = tiles + [win_tile]
+            scores = {}
+            for mode, config in (("ron", ron_config), ("tsumo", tsumo_config)):
+                result = calculator.estimate_hand_value(
+                    tiles=winning_tiles,
+                    win_tile=win_tile,
+                    melds=melds if melds else None,
+                    dora_indicators=dora_indicators if dora_indicators else None,
+                    config=config
+                )
+                scores[mode] = to_score_result(result, melds)
+            waits.append(WaitResult(tile=tile_index_to_id(tile_34), **scores))
+
+        return WaitsResponse(shanten=shanten, waits=waits)
+
+    except Exception:
+        return WaitsResponse(error="calculation_failed")
+
+
+def scenario_label(overrides: dict) -> str:
+    if not overrides:
+        return "base"
+    return ",".join(
+        name if value is True else f"!{name}" if value is False else f"{name}={value}"
+        for name, value in overrides.items()
+    )
+
+
+def score_scenarios(request: CalculateScenariosRequest) -> CalculateScenariosResponse:
+    """1つの手牌を複数の状況で計算
+
+    牌の変換は1回だけ行い、面子分解は HandDivider のキャッシュで全シナリオに共有する
+    (手牌が同じなのでキャッシュキーも同じになる)。同じ状況のシナリオは1回だけ計算する。
+    """
+    failed = ScoreResult(han=0, fu=0, cost={}, yaku=[], error="calculation_failed")
+    try:
+        tiles, win_tile, melds, dora_indicators = convert_hand(request)
+    except Exception:
+        tiles = None
+    calculator = HandCalculator()
+
+    def score(overrides: dict) -> ScoreResult:
+        if tiles is None:
+            return failed
+        try:
+            config = build_hand_config(request, **overrides)
+            if known_not_winning(tiles, win_tile, melds, config):
+                return not_winning_result()
+            result = calculator.estimate_hand_value(
+                tiles=tiles,
+                win_tile=win_tile,
+                melds=melds if melds else None,
+                dora_indicators=dora_indicators if dora_indicators else None,
+                config=config,
+                use_hand_divider_cache=True,
+            )
+            return to_score_result(result, melds)
+        except Exception:
+            return failed
+
+    response = CalculateScenariosResponse(
+        labels=[], han=[], fu=[], main=[], additional=[], total=[], yaku=[], errors=[],
+    )
+    scores: dict[tuple, ScoreResult] = {}
+    for scenario in request.scenarios:
+        overrides = scenario.model_dump(exclude_none=True, exclude={"label"})
+        key = tuple(sorted(overrides.items()))
+        if key not in scores:
+            scores[key] = score(overrides)
+        result = scores[key]
+
+        response.labels.append(scenario.label or scenario_label(overrides))
+        response.han.append(result.han)
+        response.fu.append(result.fu)
+        response.main.append(result.cost.get("main", 0))
+        response.additional.append(result.cost.get("additional", 0))
+        response.total.append(result.cost.get("total", 0))
+        response.yaku.append([yaku["name"] for yaku in result.yaku])
+        response.errors.append(result.error)
+
+    return response
+
+
+def score_ev_win(
+    request: EvRequest, calculator: HandCalculator, tiles: list[int], melds: list, dora_indicators: list[int],
+    tile_34: int, is_tsumo: bool, is_ippatsu: bool = False, ura_indicators: tuple[int, ...] = (),
+) -> ScoreResult:
+    """/calculate/ev の和了1通り分の点数 (裏ドラは表示牌をドラ表示牌に加えて数える)"""
+    win_tile = next(tile for tile in range(tile_34 * 4, tile_34 * 4 + 4) if tile not in tiles)
+    indicators = dora_indicators + [tile * 4 for tile in ura_indicators]
+    result = calculator.estimate_hand_value(
+        tiles=tiles + [win_tile],
+        win_tile=win_tile,
+        melds=melds if melds else None,
+        dora_indicators=indicators if indicators else None,
+        config=build_hand_config(request, is_tsumo=is_tsumo, is_ippatsu=is_ippatsu),
+        use_hand_divider_cache=True,
+    )
+    return to_score_result(result, melds)
+
+
+def prepare_ev(request: EvRequest) -> tuple[EvResponse, Optional[EvSetup]]:
+    """待ち牌と見えていない牌からシミュレーションの入力を作る (入力が不正なら EvSetup は None)
+
+    役が無い・フリテンで和了できない牌は、ロン/ツモごとに和了牌から外しておく。
+    """
+    try:
+        tiles, melds, dora_indicators = convert_tiles(request)
+        if not is_tenpai_size(tiles, melds):
+            return EvResponse(error="invalid_tile_count"), None
+        discards = tile_input_counts(request.discards)
+        others = tile_input_counts(request.visible)
+        if discards is None or others is None:
+            return EvResponse(error="invalid_tiles"), None
+        tiles_34, _, wait_tiles = hand_waits(tiles, melds)
+        if not wait_tiles:
+            return EvResponse(error="not_tenpai"), None
+
+        dora_34 = TilesConverter.to_34_array(dora_indicators)
+        seen = [sum(counts) for counts in zip(tiles_34, discards, others, dora_34)]
+        if max(seen) > 4:
+            return EvResponse(error="invalid_tile_count"), None
+        unseen = tuple(tile_34 for tile_34 in range(34) for _ in range(4 - seen[tile_34]))
+
+        furiten = any(discards[tile_34] for tile_34 in wait_tiles)
+        calculator = HandCalculator()
+
+        def can_win(tile_34: int, is_tsumo: bool) -> bool:
+            return not score_ev_win(request, calculator, tiles, melds, dora_indicators, tile_34, is_tsumo).error
+
+        riichi = request.is_riichi or request.is_daburu_riichi
+        ura_indicators = max(1, len(dora_indicators)) if riichi else 0
+        setup = EvSetup(
+            unseen=unseen,
+            ron_tiles=tuple(tile_34 for tile_34 in wait_tiles if not furiten and can_win(tile_34, False)),
+            tsumo_tiles=tuple(tile_34 for tile_34 in wait_tiles if can_win(tile_34, True)),
+            hand_counts=tuple(tiles_34),
+            turns=min(request.turns_left, max_turns(len(unseen), len(dora_indicators))),
+            riichi=riichi,
+            ura_indicators=ura_indicators,
+            deal_in_rate=request.deal_in_rate if request.deal_in_rate is not None else (
+                DEFAULT_DEAL_IN_RATE_RIICHI if riichi else DEFAULT_DEAL_IN_RATE_DAMA
+            ),
+            opponent_win_rate=request.opponent_win_rate,
+        )
+        response = EvResponse(
+            waits=[tile_index_to_id(tile_34) for tile_34 in wait_tiles], furiten=furiten, turns=setup.turns,
+        )
+        return response, setup
+    except Exception:
+        return EvResponse(error="calculation_failed"), None
+
+
+def summarize_ev(
+    request: EvRequest, response: EvResponse, results: list[EvShardResult], requested: int,
+) -> EvResponse:
+    """シャードの結果を合算し、和了の組み合わせごとに点数を計算して期待値と分布にまとめる"""
+    merged = merge_shards(results)
+    tiles, melds, dora_indicators = convert_tiles(request)
+    calculator = HandCalculator()
+    trials = merged.simulations
+
+    points_counts: dict[int, int] = {}
+    wins = tsumo_wins = 0
+    for outcome, count in merged.counts.items():
+        tile_34, is_tsumo, is_ippatsu, _ = outcome
+        score = score_ev_win(
+            request, calculator, tiles, melds, dora_indicators,
+            tile_34, is_tsumo, is_ippatsu, merged.ura_examples[outcome],
+        )
+        points = score.cost.get("total", 0)
+        points_counts[points] = points_counts.get(points, 0) + count
+        wins += count
+        tsumo_wins += count if is_tsumo else 0
+
+    mean = sum(points * count for points, count in points_counts.items()) / trials
+    squares = sum(count * (points - mean) ** 2 for points, count in points_counts.items())
+    squares += (trials - wins) * mean ** 2
+    half_width = 1.96 * math.sqrt(squares / (trials - 1) / trials) if trials > 1 else 0.0
+
+    response.simulations = trials
+    response.complete = trials >= requested
+    response.win_rate = wins / trials
+    response.win_rate_ci = list(wilson_interval(wins, trials))
+    response.tsumo_rate = tsumo_wins / trials
+    response.ron_rate = (wins - tsumo_wins) / trials
+    response.expected_value = mean
+    response.expected_value_ci = [max(0.0, mean - half_width), mean + half_width]
+    response.distribution = [
+        EvBucket(points=points, probability=count / trials, ci_low=low, ci_high=high)
+        for points, count in sorted(points_counts.items())
+        for low, high in [wilson_interval(count, trials)]
+    ]
+    return response
+
+
+async def run_ev_shards(
+    setup: EvSetup, seed: int, shards: list[tuple[int, int]], deadline: float,
+) -> list[EvShardResult]:
+    """シャードをプロセスプールで並列に実行し、deadline までに先頭から連続して終わった分を返す
+
+    先頭のシャードだけは締め切りを過ぎても待つ。締め切り後に実行中のシャードは結果を捨てる。
+    """
+    if CALCULATE_BATCH_WORKERS <= 0 or len(shards) == 1:
+        return await run_scoring(simulate_shards, setup, seed, shards, deadline)
+
+    loop = asyncio.get_running_loop()
+    executor = get_batch_executor()
+    futures = [loop.run_in_executor(executor, simulate, setup, seed, shard, count) for shard, count in shards]
+    await asyncio.wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+    await asyncio.wait(futures[:1])
+
+    for future in futures:
+        if not future.done():
+            future.cancel()
+        elif future.exception() is not None:
+            print(f"/calculate/ev shard failed: {future.exception()}")
+            if isinstance(future.exception(), BrokenProcessPool):
+                reset_batch_executor()
+
+    # 途中が欠けると seed ごとの結果を再現できないので、先頭から連続して終わった分だけを使う
+    results = []
+    for future in futures:
+        if future.cancelled() or future.exception() is not None:
+            break
+        results.append(future.result())
+    return results
+
+
+def score_hands(requests: list[CalculateRequest]) -> list[ScoreResult]:
+    """複数の手牌をまとめて計算 (プロセスプールのワーカーで実行される単位)"""
+    return [score_hand(request) for request in requests]
+
+
+async def compute_score(fingerprint: Optional[str], request: CalculateRequest | CompactHand, trace: RequestTrace) -> ScoreResult:
+    """キャッシュに無い手牌を計算して保存 (同じ手牌の計算が実行中ならその結果を待つ)"""
+    async def compute() -> ScoreResult:
+        score = await run_scoring(score_hand, request, trace)
+        await store_score(fingerprint, score)
+        return score
+
+    if fingerprint is None:
+        return await compute()
+    return await calculate_flight.do(fingerprint, compute)
+
+
+async def lookup_score(fingerprint: Optional[str]) -> Optional[ScoreResult]:
+    return (await lookup_scores([fingerprint]))[0]
+
+
+async def lookup_scores(fingerprints: list[Optional[str]]) -> list[Optional[ScoreResult]]:
+    """メモリ → ディスクの順にキャッシュを引く (ディスクにあればメモリにも載せる)
+
+    SQLite はロック待ちでブロックするので、メモリに無かった分だけまとめて別スレッドで引く。
+    """
+    scores = [score_cache.get(fingerprint) if fingerprint is not None else None for fingerprint in fingerprints]
+    missing = [i for i, (fingerprint, score) in enumerate(zip(fingerprints, scores))
+               if fingerprint is not None and score is None]
+    if missing and score_disk_cache is not None:
+        found = await asyncio.to_thread(score_disk_cache.get_many, [fingerprints[i] for i in missing])
+        for i, data in zip(missing, found):
+            if data is not None:
+                scores[i] = ScoreResult.model_validate_json(data)
+                score_cache.set(fingerprints[i], scores[i])
+    return scores
+
+
+async def store_score(fingerprint: Optional[str], score: ScoreResult) -> None:
+    await store_scores([(fingerprint, score)])
+
+
+async def store_scores(items: list[tuple[Optional[str], ScoreResult]]) -> None:
+    """メモリとディスクのキャッシュに保存 (ディスクへはまとめて1回、別スレッドで書き込む)"""
+    # 例外による calculation_failed は一時的な失敗の可能性があるためキャッシュしない
+    items = [(fingerprint, score) for fingerprint, score in items
+             if fingerprint is not None and score.error != "calculation_failed"]
+    for fingerprint, score in items:
+        score_cache.set(fingerprint, score)
+    if score_disk_cache is not None and items:
+        rows = [(fingerprint, score.model_dump_json()) for fingerprint, score in items]
+        await asyncio.to_thread(score_disk_cache.set_many, rows)
+
+
+async def run_scoring(fn, *args):
+    """点数計算を専用スレッドプールで実行 (混雑時は 503 + Retry-After)"""
+    try:
+        return await scoring_executor.run(fn, *args)
+    except ExecutorSaturated:
+        raise HTTPException(
+            status_code=503,
+            detail="Server busy",
+            headers={"Retry-After": str(SCORING_RETRY_AFTER_SECONDS)},
+        )
+
+
+def get_batch_executor() -> ProcessPoolExecutor:
+    global batch_executor
+    if batch_executor is None:
+        batch_executor = ProcessPoolExecutor(max_workers=CALCULATE_BATCH_WORKERS)
+    return batch_executor
+
+
+@app.post("/calculate", response_model=ScoreResult)
+async def calculate_score(request: CalculateRequest, http_request: Request, x_api_key: Optional[str] = Header(default=None)):
+    """手牌から点数を計算"""
+    trace = start_trace("calculate", http_request.scope)
+    try:
+        verify_api_auth(x_api_key)
+        enforce_rate_limit(calculate_rate_limiter, "calculate", http_request)
+
+        # キャッシュヒット時は mahjong ライブラリを経由せずに返す
+        fingerprint = calculate_fingerprint(request)
+        score = await lookup_score(fingerprint)
+        if score is None:
+            score = await compute_score(fingerprint, request, trace)
+
+        # シリアライズの時間も測るため、response_model を経由せずに JSON にする
+        with trace.stage("serialize"):
+            body = score.model_dump_json()
+        return Response(body, media_type="application/json")
+    finally:
+        trace.finish()
+
+
+def slim_score_json(score: ScoreResult) -> bytes:
+    """/calculate/compact の応答 (cost は [main, additional, total]、yaku は [名前, 翻] の配列)"""
+    cost = score.cost
+    return to_json({
+        "han": score.han,
+        "fu": score.fu,
+        "cost": [cost.get("main", 0), cost.get("additional", 0), cost.get("total", 0)],
+        "yaku": [[yaku["name"], yaku["han"]] for yaku in score.yaku],
+        "error": score.error,
+    })
+
+
+COMPACT_REQUEST_BODY = {
+    "content": {
+        "text/plain": {"schema": {"type": "string"}, "example": "123m456p789s11z77z+7z"},
+        "application/octet-stream": {"schema": {"type": "string", "format": "binary"}},
+    },
+    "required": True,
+}
+
+
+@app.post("/calculate/compact", openapi_extra={"requestBody": COMPACT_REQUEST_BODY})
+async def calculate_score_compact(http_request: Request, x_api_key: Optional[str] = Header(default=None)):
+    """/calculate と同じ計算を、MPSZ 表記 (text/plain) またはバイナリ (application/octet-stream) で受け付ける
+
+    形式は compact_hand.py を参照。pydantic のモデルを経由せず、応答も検証なしの簡易 JSON で返す。
+    """
+    trace = start_trace("calculate_compact", http_request.scope)
+    try:
+        verify_api_auth(x_api_key)
+        enforce_rate_limit(calculate_rate_limiter, "calculate", http_request)
+
+        content_type = http_request.headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type not in ("text/plain", "application/octet-stream"):
+            raise HTTPException(status_code=415, detail="Unsupported content type")
+        body = await http_request.body()
+        try:
+            with trace.stage("parse"):
+                hand = parse_mpsz(body.decode("ascii")) if content_type == "text/plain" else parse_packed(body)
+        except (CompactFormatError, UnicodeDecodeError) as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        fingerprint = compact_fingerprint(hand)
+        score = await lookup_score(fingerprint)
+        if score is None:
+            score = await compute_score(fingerprint, hand, trace)
+
+        with trace.stage("serialize"):
+            body = slim_score_json(score)
+        return Response(body, media_type="application/json")
+    finally:
+        trace.finish()
+
+
+@app.post("/calculate/waits", response_model=WaitsResponse)
+async def calculate_waits(request: WaitsRequest, http_request: Request, x_api_key: Optional[str] = Header(default=None)):
+    """テンパイ形の手牌から待ち牌と、待ち牌ごとのロン/ツモの点数を計算"""
+    verify_api_auth(x_api_key)
+    enforce_rate_limit(calculate_rate_limiter, "calculate", http_request)
+    return await run_scoring(find_waits, request)
+
+
+@app.post("/calculate/batch", response_model=CalculateBatchResponse)
+async def calculate_score_batch(request: CalculateBatchRequest, http_request: Request, x_api_key: Optional[str] = Header(default=None)):
+    """複数の手牌をまとめて計算 (結果はリクエストと同じ順序)"""
+    verify_api_auth(x_api_key)
+    enforce_rate_limit(calculate_rate_limiter, "calculate", http_request)
+    if len(request.hands) > CALCULATE_BATCH_MAX_HANDS:
+        raise HTTPException(status_code=413, detail="Too many hands")
+
+    results: list[Optional[ScoreResult]] = [None] * len(request.hands)
+    fingerprints = [calculate_fingerprint(hand) for hand in request.hands]
+    pending = []
+    for index, cached in enumerate(await lookup_scores(fingerprints)):
+        if cached is not None:
+            results[index] = cached
+        else:
+            pending.append(index)
+
+    chunks = [pending[i:i + CALCULATE_BATCH_CHUNK_SIZE] for i in range(0, len(pending), CALCULATE_BATCH_CHUNK_SIZE)]
+    if CALCULATE_BATCH_WORKERS > 0 and len(chunks) > 1:
+        loop = asyncio.get_running_loop()
+        executor = get_batch_executor()
+        chunk_results = await asyncio.gather(
+            *(loop.run_in_executor(executor, score_hands, [request.hands[i] for i in chunk]) for chunk in chunks),
+            return_exceptions=True,
+        )
+    else:
+        chunk_results = [await run_scoring(score_hands, [request.hands[i] for i in chunk]) for chunk in chunks]
+
+    for chunk, chunk_result in zip(chunks, chunk_results):
+        if isinstance(chunk_result, BaseException):
+            # ワーカーが落ちた場合はそのチャンクの手牌のみ失敗扱いにする
+            print(f"/calculate/batch chunk failed: {chunk_result}")
+            if isinstance(chunk_result, BrokenProcessPool):
+                reset_batch_executor()
+            chunk_result = [
+                ScoreResult(han=0, fu=0, cost={}, yaku=[], error="calculation_failed") for _ in chunk
+            ]
+        for index, score in zip(chunk, chunk_result):
+            results[index] = score
+            if score.error:
+                metrics.ERRORS.inc("calculate_batch", score.error)
+        await store_scores([(fingerprints[index], results[index]) for index in chunk])
+
+    return CalculateBatchResponse(results=results)
+
+
+@app.post("/calculate/scenarios", response_model=CalculateScenariosResponse)
+async def calculate_scenarios(request: CalculateScenariosRequest, http_request: Request, x_api_key: Optional[str] = Header(default=None)):
+    """1つの手牌を、リーチ・ツモ・親などの状況を変えた複数のシナリオでまとめて計算"""
+    verify_api_auth(x_api_key)
+    enforce_rate_limit(calculate_rate_limiter, "calculate", http_request)
+    if len(request.scenarios) > CALCULATE_SCENARIOS_MAX:
+        raise HTTPException(status_code=413, detail="Too many scenarios")
+    return await run_scoring(score_scenarios, request)
+
+
+@app.post("/calculate/ev", response_model=EvResponse)
+async def calculate_ev(request: EvRequest, http_request: Request, x_api_key: Optional[str] = Header(default=None)):
+    """テンパイ形の和了率・点数期待値・和了点の分布を、残りのツモのモンテカルロで推定
+
+    リーチ/ダマの比較は is_riichi を変えて2回呼ぶ。時間の上限を過ぎた場合はそれまでの回数で推定する。
+    """
+    verify_api_auth(x_api_key)
+    enforce_rate_limit(calculate_rate_limiter, "calculate", http_request)
+    simulations = request.simulations or CALCULATE_EV_SIMULATIONS
+    if simulations > CALCULATE_EV_MAX_SIMULATIONS:
+        raise HTTPException(status_code=413, detail="Too many simulations")
+    time_budget = min(request.time_budget_seconds or CALCULATE_EV_TIME_BUDGET_SECONDS, CALCULATE_EV_TIME_BUDGET_SECONDS)
+    deadline = time.monotonic() + time_budget
+
+    response, setup = await run_scoring(prepare_ev, request)
+    if setup is None:
+        return response
+    shards = [
+        (shard, min(CALCULATE_EV_SHARD_SIZE, simulations - start))
+        for shard, start in enumerate(range(0, simulations, CALCULATE_EV_SHARD_SIZE))
+    ]
+    results = await run_ev_shards(setup, request.seed, shards, deadline)
+    if not results:
+        return EvResponse(error="calculation_failed")
+    return await run_scoring(summarize_ev, request, response, results, simulations)
+
+
 @app.post("/apply-score")
 async def apply_score(request: ApplyScoreRequest, x_api_key: Optional[str] = Header(default=None)):
     """点数を4人の持ち点に反映"""
@@ -271,6 +1445,102 @@ async def apply_score(request: ApplyScoreRequest, x_api_key: Optional[str] = Hea
         raise HTTPException(status_code=400, detail=str(e))
 
 
+class DuplexStreamingResponse(StreamingResponse):
+    """リクエスト本文を読みながら応答を返す StreamingResponse
+
+    既定の実装は切断検知のために receive() を並行して呼ぶため、本文のメッセージを
+    横取りしてしまう。切断は本文を読む側 (request.stream) で検知できるので、送信のみ行う。
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+
+
+@app.post("/games/replay")
+async def replay_game(request: Request, x_api_key: Optional[str] = Header(default=None)):
+    """NDJSON の対局ログ (ron / tsumo / draw / riichi) を受け取りながら畳み込み、
+    各イベント後の持ち点・順位・局の状態を NDJSON で逐次返す"""
+    verify_api_auth(x_api_key)
+    lines = iter_ndjson_lines(request.stream(), GAME_REPLAY_MAX_LINE_BYTES)
+    return DuplexStreamingResponse(replay_game_log(lines), media_type="application/x-ndjson")
+
+
+def game_session_state(session_id: str, state) -> dict:
+    return {"session_id": session_id, "scores": state.scores, **state.round_info(),
+            "ended": state.ended, "end_reason": state.end_reason}
+
+
+def verify_game_sessions_enabled() -> None:
+    if not GAME_SESSIONS_ENABLED:
+        raise HTTPException(status_code=404, detail="Game sessions are disabled")
+
+
+def get_game_session(session_id: str):
+    try:
+        return game_sessions.get(session_id)
+    except GameSessionNotFound:
+        raise HTTPException(status_code=404, detail="Game session not found")
+
+
+@app.post("/games")
+async def create_game(start: Optional[StartEvent] = None, x_api_key: Optional[str] = Header(default=None)):
+    """対局セッションを作成 (以降は /games/{id}/events にイベントの差分だけを送る)"""
+    verify_api_auth(x_api_key)
+    verify_game_sessions_enabled()
+    session_id, state = game_sessions.create(start or StartEvent(type="start"))
+    return game_session_state(session_id, state)
+
+
+@app.get("/games/{session_id}")
+async def get_game(session_id: str, x_api_key: Optional[str] = Header(default=None)):
+    """対局セッションの現在の持ち点と局の状態"""
+    verify_api_auth(x_api_key)
+    verify_game_sessions_enabled()
+    return game_session_state(session_id, get_game_session(session_id))
+
+
+@app.post("/games/{session_id}/events")
+async def apply_game_event(session_id: str, event: GameEvent, x_api_key: Optional[str] = Header(default=None)):
+    """イベント (ron / tsumo / draw / riichi) を適用し、点数移動と次の局の状態だけを返す"""
+    verify_api_auth(x_api_key)
+    verify_game_sessions_enabled()
+    if isinstance(event, StartEvent):
+        raise HTTPException(status_code=400, detail="Game already started")
+    try:
+        result, state = game_sessions.apply(session_id, event)
+    except GameSessionNotFound:
+        raise HTTPException(status_code=404, detail="Game session not found")
+    except GameReplayError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {**result, **state.round_info(), "ended": state.ended, "end_reason": state.end_reason}
+
+
+@app.post("/games/{session_id}/undo")
+async def undo_game_event(session_id: str, x_api_key: Optional[str] = Header(default=None)):
+    """直前のイベントを取り消し、取り消し後の状態を返す"""
+    verify_api_auth(x_api_key)
+    verify_game_sessions_enabled()
+    try:
+        state = game_sessions.undo(session_id)
+    except GameSessionNotFound:
+        raise HTTPException(status_code=404, detail="Game session not found")
+    if state is None:
+        raise HTTPException(status_code=409, detail="Nothing to undo")
+    return game_session_state(session_id, state)
+
+
+@app.delete("/games/{session_id}")
+async def delete_game(session_id: str, x_api_key: Optional[str] = Header(default=None)):
+    verify_api_auth(x_api_key)
+    verify_game_sessions_enabled()
+    if not game_sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Game session not found")
+    return {"deleted": True}
+
+
 class RecognizedTile(BaseModel):
     """認識された牌"""
     id: str  # "1m", "5p", "7z" など
@@ -285,39 +1555,9 @@ class RecognitionResponse(BaseModel):
     error: Optional[str] = None
 
 
-# 牌名からIDへのマッピング
-TILE_NAME_TO_ID = {
-    # 萬子
-    "一萬": "1m", "二萬": "2m", "三萬": "3m", "四萬": "4m", "五萬": "5m",
-    "六萬": "6m", "七萬": "7m", "八萬": "8m", "九萬": "9m",
-    "1萬": "1m", "2萬": "2m", "3萬": "3m", "4萬": "4m", "5萬": "5m",
-    "6萬": "6m", "7萬": "7m", "8萬": "8m", "9萬": "9m",
-    # 筒子
-    "一筒": "1p", "二筒": "2p", "三筒": "3p", "四筒": "4p", "五筒": "5p",
-    "六筒": "6p", "七筒": "7p", "八筒": "8p", "九筒": "9p",
-    "1筒": "1p", "2筒": "2p", "3筒": "3p", "4筒": "4p", "5筒": "5p",
-    "6筒": "6p", "7筒": "7p", "8筒": "8p", "9筒": "9p",
-    # 索子
-    "一索": "1s", "二索": "2s", "三索": "3s", "四索": "4s", "五索": "5s",
-    "六索": "6s", "七索": "7s", "八索": "8s", "九索": "9s",
-    "1索": "1s", "2索": "2s", "3索": "3s", "4索": "4s", "5索": "5s",
-    "6索": "6s", "7索": "7s", "8索": "8s", "9索": "9s",
-    # 字牌
-    "東": "1z", "南": "2z", "西": "3z", "北": "4z",
-    "白": "5z", "發": "6z", "発": "6z", "中": "7z",
-}
-
-# IDから牌名へのマッピング
-TILE_ID_TO_NAME = {
-    "1m": "一萬", "2m": "二萬", "3m": "三萬", "4m": "四萬", "5m": "五萬",
-    "6m": "六萬", "7m": "七萬", "8m": "八萬", "9m": "九萬",
-    "1p": "一筒", "2p": "二筒", "3p": "三筒", "4p": "四筒", "5p": "五筒",
-    "6p": "六筒", "7p": "七筒", "8p": "八筒", "9p": "九筒",
-    "1s": "一索", "2s": "二索", "3s": "三索", "4s": "四索", "5s": "五索",
-    "6s": "六索", "7s": "七索", "8s": "八索", "9s": "九索",
-    "1z": "東", "2z": "南", "3z": "西", "4z": "北",
-    "5z": "白", "6z": "發", "7z": "中",
-}
+class RecognitionBatchResponse(BaseModel):
+    """一括認識結果 (images と同じ順序)。失敗した画像は error に理由が入る"""
+    results: list[RecognitionResponse]
 
 
 def parse_tile_response(response_text: str) -> list[RecognizedTile]:
@@ -352,19 +1592,121 @@ def parse_tile_response(response_text: str) -> list[RecognizedTile]:
         except json.JSONDecodeError:
             pass
 
-    # テキストから牌名を抽出
-    for name, tile_id in TILE_NAME_TO_ID.items():
-        count = response_text.count(name)
-        for _ in range(count):
-            tiles.append(RecognizedTile(
-                id=tile_id,
-                name=TILE_ID_TO_NAME[tile_id],
-                confidence=0.8
-            ))
+    # テキストから牌ID・牌名を出現順に抽出
+    for tile_id in tokenize_tiles(response_text):
+        tiles.append(RecognizedTile(
+            id=tile_id,
+            name=TILE_ID_TO_NAME[tile_id],
+            confidence=0.8
+        ))
 
     return tiles
 
 
+async def load_upload_image(image: UploadFile, trace: RequestTrace = NULL_TRACE) -> PreprocessedImage:
+    """アップロードを上限付きで読み込み、Vision API 向けに縮小・再エンコード"""
+    try:
+        with trace.stage("upload_read"):
+            image_content = await read_upload_limited(image, MAX_IMAGE_SIZE_BYTES)
+        with trace.stage("preprocess"):
+            prepared = await asyncio.to_thread(
+                preprocess_image,
+                image_content,
+                RECOGNIZE_IMAGE_MAX_EDGE,
+                RECOGNIZE_IMAGE_FORMAT,
+                RECOGNIZE_IMAGE_QUALITY,
+            )
+    except ImageTooLarge:
+        raise HTTPException(status_code=413, detail="Image too large")
+    except InvalidImage:
+        raise HTTPException(status_code=400, detail="Invalid image")
+
+    trace.image_sizes(prepared.original_bytes, prepared.processed_bytes)
+    return prepared
+
+
+async def recognize_locally(prepared: PreprocessedImage, trace: RequestTrace) -> Optional[RecognitionResponse]:
+    """ローカルの牌認識 (無効な場合は None)"""
+    if not RECOGNIZE_LOCAL_ENABLED:
+        return None
+    with trace.stage("local_classify"):
+        classified = await asyncio.to_thread(lambda: get_tile_classifier().classify_bytes(prepared.data))
+    # 牌が取れなかった場合はキャッシュの照合に使わない
+    prepared.local_tiles = tuple(tile.tile_id for tile in classified) or None
+    return RecognitionResponse(
+        tiles=[
+            RecognizedTile(id=tile.tile_id, name=TILE_ID_TO_NAME[tile.tile_id], confidence=tile.confidence)
+            for tile in classified
+        ],
+        raw_response=f"[LOCAL] {len(classified)} tiles, min confidence {min_confidence(classified):.3f}",
+    )
+
+
+async def admit_recognition(
+    request: Request,
+    image: UploadFile,
+    x_api_key: Optional[str],
+    trace: RequestTrace = NULL_TRACE,
+) -> tuple[PreprocessedImage, Optional[RecognitionResponse]]:
+    """/recognize 系の共通前処理 (認証・形式チェック・画像前処理・キャッシュ・レート制限)
+
+    キャッシュヒットやローカル認識でそのまま返せる場合は、その応答を2番目の要素で返す。
+    """
+    verify_api_auth(x_api_key)
+
+    if not is_allowed_image(image):
+        raise HTTPException(status_code=400, detail="Unsupported image format")
+
+    prepared = await load_upload_image(image, trace)
+
+    response, fallback = await recognize_without_vision(prepared, trace)
+    if response is not None:
+        return prepared, response
+
+    enforce_rate_limit(recognize_rate_limiter, "recognize", request)
+
+    if not vision_configured():
+        return prepared, offline_recognition(fallback)
+
+    return prepared, None
+
+
+def is_allowed_image(image: UploadFile) -> bool:
+    return (image.content_type or "").lower() in ALLOWED_IMAGE_CONTENT_TYPES
+
+
+async def recognize_without_vision(
+    prepared: PreprocessedImage,
+    trace: RequestTrace,
+) -> tuple[Optional[RecognitionResponse], Optional[RecognitionResponse]]:
+    """キャッシュとローカル認識で済むか調べる (どちらもレート制限の回数に含めない)
+
+    済む場合はその応答を1番目の要素で返す。2番目は Vision API が使えない場合に返すローカル認識の結果。
+    """
+    # ローカル認識で全牌の信頼度が十分なら Vision API を呼ばない (Vision API が使えない場合は常に結果を返す)
+    local_first = RECOGNIZE_LOCAL_FIRST or not vision_configured()
+    local_response = await recognize_locally(prepared, trace) if local_first else None
+    if local_response is not None and local_response.tiles:
+        if RECOGNIZE_LOCAL_FIRST and min_confidence(local_response.tiles) >= RECOGNIZE_LOCAL_MIN_CONFIDENCE:
+            RECOGNIZE_LOCAL.inc("accepted")
+            return local_response, None
+
+    # 再エンコードなどほぼ同じ画像はキャッシュから返す
+    if vision_configured():
+        cached = recognition_cache.get(prepared.dhash, prepared.thumbnail, prepared.local_tiles)
+        if cached is not None:
+            return RecognitionResponse(tiles=cached.tiles, raw_response=f"[CACHE HIT] {cached.raw_response}"), None
+
+    if local_response is not None:
+        RECOGNIZE_LOCAL.inc("escalated" if vision_configured() else "offline")
+    return None, local_response
+
+
+def offline_recognition(local_response: Optional[RecognitionResponse]) -> RecognitionResponse:
+    """OpenAI APIキーが未設定の場合は信頼度が低くてもローカル認識の結果を返す"""
+    return local_response or RecognitionResponse(tiles=[], error="recognizer_unavailable")
+
+
 @app.post("/recognize", response_model=RecognitionResponse)
 async def recognize_tiles(
     request: Request,
@@ -372,105 +1714,217 @@ async def recognize_tiles(
     x_api_key: Optional[str] = Header(default=None),
 ):
     """画像から牌を認識"""
-    verify_api_auth(x_api_key)
-    client_ip = request.client.host if request.client else "unknown"
-    enforce_recognize_rate_limit(client_ip)
+    trace = start_trace("recognize", request.scope)
+    try:
+        return await recognize_prepared(request, image, x_api_key, trace)
+    finally:
+        trace.finish()
 
-    content_type = (image.content_type or "").lower()
-    if content_type not in ALLOWED_IMAGE_CONTENT_TYPES:
-        raise HTTPException(status_code=400, detail="Unsupported image format")
 
-    # OpenAI APIキーが未設定の場合はダミーデータを返す（開発・テスト用）
-    if not openai_client:
-        dummy_tiles = [
-            RecognizedTile(id="1m", name="一萬", confidence=0.95),
-            RecognizedTile(id="2m", name="二萬", confidence=0.92),
-            RecognizedTile(id="3m", name="三萬", confidence=0.88),
-            RecognizedTile(id="4p", name="四筒", confidence=0.91),
-            RecognizedTile(id="5p", name="五筒", confidence=0.75),  # 低信頼度（警告表示テスト用）
-            RecognizedTile(id="6p", name="六筒", confidence=0.93),
-            RecognizedTile(id="7s", name="七索", confidence=0.89),
-            RecognizedTile(id="8s", name="八索", confidence=0.94),
-            RecognizedTile(id="9s", name="九索", confidence=0.90),
-            RecognizedTile(id="1z", name="東", confidence=0.96),
-            RecognizedTile(id="1z", name="東", confidence=0.97),
-            RecognizedTile(id="1z", name="東", confidence=0.65),  # 低信頼度
-            RecognizedTile(id="7z", name="中", confidence=0.98),
-            RecognizedTile(id="7z", name="中", confidence=0.99),  # 和了牌
-        ]
-        return RecognitionResponse(
-            tiles=dummy_tiles,
-            raw_response="[DUMMY MODE] OpenAI API key not configured. Returning test data."
-        )
+async def recognize_prepared(
+    request: Request,
+    image: UploadFile,
+    x_api_key: Optional[str],
+    trace: RequestTrace,
+) -> RecognitionResponse:
+    prepared, early_response = await admit_recognition(request, image, x_api_key, trace)
+    if early_response is not None:
+        return early_response
+
+    return await recognize_shared(prepared, trace)
+
 
+async def recognize_shared(prepared: PreprocessedImage, trace: RequestTrace) -> RecognitionResponse:
+    """同じ画像の認識が実行中ならその結果を共有する (Vision API の呼び出しは1回だけ)"""
+    return await recognize_flight.do(prepared.digest, lambda: recognize_image(prepared, trace))
+
+
+async def recognize_image(prepared: PreprocessedImage, trace: RequestTrace) -> RecognitionResponse:
+    """Vision API で認識し、牌が取れた場合はキャッシュに保存"""
     try:
-        # 画像をBase64エンコード
-        image_content = await image.read()
-        if len(image_content) > MAX_IMAGE_SIZE_BYTES:
-            raise HTTPException(status_code=413, detail="Image too large")
-        base64_image = base64.b64encode(image_content).decode("utf-8")
+        # 縮小・再エンコード済みの画像をBase64エンコード
+        with trace.stage("base64"):
+            base64_image = base64.b64encode(prepared.data).decode("utf-8")
 
         # Vision APIに送信
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": """あなたは麻雀牌を認識する専門家です。
-画像に写っている麻雀牌を左から右の順番で識別してください。
-
-出力形式は必ず以下のJSON配列のみを返してください：
-["1m", "2m", "3m", "4p", "5p", "6p", "7s", "8s", "9s", "1z", "1z", "1z", "7z", "7z"]
-
-牌のID形式：
-- 萬子: 1m, 2m, 3m, 4m, 5m, 6m, 7m, 8m, 9m
-- 筒子: 1p, 2p, 3p, 4p, 5p, 6p, 7p, 8p, 9p
-- 索子: 1s, 2s, 3s, 4s, 5s, 6s, 7s, 8s, 9s
-- 字牌: 1z(東), 2z(南), 3z(西), 4z(北), 5z(白), 6z(發), 7z(中)
-
-注意：
-- 同じ牌が複数ある場合は、その数だけIDを繰り返してください
-- 確認できない牌がある場合は "?" を使ってください
-- JSON配列のみを出力し、他の説明は不要です"""
-                },
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": "この画像の麻雀牌を左から順番に識別してください。JSON配列で返してください。"
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{content_type};base64,{base64_image}"
-                            }
-                        }
-                    ]
-                }
-            ],
-            max_tokens=500
-        )
-
-        raw_response = response.choices[0].message.content or ""
-        tiles = parse_tile_response(raw_response)
+        with trace.stage("vision"):
+            client = await get_vision_client()
+            raw_response = await client.complete(build_vision_messages(base64_image, prepared.content_type))
+        with trace.stage("parse_response"):
+            tiles = parse_tile_response(raw_response)
 
-        return RecognitionResponse(
+        result = RecognitionResponse(
             tiles=tiles,
             raw_response=raw_response
         )
+        if tiles:
+            recognition_cache.set(prepared.dhash, result, prepared.thumbnail, prepared.local_tiles)
+        return result
 
     except HTTPException:
         raise
     except Exception as e:
         # Keep detailed error in server logs, return generic message to clients.
         print(f"/recognize failed: {e}")
+        trace.error("recognition_failed", e)
         return RecognitionResponse(
             tiles=[],
             error="recognition_failed"
         )
 
 
+async def prepare_batch_image(image: UploadFile, trace: RequestTrace) -> PreprocessedImage | RecognitionResponse:
+    """バッチの1枚分の前処理。失敗した場合はその画像の応答 (error 付き) を返す"""
+    if not is_allowed_image(image):
+        return RecognitionResponse(tiles=[], error="unsupported_image_format")
+    try:
+        return await load_upload_image(image, trace)
+    except HTTPException as e:
+        return RecognitionResponse(tiles=[], error="image_too_large" if e.status_code == 413 else "invalid_image")
+
+
+@app.post("/recognize/batch", response_model=RecognitionBatchResponse)
+async def recognize_tiles_batch(
+    request: Request,
+    images: list[UploadFile] = File(...),
+    x_api_key: Optional[str] = Header(default=None),
+):
+    """複数の画像 (手牌・副露・ドラ表示牌など) をまとめて認識 (結果は images と同じ順序)
+
+    画像ごとの失敗は results の error に入れ、他の画像の結果はそのまま返す。
+    レート制限はバッチ全体で1回として数える。
+    """
+    verify_api_auth(x_api_key)
+    if len(images) > RECOGNIZE_BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413, detail="Too many images")
+
+    trace = start_trace("recognize_batch", request.scope)
+    try:
+        # 前処理はスレッドプールで並列に行う
+        prepared_images = await asyncio.gather(*(prepare_batch_image(image, trace) for image in images))
+        results: list[Optional[RecognitionResponse]] = [
+            item if isinstance(item, RecognitionResponse) else None for item in prepared_images
+        ]
+        pending = [index for index, result in enumerate(results) if result is None]
+        resolved = await asyncio.gather(*(recognize_without_vision(prepared_images[i], trace) for i in pending))
+
+        fallbacks = {}
+        for index, (response, fallback) in zip(pending, resolved):
+            results[index] = response
+            fallbacks[index] = fallback
+        pending = [index for index in pending if results[index] is None]
+        if pending:
+            enforce_rate_limit(recognize_rate_limiter, "recognize", request)
+
+        if not vision_configured():
+            for index in pending:
+                results[index] = offline_recognition(fallbacks[index])
+            return RecognitionBatchResponse(results=results)
+
+        # Vision API への同時リクエスト数を RECOGNIZE_BATCH_CONCURRENCY までに抑える
+        semaphore = asyncio.Semaphore(RECOGNIZE_BATCH_CONCURRENCY)
+
+        async def recognize_limited(prepared: PreprocessedImage) -> RecognitionResponse:
+            async with semaphore:
+                return await recognize_shared(prepared, trace)
+
+        responses = await asyncio.gather(
+            *(recognize_limited(prepared_images[index]) for index in pending), return_exceptions=True,
+        )
+        for index, response in zip(pending, responses):
+            if isinstance(response, BaseException):
+                print(f"/recognize/batch image {index} failed: {response}")
+                trace.error("recognition_failed", response)
+                response = RecognitionResponse(tiles=[], error="recognition_failed")
+            results[index] = response
+        return RecognitionBatchResponse(results=results)
+    finally:
+        trace.finish()
+
+
+def sse_event(event: str, data: str) -> str:
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+async def stream_recognition(
+    prepared: PreprocessedImage,
+    early_response: Optional[RecognitionResponse],
+    trace: RequestTrace = NULL_TRACE,
+):
+    """認識結果を SSE で逐次送る (tile イベントを順に送り、最後に done で全体を送る)"""
+    try:
+        async for event in stream_recognition_events(prepared, early_response, trace):
+            yield event
+    finally:
+        trace.finish()
+
+
+async def stream_recognition_events(
+    prepared: PreprocessedImage,
+    early_response: Optional[RecognitionResponse],
+    trace: RequestTrace,
+):
+    if early_response is not None:
+        for tile in early_response.tiles:
+            yield sse_event("tile", tile.model_dump_json())
+        yield sse_event("done", early_response.model_dump_json())
+        return
+
+    tokenizer = TileTokenizer()
+    parts = []
+    try:
+        with trace.stage("base64"):
+            base64_image = base64.b64encode(prepared.data).decode("utf-8")
+        messages = build_vision_messages(base64_image, prepared.content_type)
+        # vision はクライアントへの送信待ちを含めたストリーム全体の時間
+        vision_started = time.perf_counter()
+        client = await get_vision_client()
+        async for chunk in client.stream(messages):
+            parts.append(chunk)
+            for tile_id in tokenizer.feed(chunk):
+                tile = RecognizedTile(id=tile_id, name=TILE_ID_TO_NAME[tile_id], confidence=0.9)
+                yield sse_event("tile", tile.model_dump_json())
+        for tile_id in tokenizer.close():
+            tile = RecognizedTile(id=tile_id, name=TILE_ID_TO_NAME[tile_id], confidence=0.9)
+            yield sse_event("tile", tile.model_dump_json())
+        trace.observe("vision", time.perf_counter() - vision_started)
+    except Exception as e:
+        # Keep detailed error in server logs, return generic message to clients.
+        print(f"/recognize/stream failed: {e}")
+        trace.error("recognition_failed", e)
+        yield sse_event("done", RecognitionResponse(tiles=[], error="recognition_failed").model_dump_json())
+        return
+
+    # 最終結果は全文をパースし直したもの (信頼度付き JSON などを正しく反映する)
+    raw_response = "".join(parts)
+    with trace.stage("parse_response"):
+        tiles = parse_tile_response(raw_response)
+    result = RecognitionResponse(tiles=tiles, raw_response=raw_response)
+    if result.tiles:
+        recognition_cache.set(prepared.dhash, result, prepared.thumbnail, prepared.local_tiles)
+    yield sse_event("done", result.model_dump_json())
+
+
+@app.post("/recognize/stream")
+async def recognize_tiles_stream(
+    request: Request,
+    image: UploadFile = File(...),
+    x_api_key: Optional[str] = Header(default=None),
+):
+    """画像から牌を認識し、Server-Sent Events で認識できた牌から順に返す"""
+    trace = start_trace("recognize_stream", request.scope)
+    try:
+        prepared, early_response = await admit_recognition(request, image, x_api_key, trace)
+    except BaseException:
+        trace.finish()
+        raise
+    return StreamingResponse(
+        stream_recognition(prepared, early_response, trace),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,401 @@
+import abc
+import bisect
+import cProfile
+import contextlib
+import heapq
+import io
+import itertools
+import pstats
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+# レイテンシ用のバケット境界 (秒)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# 画像サイズ用のバケット境界 (バイト、16 KiB 〜 8 MiB)
+BYTE_BUCKETS = tuple(float(16 * 1024 * 2 ** i) for i in range(10))
+
+
+def escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label_value(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric(abc.ABC):
+    """Prometheus テキスト形式で出力するメトリクスの共通部分
+
+    ラベルの値は宣言順の位置引数で渡す (キーワード引数より呼び出しコストが小さい)。
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    @abc.abstractmethod
+    def samples(self) -> list[str]:
+        """# HELP / # TYPE 以外の出力行"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """累積値。callback を渡した場合は出力時に {ラベル値のタプル: 値} を取得する (他で数えている値の公開用)"""
+
+    type_name = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        callback: Optional[Callable[[], dict[tuple, float]]] = None,
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+        self._callback = callback
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        if self._callback is not None:
+            values.update(self._callback())
+        return [f"{self.name}{format_labels(self.labelnames, labels)} {value:g}" for labels, value in sorted(values.items())]
+
+
+class Gauge(Metric):
+    """現在値。callback を渡した場合は出力時に {ラベル値のタプル: 値} を取得する"""
+
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        callback: Optional[Callable[[], dict[tuple, float]]] = None,
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+        self._callback = callback
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0.0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+        if self._callback is not None:
+            values.update(self._callback())
+        return [f"{self.name}{format_labels(self.labelnames, labels)} {value:g}" for labels, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ラベル値 -> [バケットごとの件数 (累積ではない)..., +Inf の件数, 合計]
+        self._values: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    def count(self, *labels) -> int:
+        state = self._values.get(labels)
+        return sum(state[:-1]) if state else 0
+
+    def total(self, *labels) -> float:
+        state = self._values.get(labels)
+        return state[-1] if state else 0.0
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((labels, list(state)) for labels, state in self._values.items())
+        lines = []
+        for labels, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                bucket_labels = format_labels(self.labelnames, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labelnames, labels)} {state[-1]:.6f}")
+            lines.append(f"{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = MetricsRegistry()
+STAGE_SECONDS = registry.register(Histogram(
+    "mahjong_stage_duration_seconds", "Time spent in each request stage.", ("endpoint", "stage"),
+))
+REQUEST_SECONDS = registry.register(Histogram(
+    "mahjong_http_request_duration_seconds", "HTTP request latency.", ("method", "route", "status"),
+))
+ERRORS = registry.register(Counter(
+    "mahjong_errors_total", "Errors by endpoint and type.", ("endpoint", "type"),
+))
+EXCEPTIONS = registry.register(Counter(
+    "mahjong_exceptions_total", "Exceptions caught and returned as an error response.", ("endpoint", "exception"),
+))
+IN_FLIGHT = registry.register(Gauge(
+    "mahjong_in_flight_requests", "Requests currently being processed.", ("endpoint",),
+))
+IMAGE_BYTES = registry.register(Histogram(
+    "mahjong_image_bytes", "Uploaded image size before and after preprocessing.", ("stage",), buckets=BYTE_BUCKETS,
+))
+
+
+class SlowRequestSampler:
+    """サンプリングした要求のうち、最も遅いものを keep 件保持する
+
+    sample_rate が 0 の場合は何もしない (計測の既定経路にコストを足さない)。
+    profile を有効にすると、サンプル対象の点数計算を cProfile で計測して結果を添付する。
+    """
+
+    def __init__(self, sample_rate: float = 0.0, keep: int = 20, profile: bool = False) -> None:
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.profile = profile
+        self._slowest: list[tuple[float, int, dict]] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def should_sample(self) -> bool:
+        return self.sample_rate > 0 and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def record(self, entry: dict) -> None:
+        item = (entry["duration_ms"], next(self._sequence), entry)
+        with self._lock:
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, item)
+            elif item[0] > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, item)
+
+    def slowest(self) -> list[dict]:
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._slowest, reverse=True)]
+
+
+sampler = SlowRequestSampler()
+# cProfile はプロセス内で同時に1つしか有効にできない (Python 3.12 以降は2つ目が ValueError になる)
+profile_lock = threading.Lock()
+
+
+def configure_sampling(sample_rate: float, keep: int = 20, profile: bool = False) -> None:
+    global sampler
+    sampler = SlowRequestSampler(sample_rate=sample_rate, keep=keep, profile=profile)
+
+
+class StageTimer:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace: "RequestTrace", name: str) -> None:
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self.trace.observe(self.name, time.perf_counter() - self.started)
+
+
+class RequestTrace:
+    """1リクエスト分のステージ計測 (ステージごとのヒストグラムと、サンプル時の内訳)"""
+
+    def __init__(self, endpoint: str, started_at: Optional[float] = None) -> None:
+        self.endpoint = endpoint
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.stages: Optional[dict[str, float]] = {} if sampler.should_sample() else None
+        self.profile: Optional[str] = None
+        self.fields: dict[str, object] = {}
+        self._finished = False
+        IN_FLIGHT.inc(endpoint)
+
+    @property
+    def sampled(self) -> bool:
+        return self.stages is not None
+
+    def stage(self, name: str) -> StageTimer:
+        return StageTimer(self, name)
+
+    def observe(self, name: str, seconds: float) -> None:
+        STAGE_SECONDS.observe(seconds, self.endpoint, name)
+        if self.stages is not None:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds * 1000
+
+    def image_sizes(self, original_bytes: int, processed_bytes: int) -> None:
+        """アップロード画像の縮小前後のサイズを記録 (/recognize/batch では画像ごとに足し合わせる)"""
+        IMAGE_BYTES.observe(original_bytes, "original")
+        IMAGE_BYTES.observe(processed_bytes, "processed")
+        if self.stages is None:
+            return
+        self.fields["original_bytes"] = self.fields.get("original_bytes", 0) + original_bytes
+        self.fields["processed_bytes"] = self.fields.get("processed_bytes", 0) + processed_bytes
+
+    def error(self, error_type: str, exception: Optional[BaseException] = None) -> None:
+        ERRORS.inc(self.endpoint, error_type)
+        if exception is not None:
+            EXCEPTIONS.inc(self.endpoint, type(exception).__name__)
+
+    def profiled(self, fn, *args, **kwargs):
+        """サンプル対象かつ profile 有効時のみ cProfile 付きで fn を呼ぶ"""
+        if self.stages is None or not sampler.profile:
+            return fn(*args, **kwargs)
+        # 他のスレッドが計測中ならプロファイルを取らずに呼ぶ (計測の失敗を fn の失敗にしない)
+        if not profile_lock.acquire(blocking=False):
+            return fn(*args, **kwargs)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            profile_lock.release()
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profile_lock.release()
+            try:
+                output = io.StringIO()
+                pstats.Stats(profiler, stream=output).sort_stats("cumulative").print_stats(15)
+                self.profile = output.getvalue()
+            except Exception:
+                self.profile = None
+
+    def finish(self) -> None:
+        if self._finished:
+            return
+        self._finished = True
+        IN_FLIGHT.dec(self.endpoint)
+        if self.stages is not None:
+            sampler.record({
+                "endpoint": self.endpoint,
+                "duration_ms": (time.perf_counter() - self.started_at) * 1000,
+                "stages_ms": self.stages,
+                **self.fields,
+                "profile": self.profile,
+                "at": time.time(),
+            })
+
+
+class NullTrace(RequestTrace):
+    """計測しない場合の代替 (プロセスプールのワーカーなど)"""
+
+    def __init__(self) -> None:
+        self.endpoint = ""
+        self.stages = None
+        self.profile = None
+
+    def stage(self, name: str) -> contextlib.nullcontext:
+        return contextlib.nullcontext()
+
+    def observe(self, name: str, seconds: float) -> None:
+        pass
+
+    def error(self, error_type: str, exception: Optional[BaseException] = None) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+
+NULL_TRACE = NullTrace()
+
+
+def start_trace(endpoint: str, scope: dict) -> RequestTrace:
+    """ハンドラの先頭で呼ぶ。ミドルウェアの受信時刻からここまで (本文の読み込みと
+    pydantic の検証) を parse ステージとして記録する"""
+    started_at = scope.get("state", {}).get("metrics_started_at")
+    trace = RequestTrace(endpoint, started_at)
+    if started_at is not None:
+        trace.observe("parse", time.perf_counter() - started_at)
+    return trace
+
+
+class MetricsMiddleware:
+    """全 HTTP リクエストのレイテンシをルート単位で記録する ASGI ミドルウェア
+
+    受信時刻を scope["state"] に残し、ハンドラ側でリクエスト解析にかかった時間を測れるようにする。
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        scope.setdefault("state", {})["metrics_started_at"] = started
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                scope["method"],
+                getattr(route, "path", "unmatched"),
+                status,
+            )
@@ -0,0 +1,167 @@
+import abc
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+
+class RateLimiter(abc.ABC):
+    """トークンバケット方式のレート制限の共通インターフェース
+
+    acquire はリクエストを許可する場合 0、拒否する場合は再試行までの秒数を返す。
+    """
+
+    def __init__(self, capacity: float, refill_per_second: float) -> None:
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self.allowed = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _take(self, tokens: float, updated_at: float, now: float, cost: float) -> tuple[float, float]:
+        """バケットを補充してから cost 分を取り出す。(残りトークン, 再試行までの秒数) を返す"""
+        tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * self.refill_per_second)
+        if tokens >= cost:
+            self.allowed += 1
+            return tokens - cost, 0.0
+        self.rejected += 1
+        if self.refill_per_second <= 0:
+            return tokens, float("inf")
+        return tokens, (cost - tokens) / self.refill_per_second
+
+    @abc.abstractmethod
+    def acquire(self, key: str, cost: float = 1.0) -> float:
+        """key のリクエストを許可する場合 0、拒否する場合は再試行までの秒数を返す"""
+
+    def stats(self) -> dict:
+        return {"allowed": self.allowed, "rejected": self.rejected}
+
+
+class TokenBucketLimiter(RateLimiter):
+    """プロセス内のトークンバケット。キーごとの状態は固定サイズで、max_keys を超えたら LRU で破棄"""
+
+    def __init__(
+        self,
+        capacity: float,
+        refill_per_second: float,
+        max_keys: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        super().__init__(capacity, refill_per_second)
+        self.max_keys = max_keys
+        self._clock = clock
+        # key -> (残りトークン, 最終更新時刻)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def acquire(self, key: str, cost: float = 1.0) -> float:
+        if not self.enabled:
+            return 0.0
+        now = self._clock()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (self.capacity, now))
+            tokens, retry_after = self._take(tokens, updated_at, now, cost)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+        return retry_after
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "keys": len(self._buckets), "evictions": self.evictions}
+
+
+SLOT = struct.Struct("<Qdd")
+SLOT_SIZE = 32
+
+
+class SharedTokenBucketLimiter(RateLimiter):
+    """共有メモリ (mmap したファイル) 上のトークンバケット
+
+    同じホストの uvicorn ワーカー間で制限を共有する。キーのハッシュで固定数のスロットに
+    直接割り当て、スロット単位の fcntl ロックで排他する。別のキーとスロットが衝突した場合は
+    上書きする (その分だけ制限が緩くなる方向にしか外れない)。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        capacity: float,
+        refill_per_second: float,
+        slots: int = 65536,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        import fcntl
+
+        super().__init__(capacity, refill_per_second)
+        self._fcntl = fcntl
+        self.slots = slots
+        self._clock = clock
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = slots * SLOT_SIZE
+        # 複数ワーカーが同時に起動しても、伸ばすだけなので既存の内容は壊れない
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        # fcntl のロックはプロセス単位なので、同じプロセス内のスレッド間はこちらで排他する
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_hash(key: str) -> int:
+        # 0 は空きスロットを表す
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+    def acquire(self, key: str, cost: float = 1.0) -> float:
+        if not self.enabled:
+            return 0.0
+        key_hash = self.key_hash(key)
+        offset = (key_hash % self.slots) * SLOT_SIZE
+        with self._lock:
+            self._fcntl.lockf(self._fd, self._fcntl.LOCK_EX, SLOT_SIZE, offset, os.SEEK_SET)
+            try:
+                now = self._clock()
+                stored_hash, tokens, updated_at = SLOT.unpack_from(self._map, offset)
+                if stored_hash != key_hash:
+                    tokens, updated_at = self.capacity, now
+                tokens, retry_after = self._take(tokens, updated_at, now, cost)
+                SLOT.pack_into(self._map, offset, key_hash, tokens, now)
+            finally:
+                self._fcntl.lockf(self._fd, self._fcntl.LOCK_UN, SLOT_SIZE, offset, os.SEEK_SET)
+        return retry_after
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "slots": self.slots}
+
+
+def create_rate_limiter(
+    backend: str,
+    count: int,
+    window_seconds: float,
+    max_keys: int,
+    shared_path: str,
+) -> RateLimiter:
+    """window_seconds あたり count 回 (バースト count 回まで) のレート制限を生成
+
+    backend は "memory" (ワーカーごと) または "shared" (shared_path を全ワーカーで共有)。
+    """
+    refill_per_second = count / window_seconds if window_seconds > 0 else 0.0
+    if backend == "shared":
+        return SharedTokenBucketLimiter(shared_path, count, refill_per_second, slots=max_keys)
+    return TokenBucketLimiter(count, refill_per_second, max_keys=max_keys)
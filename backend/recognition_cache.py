@@ -0,0 +1,104 @@
+import math
+from collections import OrderedDict
+from typing import Any, Optional
+
+import numpy as np
+
+# 縮小画像を比べる区画の一辺 (画素)。64x64 の縮小画像なら 16x16 区画で、牌1枚がおおよそ1〜2列分になる
+THUMBNAIL_BLOCK = 4
+
+
+def block_difference(a: bytes, b: bytes, block: int = THUMBNAIL_BLOCK) -> float:
+    """正方形のグレースケール縮小画像どうしの、区画ごとの平均輝度差 (0〜255) の最大値
+
+    全体の明るさの違いは差し引く。再エンコードや軽い明るさの違いでは小さく、
+    牌が1枚入れ替わるとその区画だけ大きくなる。
+    """
+    if len(a) != len(b):
+        return math.inf
+    side = math.isqrt(len(a))
+    x = np.frombuffer(a, dtype=np.uint8).reshape(side, side).astype(np.float32)
+    y = np.frombuffer(b, dtype=np.uint8).reshape(side, side).astype(np.float32)
+    diff = np.abs((x - x.mean()) - (y - y.mean()))
+    blocks = side // block
+    diff = diff[:blocks * block, :blocks * block].reshape(blocks, block, blocks, block)
+    return float(diff.mean(axis=(1, 3)).max())
+
+
+class PerceptualCache:
+    """知覚ハッシュで引く認識結果キャッシュ
+
+    ハミング距離が max_distance 以下の画像を候補とし、縮小画像 (thumbnail) の区画ごとの差が
+    max_block_diff 以下のものを同一とみなす。64bit の知覚ハッシュだけでは牌1枚の違う写真
+    (ツモ・打牌後の撮り直し) も一致してしまうため、区画単位で確かめる。
+    ローカル認識の牌の並び (tiles) が両方にある場合は、並びが同じことも条件にする (これだけでは一致としない)。
+    件数は小さい前提なので線形走査で最も近いエントリを探す。
+    """
+
+    def __init__(self, max_size: int, max_distance: int, max_block_diff: float = 8.0) -> None:
+        self.max_size = max_size
+        self.max_distance = max_distance
+        self.max_block_diff = max_block_diff
+        self._entries: OrderedDict[tuple[int, Optional[bytes], Optional[tuple]], Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(
+        self, image_hash: int, thumbnail: Optional[bytes] = None, tiles: Optional[tuple] = None,
+    ) -> Optional[Any]:
+        if self.max_size <= 0:
+            return None
+
+        best_key = None
+        best_score = (self.max_distance + 1, math.inf)
+        for key in self._entries:
+            entry_hash, entry_thumbnail, entry_tiles = key
+            distance = (entry_hash ^ image_hash).bit_count()
+            if distance > self.max_distance:
+                continue
+            if tiles is not None and entry_tiles is not None and tiles != entry_tiles:
+                continue
+            block_diff = 0.0
+            if thumbnail is not None and entry_thumbnail is not None:
+                block_diff = block_difference(thumbnail, entry_thumbnail)
+                if block_diff > self.max_block_diff:
+                    continue
+            if (distance, block_diff) < best_score:
+                best_key, best_score = key, (distance, block_diff)
+
+        if best_key is None:
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(best_key)
+        self.hits += 1
+        return self._entries[best_key]
+
+    def set(
+        self, image_hash: int, value: Any, thumbnail: Optional[bytes] = None, tiles: Optional[tuple] = None,
+    ) -> None:
+        if self.max_size <= 0:
+            return
+        key = (image_hash, thumbnail, tiles)
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "max_distance": self.max_distance,
+            "max_block_diff": self.max_block_diff,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
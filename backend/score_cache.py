@@ -0,0 +1,277 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Iterable, Optional
+
+
+class ScoreCache:
+    """/calculate の計算結果を保持するインメモリ LRU キャッシュ (TTL 付き)"""
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_seconds: float = 0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            stored_at, value = entry
+            if self.ttl_seconds > 0 and self._clock() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (self._clock(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class DiskScoreCache:
+    """計算結果 (シリアライズ済みの文字列) を SQLite (WAL) に保持するキャッシュ
+
+    同じホストの全ワーカーで1つのファイルを共有し、再起動やデプロイ後も残る。
+    保存時と version が異なる場合 (mahjong ライブラリの更新など) は開いた時点で全件破棄する。
+    件数が max_entries を超えた分は書き込みの古い順に破棄する (読み込みでは順序を更新しない)。
+    ロック待ちなどで読み書きできない場合はキャッシュ無しとして扱う。
+    読み書きはロック待ちでブロックするので、イベントループからは別スレッドで呼ぶ。
+    """
+
+    # 何回の書き込みごとに上限を超えた分を破棄するか
+    EVICT_EVERY = 64
+
+    def __init__(
+        self, path: str, max_entries: int, version: str, busy_timeout_ms: int = 100,
+        connect_timeout: float = 10.0,
+    ) -> None:
+        self.path = path
+        self.max_entries = max_entries
+        self.version = version
+        self.busy_timeout_ms = busy_timeout_ms
+        self.connect_timeout = connect_timeout
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._pending_evict = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+        self.invalidated = False
+        self.open()
+
+    def _connect(self) -> sqlite3.Connection:
+        # fork したワーカーでは親プロセスの接続を使わずに開き直す
+        if self._connection is not None and self._pid == os.getpid():
+            return self._connection
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # 初期化 (BEGIN IMMEDIATE) は他のワーカーや warm_score_cache.py の書き込みを最大 connect_timeout 秒待つ
+        connection = sqlite3.connect(
+            self.path, timeout=self.connect_timeout, isolation_level=None, check_same_thread=False,
+        )
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            connection.execute("CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            row = connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+            if row is None or row[0] != self.version:
+                connection.execute("DELETE FROM scores")
+                connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (self.version,))
+                self.invalidated = row is not None
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            connection.close()
+            raise
+        connection.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        self._connection = connection
+        self._pid = os.getpid()
+        return connection
+
+    def open(self) -> bool:
+        """このプロセスの接続を開く (fork したワーカーで最初のリクエストより前に呼ぶ)
+
+        開けなかった場合は False を返し、次の読み書きで開き直す。
+        """
+        try:
+            with self._lock:
+                self._connect()
+        except sqlite3.Error:
+            self.errors += 1
+            return False
+        return True
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_many([key])[0]
+
+    def get_many(self, keys: list[str]) -> list[Optional[str]]:
+        """keys と同じ順に値を返す (無いものは None)"""
+        try:
+            with self._lock:
+                connection = self._connect()
+                rows = [
+                    connection.execute("SELECT value FROM scores WHERE key = ?", (key,)).fetchone() for key in keys
+                ]
+        except sqlite3.Error:
+            self.errors += 1
+            return [None] * len(keys)
+        values = [row[0] if row is not None else None for row in rows]
+        found = sum(value is not None for value in values)
+        self.hits += found
+        self.misses += len(values) - found
+        return values
+
+    def set(self, key: str, value: str) -> None:
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Iterable[tuple[str, str]]) -> int:
+        """まとめて1トランザクションで書き込み、書き込んだ件数を返す"""
+        items = list(items)
+        if not items:
+            return 0
+        try:
+            with self._lock:
+                connection = self._connect()
+                connection.execute("BEGIN")
+                try:
+                    connection.executemany("INSERT OR REPLACE INTO scores (key, value) VALUES (?, ?)", items)
+                    self._pending_evict += len(items)
+                    if self._pending_evict >= self.EVICT_EVERY:
+                        self._evict(connection)
+                    connection.execute("COMMIT")
+                except BaseException:
+                    connection.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error:
+            self.errors += 1
+            return 0
+        self.writes += len(items)
+        return len(items)
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        # 書き込みのたびに rowid が増えるので、最新から max_entries 件より古い行を消す
+        connection.execute(
+            "DELETE FROM scores WHERE rowid <= (SELECT max(rowid) FROM scores) - ?", (self.max_entries,),
+        )
+        self._pending_evict = 0
+
+    def clear(self) -> None:
+        with self._lock:
+            self._connect().execute("DELETE FROM scores")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connect().execute("SELECT count(*) FROM scores").fetchone()[0]
+
+    def size(self) -> Optional[int]:
+        """件数 (ロック待ちや破損などで数えられない場合は None)"""
+        try:
+            return len(self)
+        except sqlite3.Error:
+            self.errors += 1
+            return None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "path": self.path,
+            "size": self.size(),
+            "max_entries": self.max_entries,
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "errors": self.errors,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def make_fingerprint(
+    hand_counts: list[int],
+    win_tile: int,
+    melds: list[tuple[str, bool, list[int]]],
+    dora_counts: list[int],
+    player_wind: int,
+    round_wind: int,
+    flags: tuple[bool, ...],
+) -> str:
+    """手牌・和了牌・副露・ドラ・風・各種フラグから正規化したキャッシュキーを生成
+
+    牌は34種の枚数ベクトルで表すため、入力文字列の並び順に依存しない。
+    """
+    meld_keys = sorted(
+        f"{meld_type}{int(opened)}{''.join(map(str, counts))}"
+        for meld_type, opened, counts in melds
+    )
+    return "|".join([
+        "".join(map(str, hand_counts)),
+        str(win_tile),
+        ",".join(meld_keys),
+        "".join(map(str, dora_counts)),
+        f"{player_wind}{round_wind}",
+        "".join("1" if flag else "0" for flag in flags),
+    ])
@@ -1,5 +1,7 @@
 from typing import Optional
 
+import numpy as np
+
 
 def apply_score_to_scores(
     scores: list[int],
@@ -52,3 +54,114 @@ def apply_score_to_scores(
         "scores": updated_scores,
         "diff": [updated_scores[i] - scores[i] for i in range(4)],
     }
+
+
+def _as_event_array(values, size: int, name: str) -> np.ndarray:
+    array = np.broadcast_to(np.asarray(values, dtype=np.int64), (size,))
+    if name.endswith("_index") and ((array < 0) | (array > 3)).any():
+        raise ValueError(f"{name} must be between 0 and 3")
+    return array
+
+
+def score_diffs_batch(
+    winner_index,
+    dealer_index,
+    main_cost,
+    additional_cost,
+    is_tsumo,
+    honba=0,
+    riichi_sticks=0,
+    loser_index=None,
+) -> np.ndarray:
+    """和了結果の配列から、各結果の4人分の点数移動 (shape=(N, 4)) をまとめて計算
+
+    各引数は長さ N の配列 (またはスカラー)。ロンの結果には loser_index が必要で、
+    ツモの結果の loser_index は無視される (-1 などを入れてよい)。
+    計算内容は apply_score_to_scores と同じ。
+    """
+    size = np.broadcast(*(np.atleast_1d(value) for value in (
+        winner_index, dealer_index, main_cost, additional_cost, is_tsumo, honba, riichi_sticks,
+    ))).shape[0]
+    is_tsumo = np.broadcast_to(np.asarray(is_tsumo, dtype=bool), (size,))
+    winner = _as_event_array(winner_index, size, "winner_index")
+    dealer = _as_event_array(dealer_index, size, "dealer_index")
+    main_cost = _as_event_array(main_cost, size, "main_cost")
+    additional_cost = _as_event_array(additional_cost, size, "additional_cost")
+    honba = _as_event_array(honba, size, "honba")
+    riichi_sticks = _as_event_array(riichi_sticks, size, "riichi_sticks")
+
+    is_ron = ~is_tsumo
+    loser = np.full(size, -1, dtype=np.int64) if loser_index is None else np.asarray(loser_index, dtype=np.int64)
+    loser = np.where(is_ron, np.broadcast_to(loser, (size,)), 0)
+    if (is_ron & ((loser < 0) | (loser > 3))).any():
+        raise ValueError("loser_index is required for ron")
+
+    players = np.arange(4)
+    diff = np.zeros((size, 4), dtype=np.int64)
+
+    # ツモ: 和了者以外の3人が支払う (親の和了なら全員 main、子の和了なら親 main・子 additional)
+    is_winner = players == winner[:, None]
+    pays_main = (winner == dealer)[:, None] | (players == dealer[:, None])
+    payment = np.where(pays_main, main_cost[:, None], additional_cost[:, None]) + (honba * 100)[:, None]
+    payment = np.where(is_winner | is_ron[:, None], 0, payment)
+    diff -= payment
+    tsumo_gain = np.where(is_tsumo, payment.sum(axis=1) + riichi_sticks * 1000, 0)
+
+    # ロン: 放銃者のみが支払う。和了者と放銃者が同じでも加算・減算の両方を適用する
+    ron_loss = np.where(is_ron, main_cost + honba * 300, 0)
+    ron_gain = np.where(is_ron, ron_loss + riichi_sticks * 1000, 0)
+    diff += np.where(is_winner, (tsumo_gain + ron_gain)[:, None], 0)
+    diff -= np.where(players == loser[:, None], ron_loss[:, None], 0)
+    return diff
+
+
+def apply_scores_batch(scores, **events) -> dict:
+    """shape=(N, 4) の持ち点に N 件の和了結果を1件ずつ対応させて適用
+
+    events は score_diffs_batch の引数。戻り値は apply_score_to_scores と同じ
+    {"scores", "diff"} で、それぞれ shape=(N, 4) の配列。
+    """
+    diff = score_diffs_batch(**events)
+    return {"scores": np.asarray(scores, dtype=np.int64) + diff, "diff": diff}
+
+
+def find_zero_sum_violations(diff, riichi_sticks=0) -> np.ndarray:
+    """点数移動の合計が供託リーチ棒の回収分と一致しない結果のインデックス"""
+    diff = np.asarray(diff, dtype=np.int64)
+    expected = np.broadcast_to(np.asarray(riichi_sticks, dtype=np.int64) * 1000, diff.shape[:1])
+    return np.flatnonzero(diff.sum(axis=1) != expected)
+
+
+def replay_games(initial_scores, game_index, **events) -> dict:
+    """複数の半荘の和了結果をまとめて再生し、各局後の持ち点と最終持ち点を返す
+
+    initial_scores は shape=(G, 4) の開始点、game_index は各結果が属する半荘の番号
+    (0..G-1)。同じ半荘の結果は配列内の順序で適用される。
+    点数移動は持ち点に依存しないため、半荘ごとの累積和で一度に計算できる。
+    """
+    initial_scores = np.asarray(initial_scores, dtype=np.int64)
+    game_index = np.asarray(game_index, dtype=np.int64)
+    diff = score_diffs_batch(**events)
+    violations = find_zero_sum_violations(diff, events.get("riichi_sticks", 0))
+    if violations.size:
+        raise ValueError(f"zero-sum check failed for results {violations.tolist()}")
+
+    if diff.shape[0] == 0:
+        return {"scores": initial_scores.copy(), "history": diff, "diff": diff}
+
+    # 半荘ごとに安定ソートして累積和を取り、各半荘の先頭までの累積を差し引く
+    order = np.argsort(game_index, kind="stable")
+    sorted_games = game_index[order]
+    cumulative = np.cumsum(diff[order], axis=0)
+    starts = np.flatnonzero(np.r_[True, sorted_games[1:] != sorted_games[:-1]])
+    group_lengths = np.diff(np.r_[starts, sorted_games.size])
+    offsets = np.repeat(cumulative[starts] - diff[order][starts], group_lengths, axis=0)
+
+    sorted_history = initial_scores[sorted_games] + cumulative - offsets
+    history = np.empty_like(diff)
+    history[order] = sorted_history
+
+    # 各半荘の最後の結果の後の持ち点が最終持ち点 (結果の無い半荘は開始点のまま)
+    final_scores = initial_scores.copy()
+    final_scores[sorted_games[starts]] = sorted_history[starts + group_lengths - 1]
+    return {"scores": final_scores, "history": history, "diff": diff}
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class ExecutorSaturated(Exception):
+    """実行中 + 待ち行列が上限に達している"""
+
+
+class TimingStats:
+    """所要時間の件数・合計・最大値"""
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "max_ms": self.max * 1000,
+        }
+
+
+class BoundedExecutor:
+    """同時実行数と待ち行列の深さを制限したスレッドプール
+
+    CPU を使う点数計算をイベントループから切り離すために使う。
+    上限を超えた投入は待たせずに ExecutorSaturated で即座に拒否する。
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, thread_name_prefix: str = "scoring") -> None:
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.thread_name_prefix = thread_name_prefix
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+        self.queue_wait = TimingStats()
+        self.execution = TimingStats()
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise ExecutorSaturated()
+            self._pending += 1
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix=self.thread_name_prefix
+                )
+            executor = self._executor
+
+        submitted_at = time.perf_counter()
+
+        def task() -> Any:
+            started_at = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                finished_at = time.perf_counter()
+                with self._lock:
+                    self.queue_wait.observe(started_at - submitted_at)
+                    self.execution.observe(finished_at - started_at)
+
+        future = executor.submit(task)
+        # クライアント切断でキャンセルされても、実際に処理が終わるまで枠を解放しない
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def _release(self, _future: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._pending,
+                "rejected": self.rejected,
+                "queue_wait": self.queue_wait.as_dict(),
+                "execution": self.execution.as_dict(),
+            }
@@ -0,0 +1,121 @@
+"""fork 前にウォームアップしてからワーカーを起動するサーバー
+
+使い方 (backend ディレクトリで): python serve.py [--host 0.0.0.0] [--port 8000] [--workers 4]
+
+uvicorn --workers はワーカーを spawn で起動するため、各ワーカーが import とウォームアップを
+やり直す。ここでは親プロセスで main を import して warm_up() を済ませ、待ち受けソケットを
+作ってから fork する。読み込んだモジュールやテンプレートのページはワーカー間で
+copy-on-write で共有され、各ワーカーは起動した時点で /ready が 200 を返す。
+親プロセスは落ちたワーカーを起動し直し、SIGTERM / SIGINT を全ワーカーに伝える。
+対局セッション (/games) はワーカーのメモリにあるため、複数ワーカーで起動するには
+GAME_SESSIONS_ENABLED=false にする必要がある。
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+
+import main
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(sock: socket.socket, args: argparse.Namespace) -> None:
+    config = uvicorn.Config(main.app, log_level=args.log_level, timeout_keep_alive=args.timeout_keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve_forked(sock: socket.socket, args: argparse.Namespace) -> None:
+    children: dict[int, float] = {}
+    stopping = False
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            status = 0
+            try:
+                run_worker(sock, args)
+            except BaseException as e:
+                print(f"worker {os.getpid()} failed: {e}")
+                status = 1
+            finally:
+                os._exit(status)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(args.workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started_at = children.pop(pid, None)
+        if stopping or started_at is None:
+            continue
+        print(f"worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+        # 起動直後に落ち続ける場合に fork を繰り返さないよう少し待つ
+        if time.monotonic() - started_at < 1:
+            time.sleep(1)
+        spawn()
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--timeout-keep-alive", type=int, default=5)
+    args = parser.parse_args()
+    if args.workers > 1 and main.GAME_SESSIONS_ENABLED:
+        parser.error(
+            "/games keeps sessions in each worker's memory, so other workers would return 404 for them; "
+            "set GAME_SESSIONS_ENABLED=false to run more than one worker"
+        )
+
+    main.warm_up()
+    if not main.warmup_state["ready"]:
+        raise SystemExit(f"warm-up failed: {main.warmup_state['error']}")
+    print(f"warm-up finished in {main.warmup_state['seconds']}s")
+
+    # SQLite の接続は fork をまたいで使えないので、親では閉じて各ワーカーで開き直させる
+    if main.score_disk_cache is not None:
+        main.score_disk_cache.close()
+
+    sock = bind_socket(args.host, args.port)
+    if args.workers <= 1:
+        run_worker(sock, args)
+        return
+    # 以降に作られるオブジェクトだけを GC の対象にし、共有ページへの書き込み (コピー) を減らす
+    gc.freeze()
+    serve_forked(sock, args)
+
+
+if __name__ == "__main__":
+    main_cli()
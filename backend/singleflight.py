@@ -0,0 +1,55 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """同じキーの処理が実行中なら、新しく実行せずにその結果を待って共有する
+
+    処理は別タスクで実行するため、最初の呼び出し元が切断 (キャンセル) されても
+    待っている他の呼び出し元には結果が届く。例外も全員に同じものが伝わる。
+    完了後はキーを破棄するので、結果を保持し続けるキャッシュとは併用する前提。
+    """
+
+    def __init__(self) -> None:
+        self._tasks: dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        self.calls += 1
+        task = self._tasks.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(self._run(key, fn))
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        # 失敗 (スレッドプールが満杯で 503 など) した処理に後続の呼び出しが相乗りしないよう、
+        # 完了のコールバックを待たずに、終わった時点でキーを破棄する
+        try:
+            return await fn()
+        finally:
+            if self._tasks.get(key) is asyncio.current_task():
+                del self._tasks[key]
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        # 開始前にキャンセルされた場合は _run の finally を通らない
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # 全員がキャンセルされて誰も結果を受け取らなかった場合の警告を抑える
+        if not task.cancelled():
+            task.exception()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._tasks),
+            "coalescing_rate": round(self.coalesced / self.calls, 4) if self.calls else 0.0,
+        }
@@ -0,0 +1,45 @@
+from fastapi.testclient import TestClient
+
+import main
+from benchmarks.bench_backend import compare_results, summarize
+from benchmarks.corpus import CATEGORIES, build_hand_corpus
+from benchmarks.fake_vision_server import create_app
+
+
+def test_corpus_is_deterministic_and_scores_as_expected():
+    corpus = build_hand_corpus(per_category=4, seed=3)
+
+    assert corpus == build_hand_corpus(per_category=4, seed=3)
+    assert [entry["category"] for entry in corpus] == [c for c in CATEGORIES for _ in range(4)]
+    for entry in corpus:
+        score = main.score_hand(main.CalculateRequest.model_validate(entry["request"]))
+        assert score.error is None
+        assert score.han == entry["expected"]["han"]
+    assert all(entry["expected"]["han"] >= 13 for entry in corpus if entry["category"] == "yakuman")
+
+
+def test_compare_results_flags_throughput_and_p95_regressions():
+    baseline = {"results": {"a": summarize([0.001] * 100, 0.1), "b": summarize([0.001] * 100, 0.1)}}
+    current = {"results": {
+        "a": summarize([0.001] * 95 + [0.01] * 5, 0.1),
+        "b": summarize([0.001] * 100, 0.2),
+        "c": summarize([1.0], 1.0),
+    }}
+
+    assert baseline["results"]["a"]["p50_ms"] == 1.0
+    regressions = compare_results(current, baseline, tolerance=0.15)
+
+    assert len(regressions) == 2
+    assert regressions[0].startswith("a: p95")
+    assert regressions[1].startswith("b: throughput")
+
+
+def test_fake_vision_server_returns_parseable_tiles():
+    client = TestClient(create_app(latency_ms=0, jitter_ms=0))
+    body = {"model": "gpt-4o", "messages": []}
+
+    content = client.post("/v1/chat/completions", json=body).json()["choices"][0]["message"]["content"]
+    streamed = client.post("/v1/chat/completions", json={**body, "stream": True}).text
+
+    assert len(main.parse_tile_response(content)) >= 14
+    assert streamed.rstrip().endswith("data: [DONE]")
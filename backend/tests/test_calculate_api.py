@@ -0,0 +1,113 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+CHUN_HAND = {
+    "hand": {"man": "123", "pin": "456", "sou": "789", "honors": "11777"},
+    "win_tile": {"honors": "7"},
+}
+
+
+@pytest.fixture
+def client():
+    main.score_cache.clear()
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def test_calculate_returns_cached_result_on_repeat(client):
+    first = client.post("/calculate", json=CHUN_HAND).json()
+    second = client.post("/calculate", json=CHUN_HAND).json()
+
+    assert first == second
+    assert first["han"] == 1
+    assert client.get("/stats").json()["score_cache"]["hits"] >= 1
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_batch_matches_single_and_isolates_failures(client, monkeypatch, workers):
+    monkeypatch.setattr(main, "CALCULATE_BATCH_WORKERS", workers)
+    monkeypatch.setattr(main, "CALCULATE_BATCH_CHUNK_SIZE", 2)
+    hands = [
+        CHUN_HAND,
+        {"hand": {"man": "12x"}, "win_tile": {"man": "1"}},
+        {**CHUN_HAND, "is_tsumo": True},
+        {"hand": {"man": "123"}, "win_tile": {"man": "1"}},
+        {**CHUN_HAND, "is_riichi": True, "player_wind": "south"},
+    ]
+
+    batch = client.post("/calculate/batch", json={"hands": hands}).json()["results"]
+    main.score_cache.clear()
+    single = [client.post("/calculate", json=hand).json() for hand in hands]
+
+    assert batch == single
+    assert batch[1]["error"] == "calculation_failed"
+    assert batch[3]["error"] == "hand_not_winning"
+    assert batch[4]["han"] == 2
+
+
+def test_batch_rejects_oversized_request(client, monkeypatch):
+    monkeypatch.setattr(main, "CALCULATE_BATCH_MAX_HANDS", 1)
+    response = client.post("/calculate/batch", json={"hands": [CHUN_HAND, CHUN_HAND]})
+    assert response.status_code == 413
+
+
+def test_waits_lists_every_winning_tile_with_ron_and_tsumo_scores(client):
+    request = {"hand": {"man": "23456789", "pin": "456", "sou": "99"}, "is_riichi": True, "player_wind": "south"}
+
+    response = client.post("/calculate/waits", json=request).json()
+
+    assert response["shanten"] == 0
+    assert [wait["tile"] for wait in response["waits"]] == ["1m", "4m", "7m"]
+    for wait in response["waits"]:
+        win_tile = {"man": wait["tile"][0]}
+        hand = {**request["hand"], "man": request["hand"]["man"] + wait["tile"][0]}
+        for mode in ("ron", "tsumo"):
+            expected = client.post(
+                "/calculate",
+                json={**request, "hand": hand, "win_tile": win_tile, "is_tsumo": mode == "tsumo"},
+            ).json()
+            assert wait[mode] == expected
+
+
+def test_waits_for_noten_and_invalid_hands(client):
+    noten = client.post("/calculate/waits", json={"hand": {"man": "123456789", "pin": "1357"}}).json()
+    assert noten["shanten"] == 1
+    assert noten["waits"] == []
+
+    invalid = client.post("/calculate/waits", json={"hand": {"man": "123"}}).json()
+    assert invalid["error"] == "invalid_tile_count"
+
+
+def test_scenarios_match_individual_calculations(client):
+    scenarios = [
+        {},
+        {"is_riichi": True},
+        {"is_tsumo": True, "label": "tsumo"},
+        {"player_wind": "south", "is_riichi": True, "is_ippatsu": True},
+        {"is_ippatsu": True},
+        {"is_riichi": True},
+    ]
+
+    matrix = client.post("/calculate/scenarios", json={**CHUN_HAND, "scenarios": scenarios}).json()
+
+    assert matrix["labels"][:3] == ["base", "is_riichi", "tsumo"]
+    for i, scenario in enumerate(scenarios):
+        overrides = {name: value for name, value in scenario.items() if name != "label"}
+        single = client.post("/calculate", json={**CHUN_HAND, **overrides}).json()
+        assert matrix["han"][i] == single["han"]
+        assert matrix["fu"][i] == single["fu"]
+        assert matrix["total"][i] == single["cost"].get("total", 0)
+        assert matrix["yaku"][i] == [yaku["name"] for yaku in single["yaku"]]
+        assert matrix["errors"][i] == single["error"]
+    assert matrix["errors"][4] == "ippatsu_without_riichi_not_allowed"
+
+
+def test_scenarios_report_invalid_hand_and_limit(client, monkeypatch):
+    invalid = {"hand": {"man": "12x"}, "win_tile": {"man": "1"}, "scenarios": [{}, {"is_tsumo": True}]}
+    assert client.post("/calculate/scenarios", json=invalid).json()["errors"] == ["calculation_failed"] * 2
+
+    monkeypatch.setattr(main, "CALCULATE_SCENARIOS_MAX", 1)
+    response = client.post("/calculate/scenarios", json={**CHUN_HAND, "scenarios": [{}, {}]})
+    assert response.status_code == 413
@@ -0,0 +1,85 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from benchmarks.corpus import build_hand_corpus
+from compact_hand import FLAGS, CompactFormatError, CompactHand, format_mpsz, format_packed, parse_mpsz, parse_packed
+
+
+@pytest.fixture
+def client():
+    main.score_cache.clear()
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+def slim(score: dict) -> dict:
+    cost = score["cost"]
+    return {
+        "han": score["han"],
+        "fu": score["fu"],
+        "cost": [cost.get("main", 0), cost.get("additional", 0), cost.get("total", 0)],
+        "yaku": [[yaku["name"], yaku["han"]] for yaku in score["yaku"]],
+        "error": score["error"],
+    }
+
+
+def test_flags_match_hand_config_flags():
+    assert FLAGS == main.HAND_CONFIG_FLAGS
+
+
+def test_parse_mpsz_adds_win_and_meld_tiles_to_hand():
+    hand = parse_mpsz("11z77z+7z/c789s/a1111m#5z@sert")
+
+    assert hand.to_request_dict() == {
+        "hand": {"man": "1111", "sou": "789", "honors": "11777"},
+        "win_tile": {"honors": "7"},
+        "melds": [
+            {"type": "chi", "tiles": {"sou": "789"}, "opened": True},
+            {"type": "ankan", "tiles": {"man": "1111"}, "opened": False},
+        ],
+        "dora_indicators": {"honors": "5"},
+        "player_wind": "south",
+        "round_wind": "east",
+        **{name: name in ("is_tsumo", "is_riichi") for name in FLAGS},
+    }
+    assert format_mpsz(hand) == "1177z+7z/c789s/a1111m#5z@setr"
+
+
+@pytest.mark.parametrize("text", ["123m", "12x+1m", "1m+1m/p12m", "1m+1m@xx", "8z+1m", "11111m+1m"])
+def test_parse_mpsz_rejects_invalid_input(text):
+    with pytest.raises(CompactFormatError):
+        parse_mpsz(text)
+
+
+def test_compact_forms_score_identically_to_json(client):
+    for entry in build_hand_corpus(per_category=6, seed=11):
+        hand = CompactHand.from_request(main.CalculateRequest.model_validate(entry["request"]))
+        mpsz = format_mpsz(hand)
+        packed = format_packed(hand)
+        assert parse_mpsz(mpsz) == hand
+        assert parse_packed(packed) == hand
+
+        expected = slim(client.post("/calculate", json=entry["request"]).json())
+        main.score_cache.clear()
+        text_result = client.post("/calculate/compact", content=mpsz, headers={"content-type": "text/plain"})
+        main.score_cache.clear()
+        packed_result = client.post(
+            "/calculate/compact", content=packed, headers={"content-type": "application/octet-stream"},
+        )
+        assert text_result.json() == expected, mpsz
+        assert packed_result.json() == expected, mpsz
+
+
+def test_compact_shares_cache_with_json_and_rejects_bad_bodies(client):
+    request = {"hand": {"man": "123", "pin": "456", "sou": "789", "honors": "11777"}, "win_tile": {"honors": "7"}}
+    client.post("/calculate", json=request)
+    hits = main.score_cache.hits
+
+    response = client.post("/calculate/compact", content="123m456p789s11z77z+7z", headers={"content-type": "text/plain"})
+
+    assert response.json()["han"] == 1
+    assert main.score_cache.hits == hits + 1
+    assert client.post("/calculate/compact", content="123m", headers={"content-type": "text/plain"}).status_code == 400
+    assert client.post("/calculate/compact", content=b"\x00" * 10, headers={"content-type": "application/octet-stream"}).status_code == 400
+    assert client.post("/calculate/compact", json=request).status_code == 415
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from game_replay import GameState, RonEvent
+
+
+def ndjson(*events) -> bytes:
+    return "".join(json.dumps(event) + "\n" for event in events).encode()
+
+
+def post_log(body, **kwargs) -> list[dict]:
+    with TestClient(main.app) as client:
+        response = client.post("/games/replay", content=body, **kwargs)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_replay_tracks_riichi_sticks_honba_and_dealer_rotation():
+    log = ndjson(
+        {"type": "riichi", "player_index": 1},
+        {"type": "riichi", "player_index": 1},
+        {"type": "draw", "tenpai_players": [1]},
+        {"type": "ron", "winner_index": 0, "loser_index": 2, "cost": {"main": 2900}},
+        {"type": "tsumo", "winner_index": 3, "cost": {"main": 1000, "additional": 500}},
+    )
+
+    # 1バイトずつ送っても行単位で処理される
+    records = post_log(iter([log[i:i + 1] for i in range(len(log))]))
+
+    riichi, duplicate, draw, ron, tsumo, summary = records
+    assert riichi["scores"] == [25000, 24000, 25000, 25000]
+    assert duplicate["rejected"] is True
+    # 親ノーテン → 親流れ、本場は積まれる
+    assert draw["scores"] == [24000, 27000, 24000, 24000]
+    assert (draw["dealer_index"], draw["honba"], draw["riichi_sticks"]) == (1, 1, 1)
+    # 子のロン: 2900 + 1本場 300 + 供託 1000
+    assert ron["diff"] == [4200, 0, -3200, 0]
+    assert (ron["dealer_index"], ron["honba"], ron["riichi_sticks"]) == (2, 0, 0)
+    assert tsumo["diff"] == [-500, -500, -1000, 2000]
+    assert tsumo["standings"] == [0, 1, 3, 2]
+    assert summary == {**{k: tsumo[k] for k in ("scores", "standings", "round", "honba", "riichi_sticks",
+                                                 "round_wind", "dealer_index", "ended", "end_reason")},
+                       "type": "summary", "events": 5}
+
+
+def test_replay_stops_at_invalid_line_and_after_game_end():
+    records = post_log(ndjson(
+        {"type": "ron", "winner_index": 0, "loser_index": 1, "cost": {"main": 48000}},
+        {"type": "draw", "tenpai_players": []},
+    ))
+    assert records[0]["ended"] is True
+    assert records[0]["end_reason"] == "トビ終了"
+    assert records[1] == {"line": 2, "type": "error", "error": "game already ended"}
+    assert records[2]["events"] == 1
+
+    records = post_log(b'{"type": "ron", "winner_index": 9}\n')
+    assert records[0]["type"] == "error"
+    assert records[1]["events"] == 0
+
+
+def test_south4_dealer_stays_only_when_on_top():
+    state = GameState(round=8, round_wind="south", dealer_index=3)
+    state.apply(RonEvent(type="ron", winner_index=3, loser_index=0, cost={"main": 11600}))
+    assert state.ended is True
+    assert state.end_reason == "南4局 親アガリやめ"
+
+
+def test_ron_from_self_is_rejected():
+    records = post_log(ndjson({"type": "ron", "winner_index": 2, "loser_index": 2, "cost": {"main": 8000}}))
+
+    assert records[0]["type"] == "error"
+    assert "loser_index must differ from winner_index" in records[0]["error"]
+    assert records[1]["scores"] == [25000] * 4
+    assert records[1]["events"] == 0
+
+
+@pytest.mark.parametrize("cost", [{"main": "a lot"}, {"main": None}, {"mian": 8000}, {"main": -1000}, [8000]])
+def test_malformed_cost_is_reported_with_its_line(cost):
+    records = post_log(ndjson(
+        {"type": "tsumo", "winner_index": 0, "cost": {"main": 1000, "additional": 500}},
+        {"type": "ron", "winner_index": 1, "loser_index": 2, "cost": cost},
+    ))
+
+    assert records[0]["type"] == "tsumo"
+    assert records[1]["type"] == "error" and records[1]["line"] == 2
+    assert records[2]["events"] == 1
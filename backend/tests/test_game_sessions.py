@@ -0,0 +1,88 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from game_replay import RiichiEvent, RonEvent, StartEvent
+from game_sessions import GameSessionNotFound, GameSessionStore
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_session_events_return_only_diffs_and_support_undo():
+    with TestClient(main.app) as client:
+        session = client.post("/games", json={"type": "start", "game_mode": "tonpu"}).json()
+        session_id = session["session_id"]
+        assert session["scores"] == [25000] * 4
+
+        riichi = client.post(f"/games/{session_id}/events", json={"type": "riichi", "player_index": 2}).json()
+        ron = client.post(
+            f"/games/{session_id}/events",
+            json={"type": "ron", "winner_index": 2, "loser_index": 0, "cost": {"main": 3900}},
+        ).json()
+        assert "scores" not in ron
+        assert riichi["diff"] == [0, 0, -1000, 0]
+        assert ron["diff"] == [-3900, 0, 4900, 0]
+        assert (ron["dealer_index"], ron["riichi_sticks"]) == (1, 0)
+        assert client.get(f"/games/{session_id}").json()["scores"] == [21100, 25000, 28900, 25000]
+
+        undone = client.post(f"/games/{session_id}/undo").json()
+        assert undone["scores"] == [25000, 25000, 24000, 25000]
+        assert (undone["dealer_index"], undone["riichi_sticks"]) == (0, 1)
+
+        assert client.delete(f"/games/{session_id}").status_code == 200
+        assert client.get(f"/games/{session_id}").status_code == 404
+
+
+def test_sessions_expire_and_survive_restart(tmp_path):
+    clock = FakeClock()
+    path = str(tmp_path / "sessions.json")
+    store = GameSessionStore(ttl_seconds=60, max_sessions=10, snapshot_path=path, clock=clock)
+    kept, _ = store.create(StartEvent(type="start"))
+    expired, _ = store.create(StartEvent(type="start"))
+    store.apply(kept, RiichiEvent(type="riichi", player_index=0))
+    store.apply(kept, RonEvent(type="ron", winner_index=1, loser_index=3, cost={"main": 1000}))
+
+    clock.now += 50
+    store.get(kept)
+    clock.now += 20
+    assert store.evict_expired() == 1
+    with pytest.raises(GameSessionNotFound):
+        store.get(expired)
+    assert store.save_snapshot() is True
+
+    restored = GameSessionStore(ttl_seconds=60, max_sessions=10, snapshot_path=path, clock=clock)
+    assert restored.load_snapshot() == 1
+    assert restored.get(kept).scores == [24000, 27000, 25000, 24000]
+    assert restored.undo(kept).scores == [24000, 25000, 25000, 25000]
+
+
+def test_corrupt_snapshot_is_set_aside_and_server_starts_empty(tmp_path, monkeypatch):
+    path = tmp_path / "sessions.json"
+    # 書き込み途中で落ちた場合のような途中で切れたファイル
+    path.write_text('{"version": 1, "sessions": {"abc": {"state": {"scores": [25', encoding="utf-8")
+    store = GameSessionStore(ttl_seconds=60, max_sessions=10, snapshot_path=str(path))
+    monkeypatch.setattr(main, "game_sessions", store)
+    monkeypatch.setattr(main, "GAME_SESSIONS_ENABLED", True)
+
+    with TestClient(main.app) as client:
+        response = client.post("/games", json={"type": "start"})
+
+    assert response.status_code == 200
+    assert (tmp_path / "sessions.json.corrupt").read_text(encoding="utf-8").startswith('{"version": 1')
+    assert len(store) == 1
+
+
+def test_games_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(main, "GAME_SESSIONS_ENABLED", False)
+
+    with TestClient(main.app) as client:
+        response = client.post("/games", json={"type": "start"})
+
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Game sessions are disabled"
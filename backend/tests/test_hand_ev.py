@@ -0,0 +1,126 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from hand_ev import EvSetup, max_turns, merge_shards, simulate
+
+# 1z 単騎待ち。他家に 1z が2枚見えているので、見えていない 120 枚のうち和了牌は1枚だけ。
+# 他家は和了牌を必ず切り、他家の和了も無いものとして確率を厳密に計算できるようにする
+TANKI_HAND = {
+    "hand": {"man": "123", "pin": "456", "sou": "789234", "honors": "1"},
+    "visible": {"honors": "11"},
+    "dora_indicators": {"man": "5"},
+    "deal_in_rate": 1,
+    "opponent_win_rate": 0,
+}
+SHANPON_HAND = {"hand": {"man": "234567", "pin": "234", "sou": "5566"}}
+# 5s-8s の両面待ち (タンヤオ無し、平和のみ)
+RYANMEN_HAND = {"hand": {"man": "234", "pin": "567", "sou": "2346799"}, "dora_indicators": {"honors": "1"}}
+
+
+def test_simulate_is_deterministic_per_seed_and_shard():
+    setup = EvSetup(
+        unseen=tuple(tile for tile in range(34) for _ in range(3)), ron_tiles=(4, 13), tsumo_tiles=(4, 13, 27),
+        hand_counts=(1,) * 13 + (0,) * 21, turns=10, riichi=True, ura_indicators=1,
+    )
+
+    first = simulate(setup, seed=7, shard=0, simulations=3000)
+    assert simulate(setup, seed=7, shard=0, simulations=3000) == first
+    assert simulate(setup, seed=7, shard=1, simulations=3000) != first
+    merged = merge_shards([first, simulate(setup, seed=7, shard=1, simulations=3000)])
+    assert merged.simulations == 6000
+    assert sum(merged.counts.values()) <= 6000
+
+
+def test_win_rate_matches_exact_probability_for_riichi_and_dama(monkeypatch):
+    monkeypatch.setattr(main, "CALCULATE_BATCH_WORKERS", 0)
+
+    with TestClient(main.app) as client:
+        dama = client.post("/calculate/ev", json={**TANKI_HAND, "simulations": 20000}).json()
+        riichi = client.post("/calculate/ev", json={**TANKI_HAND, "is_riichi": True, "simulations": 20000}).json()
+
+    assert dama["waits"] == ["1z"] and dama["complete"]
+    # 役が無いのでダマではツモ (12 巡で自分が引く 12 枚) しか和了できない。リーチならロンも含めて 48 枚
+    assert dama["ron_rate"] == 0
+    assert dama["win_rate"] == pytest.approx(12 / 120, abs=0.01)
+    assert riichi["win_rate"] == pytest.approx(48 / 120, abs=0.02)
+    assert riichi["win_rate_ci"][0] <= riichi["win_rate"] <= riichi["win_rate_ci"][1]
+    assert sum(bucket["probability"] for bucket in riichi["distribution"]) == pytest.approx(riichi["win_rate"])
+    assert riichi["expected_value"] > dama["expected_value"]
+
+
+def test_process_pool_gives_same_result_as_single_process(monkeypatch):
+    request = {**SHANPON_HAND, "is_riichi": True, "simulations": 6000, "seed": 3, "time_budget_seconds": 30}
+    monkeypatch.setattr(main, "CALCULATE_EV_TIME_BUDGET_SECONDS", 30)
+    monkeypatch.setattr(main, "CALCULATE_EV_SHARD_SIZE", 1000)
+
+    with TestClient(main.app) as client:
+        monkeypatch.setattr(main, "CALCULATE_BATCH_WORKERS", 0)
+        single = client.post("/calculate/ev", json=request).json()
+        monkeypatch.setattr(main, "CALCULATE_BATCH_WORKERS", 2)
+        pooled = client.post("/calculate/ev", json=request).json()
+    main.reset_batch_executor()
+
+    assert single["complete"] and single["simulations"] == 6000
+    assert pooled == single
+
+
+def test_furiten_time_budget_and_invalid_hands(monkeypatch):
+    monkeypatch.setattr(main, "CALCULATE_BATCH_WORKERS", 0)
+    monkeypatch.setattr(main, "CALCULATE_EV_SHARD_SIZE", 1000)
+
+    with TestClient(main.app) as client:
+        furiten = client.post("/calculate/ev", json={**SHANPON_HAND, "discards": {"sou": "5"}}).json()
+        rushed = client.post(
+            "/calculate/ev", json={**SHANPON_HAND, "simulations": 200000, "time_budget_seconds": 0.001},
+        ).json()
+        not_tenpai = client.post("/calculate/ev", json={"hand": {"man": "1357", "pin": "2468", "sou": "13579"}})
+        too_many = client.post("/calculate/ev", json={**SHANPON_HAND, "simulations": 10 ** 9})
+
+    assert furiten["furiten"] and furiten["ron_rate"] == 0 and furiten["tsumo_rate"] > 0
+    assert not rushed["complete"] and 0 < rushed["simulations"] < 200000
+    assert not_tenpai.json()["error"] == "not_tenpai"
+    assert too_many.status_code == 413
+
+
+def test_dead_wall_and_opponent_hands_are_not_drawn():
+    # 見えていない 120 枚 - 他家の手牌 39 枚 - 表示牌以外の王牌 13 枚 = 68 枚 = 17 巡
+    assert max_turns(120, dora_indicators=1) == 17
+    assert max_turns(50, dora_indicators=1) == 0
+
+
+def test_standard_ryanmen_win_rate_is_plausible(monkeypatch):
+    monkeypatch.setattr(main, "CALCULATE_BATCH_WORKERS", 0)
+
+    with TestClient(main.app) as client:
+        riichi = client.post("/calculate/ev", json={**RYANMEN_HAND, "is_riichi": True}).json()
+        dama = client.post("/calculate/ev", json={**RYANMEN_HAND}).json()
+
+    # 残り 12 巡の先制両面リーチの和了率はおおむね 5〜6 割。ダマは他家が降りないぶん高い
+    assert riichi["waits"] == ["5s", "8s"]
+    assert 0.5 <= riichi["win_rate"] <= 0.65
+    assert 0.6 <= dama["win_rate"] <= 0.8
+    # リーチ後は他家が降りるので、和了のうちツモの割合が半分前後になる
+    assert 0.4 <= riichi["tsumo_rate"] / riichi["win_rate"] <= 0.65
+    assert dama["tsumo_rate"] < dama["ron_rate"]
+    assert riichi["expected_value"] > dama["expected_value"]
+
+
+def test_ura_dora_examples_add_the_counted_han_and_shift_the_distribution():
+    request = main.EvRequest.model_validate({**RYANMEN_HAND, "is_riichi": True})
+    response, setup = main.prepare_ev(request)
+    merged = merge_shards([simulate(setup, seed=0, shard=0, simulations=20000)])
+    tiles, melds, dora_indicators = main.convert_tiles(request)
+    calculator = main.HandCalculator()
+
+    assert {outcome[3] for outcome in merged.counts} >= {0, 1, 2}
+    for outcome, ura in merged.ura_examples.items():
+        tile_34, is_tsumo, is_ippatsu, ura_han = outcome
+        args = (request, calculator, tiles, melds, dora_indicators, tile_34, is_tsumo, is_ippatsu)
+        assert main.score_ev_win(*args, ura).han - main.score_ev_win(*args).han == ura_han
+
+    with_ura = main.summarize_ev(request, response.model_copy(deep=True), [merged], 20000)
+    merged.ura_examples = {outcome: () for outcome in merged.ura_examples}
+    without_ura = main.summarize_ev(request, response.model_copy(deep=True), [merged], 20000)
+    assert with_ura.win_rate == without_ura.win_rate
+    assert with_ura.expected_value > without_ura.expected_value * 1.1
@@ -0,0 +1,129 @@
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+from mahjong.agari import Agari
+from mahjong.shanten import Shanten
+
+import main
+from build_hand_tables import build_distance_table
+from hand_tables import HandTables, write_tables
+
+
+@pytest.fixture(scope="module")
+def tables(tmp_path_factory):
+    path = tmp_path_factory.mktemp("hand_tables") / "hand_tables.bin"
+    suit = build_distance_table(9, allow_sequences=True)
+    honor = build_distance_table(7, allow_sequences=False)
+    write_tables(path, suit.reshape(-1), honor.reshape(-1))
+    return HandTables.load(path)
+
+
+def near_complete_hands(seed: int, count: int):
+    """和了形 (副露数 0-3) から最大2枚入れ替えた手牌を生成"""
+    rng = random.Random(seed)
+    while count:
+        meld_count = rng.choice([0, 0, 1, 2, 3])
+        tiles_34 = [0] * 34
+        for _ in range(4 - meld_count):
+            if rng.random() < 0.5:
+                start = rng.randrange(3) * 9 + rng.randrange(7)
+                for tile_34 in range(start, start + 3):
+                    tiles_34[tile_34] += 1
+            else:
+                tiles_34[rng.randrange(34)] += 3
+        tiles_34[rng.randrange(34)] += 2
+        for _ in range(rng.randrange(3)):
+            tiles_34[rng.choice([i for i in range(34) if tiles_34[i]])] -= 1
+            tiles_34[rng.randrange(34)] += 1
+        if max(tiles_34) <= 4:
+            count -= 1
+            yield tiles_34, meld_count
+
+
+def test_tables_match_mahjong_library(tables):
+    agari = Agari()
+    shanten = Shanten()
+    for tiles_34, meld_count in near_complete_hands(seed=0, count=2000):
+        assert tables.is_agari(tiles_34, meld_count) == agari.is_agari(tiles_34)
+        assert tables.shanten(tiles_34) == shanten.calculate_shanten(tiles_34)
+
+        tiles_34[max(range(34), key=lambda i: tiles_34[i])] -= 1
+        expected_waits = []
+        for tile_34 in range(34):
+            if tiles_34[tile_34] < 4:
+                tiles_34[tile_34] += 1
+                if agari.is_agari(tiles_34):
+                    expected_waits.append(tile_34)
+                tiles_34[tile_34] -= 1
+        assert tables.waits(tiles_34, meld_count) == expected_waits
+        assert tables.shanten(tiles_34) == shanten.calculate_shanten(tiles_34)
+
+
+def test_special_hand_waits(tables):
+    kokushi = [0] * 34
+    for tile_34 in (0, 8, 9, 17, 18, 26, 27, 28, 29, 30, 31, 32, 33):
+        kokushi[tile_34] = 1
+    assert tables.waits(kokushi) == [0, 8, 9, 17, 18, 26, 27, 28, 29, 30, 31, 32, 33]
+    assert tables.shanten(kokushi) == 0
+
+    chiitoitsu = [0] * 34
+    for tile_34 in (0, 4, 10, 15, 20, 30):
+        chiitoitsu[tile_34] = 2
+    chiitoitsu[33] = 1
+    assert tables.waits(chiitoitsu) == [33]
+    assert tables.waits(chiitoitsu, meld_count=1) == []
+
+
+def test_waits_endpoint_uses_tables(tables, monkeypatch):
+    request = {
+        "hand": {"man": "1112345678999", "pin": "", "sou": ""},
+        "melds": [],
+        "is_riichi": True,
+    }
+    with TestClient(main.app) as client:
+        monkeypatch.setattr(main, "hand_tables", None)
+        fallback = client.post("/calculate/waits", json=request).json()
+        monkeypatch.setattr(main, "hand_tables", tables)
+        table_based = client.post("/calculate/waits", json=request).json()
+
+    assert table_based == fallback
+    assert [wait["tile"] for wait in table_based["waits"]] == [f"{n}m" for n in range(1, 10)]
+
+
+def test_score_hand_rejects_non_winning_hands_like_the_library(tables, monkeypatch):
+    from benchmarks.corpus import build_hand_corpus
+
+    rng = random.Random(1)
+    requests = []
+    for hand in build_hand_corpus(per_category=6, seed=2):
+        request = hand["request"]
+        requests.append(request)
+        # 数牌を1枚だけ別の数字に変えて、和了形でなくす
+        suits = [suit for suit in ("man", "pin", "sou") if request["hand"].get(suit)]
+        if not suits:
+            continue
+        suit = rng.choice(suits)
+        digits = request["hand"][suit]
+        index = rng.randrange(len(digits))
+        changed = digits[:index] + str(int(digits[index]) % 9 + 1) + digits[index + 1:]
+        requests.append({**request, "hand": {**request["hand"], suit: changed}})
+    requests = [main.CalculateRequest.model_validate(request) for request in requests]
+
+    monkeypatch.setattr(main, "hand_tables", None)
+    expected = [main.score_hand(request) for request in requests]
+    monkeypatch.setattr(main, "hand_tables", tables)
+    calculated = 0
+    original = main.HandCalculator.estimate_hand_value
+
+    def counting(self, *args, **kwargs):
+        nonlocal calculated
+        calculated += 1
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(main.HandCalculator, "estimate_hand_value", counting)
+    assert [main.score_hand(request) for request in requests] == expected
+    not_winning = sum(result.error == "hand_not_winning" for result in expected)
+    assert not_winning > 0
+    # 和了形でない手牌の多くはライブラリを呼ばずに返している
+    assert calculated < len(requests) - not_winning // 2
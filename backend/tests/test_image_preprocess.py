@@ -0,0 +1,73 @@
+import asyncio
+import io
+
+import pytest
+from PIL import Image
+
+from image_preprocess import ImageTooLarge, InvalidImage, preprocess_image, read_upload_limited
+
+
+def make_image_bytes(size, image_format="PNG", exif=None):
+    output = io.BytesIO()
+    image = Image.effect_noise(size, 64).convert("RGB")
+    if exif is not None:
+        image.save(output, format=image_format, exif=exif)
+    else:
+        image.save(output, format=image_format)
+    return output.getvalue()
+
+
+class ChunkedUpload:
+    def __init__(self, data, size=None):
+        self.stream = io.BytesIO(data)
+        self.size = size
+        self.reads = 0
+
+    async def read(self, chunk_size=-1):
+        self.reads += 1
+        return self.stream.read(chunk_size)
+
+
+def test_downscales_to_max_edge_and_reencodes_jpeg():
+    data = make_image_bytes((2400, 1200))
+
+    prepared = preprocess_image(data, max_edge=800)
+
+    assert (prepared.width, prepared.height) == (800, 400)
+    assert prepared.content_type == "image/jpeg"
+    assert prepared.original_bytes == len(data)
+    assert prepared.processed_bytes < prepared.original_bytes
+    assert Image.open(io.BytesIO(prepared.data)).format == "JPEG"
+
+
+def test_applies_exif_orientation():
+    exif = Image.Exif()
+    exif[0x0112] = 6  # 90度回転
+    data = make_image_bytes((300, 100), image_format="JPEG", exif=exif)
+
+    prepared = preprocess_image(data, max_edge=1000, output_format="WEBP")
+
+    assert (prepared.width, prepared.height) == (100, 300)
+    assert prepared.content_type == "image/webp"
+
+
+def test_rejects_non_image_data():
+    with pytest.raises(InvalidImage):
+        preprocess_image(b"not an image", max_edge=800)
+
+
+def test_read_upload_aborts_once_limit_is_exceeded():
+    upload = ChunkedUpload(b"x" * 1000)
+
+    with pytest.raises(ImageTooLarge):
+        asyncio.run(read_upload_limited(upload, max_bytes=150, chunk_size=100))
+    assert upload.reads == 2
+
+
+def test_read_upload_uses_declared_size():
+    upload = ChunkedUpload(b"x" * 1000, size=1000)
+
+    with pytest.raises(ImageTooLarge):
+        asyncio.run(read_upload_limited(upload, max_bytes=500))
+    assert upload.reads == 0
+    assert asyncio.run(read_upload_limited(ChunkedUpload(b"abc"), max_bytes=3)) == b"abc"
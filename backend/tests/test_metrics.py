@@ -0,0 +1,146 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import metrics
+from metrics import Counter, Histogram, MetricsRegistry, RequestTrace, SlowRequestSampler
+
+CHUN_HAND = {
+    "hand": {"man": "123", "pin": "456", "sou": "789", "honors": "11777"},
+    "win_tile": {"honors": "7"},
+}
+
+
+@pytest.fixture
+def client():
+    main.score_cache.clear()
+    with TestClient(main.app) as test_client:
+        yield test_client
+    metrics.configure_sampling(0)
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.register(Histogram("latency_seconds", "Latency.", ("stage",), buckets=(0.1, 1.0)))
+    counter = registry.register(Counter("errors_total", "Errors.", ("type",)))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, "estimate")
+    counter.inc('say "hi"')
+
+    text = registry.render()
+
+    assert 'latency_seconds_bucket{stage="estimate",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{stage="estimate",le="1"} 3' in text
+    assert 'latency_seconds_bucket{stage="estimate",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{stage="estimate"} 4' in text
+    assert 'errors_total{type="say \\"hi\\""} 1' in text
+
+
+def test_sampler_keeps_only_slowest():
+    sampler = SlowRequestSampler(sample_rate=1, keep=2)
+    for duration in (5, 1, 9, 3):
+        sampler.record({"duration_ms": duration})
+
+    assert [entry["duration_ms"] for entry in sampler.slowest()] == [9, 5]
+
+
+def test_trace_without_sampling_only_updates_histograms():
+    metrics.configure_sampling(0)
+    before = metrics.STAGE_SECONDS.count("unit", "work")
+    trace = RequestTrace("unit")
+    with trace.stage("work"):
+        pass
+    trace.finish()
+
+    assert trace.stages is None
+    assert metrics.STAGE_SECONDS.count("unit", "work") == before + 1
+    assert metrics.IN_FLIGHT.value("unit") == 0
+    assert metrics.sampler.slowest() == []
+
+
+def test_calculate_records_stages_and_errors(client):
+    failed_before = metrics.ERRORS.value("calculate", "calculation_failed")
+
+    assert client.post("/calculate", json=CHUN_HAND).json()["han"] == 1
+    assert client.post("/calculate", json={"hand": {"man": "12x"}, "win_tile": {"man": "1"}}).json()["error"] == "calculation_failed"
+    text = client.get("/metrics").text
+
+    for stage in ("parse", "convert", "config", "estimate", "serialize"):
+        assert f'mahjong_stage_duration_seconds_count{{endpoint="calculate",stage="{stage}"}}' in text
+    assert 'mahjong_http_request_duration_seconds_count{method="POST",route="/calculate",status="200"}' in text
+    assert 'mahjong_in_flight_requests{endpoint="calculate"} 0' in text
+    assert metrics.ERRORS.value("calculate", "calculation_failed") == failed_before + 1
+    assert metrics.EXCEPTIONS.value("calculate", "ValueError") >= 1
+
+
+def test_sampled_requests_are_listed_slowest_first(client):
+    metrics.configure_sampling(1, keep=5, profile=True)
+    main.score_cache.clear()
+
+    client.post("/calculate", json=CHUN_HAND)
+    client.post("/calculate", json={**CHUN_HAND, "is_riichi": True})
+    slow = client.get("/metrics/slow").json()["requests"]
+
+    assert len(slow) == 2
+    assert slow[0]["duration_ms"] >= slow[1]["duration_ms"]
+    assert set(slow[0]["stages_ms"]) >= {"parse", "convert", "estimate", "serialize"}
+    assert "estimate_hand_value" in slow[0]["profile"]
+
+
+def test_concurrent_profiling_skips_instead_of_failing():
+    import threading
+
+    metrics.configure_sampling(1, keep=5, profile=True)
+    first, second = metrics.RequestTrace("calculate"), metrics.RequestTrace("calculate")
+    started, release = threading.Event(), threading.Event()
+    results = {}
+
+    def slow_work():
+        started.set()
+        release.wait(5)
+        return "first"
+
+    thread = threading.Thread(target=lambda: results.setdefault("first", first.profiled(slow_work)))
+    thread.start()
+    started.wait(5)
+    try:
+        # 1つ目の計測中に別スレッドからも profiled を呼ぶ
+        other = threading.Thread(target=lambda: results.setdefault("second", second.profiled(lambda: "second")))
+        other.start()
+        other.join(5)
+    finally:
+        release.set()
+        thread.join(5)
+        first.finish()
+        second.finish()
+        metrics.configure_sampling(0)
+
+    assert results == {"first": "first", "second": "second"}
+    assert "slow_work" in first.profile
+    assert second.profile is None
+
+
+def test_image_sizes_are_recorded_per_upload():
+    metrics.configure_sampling(1)
+    before = main.image_stats()
+    trace = RequestTrace("recognize")
+    trace.image_sizes(400_000, 90_000)
+    trace.finish()
+    sampled = metrics.sampler.slowest()
+    metrics.configure_sampling(0)
+
+    assert main.image_stats() == {
+        "images": before["images"] + 1,
+        "original_bytes": before["original_bytes"] + 400_000,
+        "processed_bytes": before["processed_bytes"] + 90_000,
+    }
+    assert 'mahjong_image_bytes_bucket{stage="processed",le="131072"}' in metrics.registry.render()
+    assert sampled[0]["original_bytes"] == 400_000 and sampled[0]["processed_bytes"] == 90_000
+
+
+def test_metric_without_samples_fails_at_construction():
+    class Incomplete(metrics.Metric):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete("incomplete", "Missing samples.")
@@ -1,9 +1,30 @@
 import pytest
-from score_engine import apply_score_to_scores
+from score_engine import apply_score_to_scores, apply_scores_batch
 
 
-def test_ron_basic_with_honba_and_riichi_sticks():
-    result = apply_score_to_scores(
+def apply_score_batched(scores, winner_index, dealer_index, cost, is_tsumo, honba=0, riichi_sticks=0, loser_index=None):
+    """apply_scores_batch を1件分だけ使い、apply_score_to_scores と同じ形で返す"""
+    result = apply_scores_batch(
+        [scores],
+        winner_index=[winner_index],
+        dealer_index=[dealer_index],
+        main_cost=[cost.get("main", 0)],
+        additional_cost=[cost.get("additional", 0)],
+        is_tsumo=[is_tsumo],
+        honba=[honba],
+        riichi_sticks=[riichi_sticks],
+        loser_index=[-1 if loser_index is None else loser_index],
+    )
+    return {"scores": result["scores"][0].tolist(), "diff": result["diff"][0].tolist()}
+
+
+@pytest.fixture(params=[apply_score_to_scores, apply_score_batched], ids=["scalar", "batch"])
+def apply_score(request):
+    return request.param
+
+
+def test_ron_basic_with_honba_and_riichi_sticks(apply_score):
+    result = apply_score(
         scores=[25000, 25000, 25000, 25000],
         winner_index=1,
         loser_index=2,
@@ -21,8 +42,8 @@ def test_ron_basic_with_honba_and_riichi_sticks():
     assert sum(result["diff"]) == 1000
 
 
-def test_tsumo_dealer():
-    result = apply_score_to_scores(
+def test_tsumo_dealer(apply_score):
+    result = apply_score(
         scores=[25000, 25000, 25000, 25000],
         winner_index=0,
         dealer_index=0,
@@ -36,8 +57,8 @@ def test_tsumo_dealer():
     assert sum(result["diff"]) == 0
 
 
-def test_tsumo_non_dealer_with_nonzero_dealer_index():
-    result = apply_score_to_scores(
+def test_tsumo_non_dealer_with_nonzero_dealer_index(apply_score):
+    result = apply_score(
         scores=[25000, 25000, 25000, 25000],
         winner_index=2,
         dealer_index=1,
@@ -51,9 +72,9 @@ def test_tsumo_non_dealer_with_nonzero_dealer_index():
     assert sum(result["diff"]) == 0
 
 
-def test_ron_requires_loser_index():
+def test_ron_requires_loser_index(apply_score):
     with pytest.raises(ValueError):
-        apply_score_to_scores(
+        apply_score(
             scores=[25000, 25000, 25000, 25000],
             winner_index=0,
             dealer_index=0,
@@ -0,0 +1,79 @@
+import multiprocessing
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from rate_limiter import RateLimiter, SharedTokenBucketLimiter, TokenBucketLimiter
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_refills_and_reports_retry_after():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(capacity=2, refill_per_second=0.5, clock=clock)
+
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == 0
+    assert limiter.acquire("a") == 2.0
+    assert limiter.acquire("b") == 0
+
+    clock.now += 2
+    assert limiter.acquire("a") == 0
+    assert limiter.stats()["rejected"] == 1
+
+
+def test_token_bucket_keeps_a_bounded_lru_of_keys():
+    limiter = TokenBucketLimiter(capacity=1, refill_per_second=0, max_keys=2)
+    for key in ("a", "b", "a", "c"):
+        limiter.acquire(key)
+
+    assert len(limiter) == 2
+    assert limiter.stats()["evictions"] == 1
+    # a は最近使われたので残り、b が破棄されている
+    assert limiter.acquire("a") > 0
+    assert limiter.acquire("b") == 0
+
+
+def acquire_in_child(path: str, results) -> None:
+    limiter = SharedTokenBucketLimiter(path, capacity=5, refill_per_second=0, slots=64)
+    results.put(sum(limiter.acquire("client") == 0 for _ in range(5)))
+
+
+def test_shared_limiter_holds_across_processes(tmp_path):
+    path = str(tmp_path / "limits.bin")
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=acquire_in_child, args=(path, results)) for _ in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    # 3プロセス合計でも容量の5回しか通らない
+    assert sum(results.get() for _ in workers) == 5
+
+
+def test_calculate_rate_limit_returns_429_with_retry_after(monkeypatch):
+    monkeypatch.setattr(main, "calculate_rate_limiter", TokenBucketLimiter(capacity=1, refill_per_second=0.25))
+    request = {"hand": {"man": "123"}, "win_tile": {"man": "1"}}
+
+    with TestClient(main.app) as client:
+        assert client.post("/calculate", json=request).status_code == 200
+        limited = client.post("/calculate", json=request)
+
+    assert limited.status_code == 429
+    assert limited.headers["Retry-After"] == "4"
+
+
+def test_limiter_without_acquire_fails_at_construction():
+    class Incomplete(RateLimiter):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete(capacity=1, refill_per_second=1)
@@ -0,0 +1,56 @@
+from recognition_cache import PerceptualCache
+
+
+def test_matches_within_hamming_distance():
+    cache = PerceptualCache(max_size=4, max_distance=2)
+    cache.set(0b1111_0000, "hand")
+
+    assert cache.get(0b1111_0011) == "hand"
+    assert cache.get(0b1111_0111) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_returns_closest_entry():
+    cache = PerceptualCache(max_size=4, max_distance=3)
+    cache.set(0b0000, "far")
+    cache.set(0b1110, "near")
+
+    assert cache.get(0b1111) == "near"
+
+
+def test_evicts_least_recently_used():
+    cache = PerceptualCache(max_size=2, max_distance=0)
+    cache.set(1, "a")
+    cache.set(2, "b")
+    cache.get(1)
+    cache.set(4, "c")
+
+    assert cache.get(2) is None
+    assert cache.get(1) == "a"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_near_match_requires_same_tiles_when_both_are_known():
+    cache = PerceptualCache(max_size=4, max_distance=4)
+    cache.set(0b1111_0000, "before", tiles=("1m", "2m"))
+
+    assert cache.get(0b1111_0001, tiles=("1m", "3m")) is None
+    assert cache.get(0b1111_0001, tiles=("1m", "2m")) == "before"
+    # 牌の並びは照合にだけ使い、並びが無い側はハッシュと縮小画像で判断する
+    assert cache.get(0b1111_0001) == "before"
+
+
+def test_near_match_requires_every_block_to_be_close():
+    cache = PerceptualCache(max_size=4, max_distance=4, max_block_diff=8)
+    thumbnail = bytes(range(256)) * 16
+    cache.set(0b1010, "hand", thumbnail=thumbnail)
+
+    # 全体が少し明るいだけなら一致
+    brighter = bytes(min(255, value + 5) for value in thumbnail)
+    assert cache.get(0b1011, thumbnail=brighter) == "hand"
+    # 4x4 の1区画だけが大きく違う (牌1枚の入れ替わり) 場合は一致しない
+    changed = bytearray(thumbnail)
+    for row in range(4):
+        changed[row * 64:row * 64 + 4] = bytes([255 - value for value in changed[row * 64:row * 64 + 4]])
+    assert cache.get(0b1010, thumbnail=bytes(changed)) is None
@@ -0,0 +1,206 @@
+import asyncio
+import sqlite3
+import time
+
+from fastapi.testclient import TestClient
+
+import main
+from main import CalculateRequest, calculate_fingerprint
+from score_cache import DiskScoreCache, ScoreCache
+from warm_score_cache import generated_requests, logged_requests, warm
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction_keeps_recently_used_entries():
+    cache = ScoreCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 3
+    assert stats["misses"] == 1
+
+
+def test_ttl_expiration():
+    clock = FakeClock()
+    cache = ScoreCache(max_size=10, ttl_seconds=60, clock=clock)
+    cache.set("a", 1)
+
+    clock.now = 59
+    assert cache.get("a") == 1
+
+    clock.now = 121
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+    assert len(cache) == 0
+
+
+def test_zero_size_disables_cache():
+    cache = ScoreCache(max_size=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert cache.stats()["misses"] == 0
+
+
+def test_fingerprint_ignores_tile_order_but_not_flags():
+    base = {
+        "hand": {"man": "123", "pin": "456", "sou": "789", "honors": "11777"},
+        "win_tile": {"honors": "7"},
+    }
+    shuffled = {
+        "hand": {"man": "321", "pin": "654", "sou": "987", "honors": "77711"},
+        "win_tile": {"honors": "7"},
+    }
+
+    fingerprint = calculate_fingerprint(CalculateRequest(**base))
+    assert fingerprint is not None
+    assert fingerprint == calculate_fingerprint(CalculateRequest(**shuffled))
+    assert fingerprint != calculate_fingerprint(CalculateRequest(**base, is_tsumo=True))
+    assert fingerprint != calculate_fingerprint(CalculateRequest(**base, player_wind="south"))
+
+
+def test_fingerprint_rejects_unparseable_tiles():
+    request = CalculateRequest(hand={"man": "12x"}, win_tile={"man": "1"})
+    assert calculate_fingerprint(request) is None
+
+
+def test_disk_cache_persists_and_is_invalidated_by_version(tmp_path):
+    path = str(tmp_path / "scores.sqlite3")
+    cache = DiskScoreCache(path, max_entries=10, version="1:mahjong-1.4.0")
+    cache.set("a", '{"han": 1}')
+    cache.close()
+
+    reopened = DiskScoreCache(path, max_entries=10, version="1:mahjong-1.4.0")
+    assert reopened.get("a") == '{"han": 1}'
+    assert reopened.get("b") is None
+    assert not reopened.invalidated
+    reopened.close()
+
+    upgraded = DiskScoreCache(path, max_entries=10, version="1:mahjong-1.5.0")
+    assert upgraded.invalidated
+    assert upgraded.get("a") is None
+    assert len(upgraded) == 0
+
+
+def test_disk_cache_evicts_oldest_writes_beyond_max_entries(tmp_path):
+    cache = DiskScoreCache(str(tmp_path / "scores.sqlite3"), max_entries=50, version="1")
+
+    cache.set_many((f"key{i}", str(i)) for i in range(200))
+
+    assert len(cache) == 50
+    assert cache.get("key149") is None
+    assert cache.get("key150") == "150"
+    assert cache.get("key199") == "199"
+
+
+def test_calculate_reads_through_disk_cache_shared_with_other_workers(tmp_path, monkeypatch):
+    path = str(tmp_path / "scores.sqlite3")
+    monkeypatch.setattr(main, "score_disk_cache", DiskScoreCache(path, 100, main.score_cache_version()))
+    request = {"hand": {"man": "123", "pin": "456", "sou": "789", "honors": "11777"}, "win_tile": {"honors": "7"}}
+    main.score_cache.clear()
+
+    with TestClient(main.app) as client:
+        first = client.post("/calculate", json=request).json()
+        # 別のワーカー (メモリキャッシュが空) を想定
+        main.score_cache.clear()
+        monkeypatch.setattr(main, "score_disk_cache", DiskScoreCache(path, 100, main.score_cache_version()))
+        computed = main.calculate_flight.calls
+        second = client.post("/calculate", json=request).json()
+        stats = client.get("/stats").json()["score_disk_cache"]
+
+    assert second == first
+    assert main.calculate_flight.calls == computed
+    assert stats["hits"] == 1
+    assert main.score_cache.get(calculate_fingerprint(CalculateRequest(**request))) is not None
+
+
+def test_warm_fills_cache_from_corpus_and_request_log(tmp_path):
+    cache = DiskScoreCache(str(tmp_path / "scores.sqlite3"), 1000, main.score_cache_version())
+    log = tmp_path / "requests.ndjson"
+    log.write_text(
+        '{"hand": {"man": "123", "pin": "456", "sou": "789", "honors": "11777"}, "win_tile": {"honors": "7"}}\n'
+        "123m456p789s11z77z+7z\n"
+        "not a hand\n",
+        encoding="utf-8",
+    )
+
+    summary = warm(cache, logged_requests(str(log)))
+    assert summary == {"read": 2, "invalid": 0, "duplicates": 1, "cached": 0, "computed": 1, "errors": 0}
+
+    corpus = list(generated_requests(per_category=2, seed=5))
+    summary = warm(cache, iter(corpus))
+    assert summary["computed"] == len(corpus)
+    again = warm(cache, iter(corpus))
+    assert again["cached"] == len(corpus) and again["computed"] == 0
+
+    request = CalculateRequest.model_validate(corpus[0])
+    cached = main.ScoreResult.model_validate_json(cache.get(calculate_fingerprint(request)))
+    assert cached == main.score_hand(request)
+
+
+def test_disk_cache_lock_wait_does_not_block_event_loop(tmp_path, monkeypatch):
+    path = str(tmp_path / "scores.sqlite3")
+    cache = DiskScoreCache(path, 100, main.score_cache_version(), busy_timeout_ms=500, connect_timeout=0.1)
+    monkeypatch.setattr(main, "score_disk_cache", cache)
+    score = main.ScoreResult(han=1, fu=30, cost={"main": 1000}, yaku=[])
+    # 別のプロセス (warm_score_cache.py など) が書き込みロックを持っている状態
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+
+    async def scenario():
+        store = asyncio.create_task(main.store_score("locked", score))
+        started = time.perf_counter()
+        await asyncio.sleep(0.05)
+        ticked = time.perf_counter() - started
+        await store
+        return ticked
+
+    try:
+        ticked = asyncio.run(scenario())
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+    assert ticked < 0.3
+    assert cache.errors == 1
+
+
+def test_workers_open_disk_cache_on_startup(tmp_path, monkeypatch):
+    cache = DiskScoreCache(str(tmp_path / "scores.sqlite3"), 100, main.score_cache_version())
+    # serve.py が fork 前に閉じた状態
+    cache.close()
+    monkeypatch.setattr(main, "score_disk_cache", cache)
+
+    with TestClient(main.app):
+        assert cache._connection is not None
+
+
+def test_stats_survive_unreadable_database(tmp_path, monkeypatch):
+    path = str(tmp_path / "scores.sqlite3")
+    cache = DiskScoreCache(path, 100, main.score_cache_version())
+    monkeypatch.setattr(main, "score_disk_cache", cache)
+    other = sqlite3.connect(path, isolation_level=None)
+    other.execute("DROP TABLE scores")
+    other.close()
+
+    with TestClient(main.app) as client:
+        response = client.get("/stats")
+
+    assert response.status_code == 200
+    stats = response.json()["score_disk_cache"]
+    assert stats["size"] is None
+    assert stats["errors"] == 1
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from score_engine import apply_score_to_scores, apply_scores_batch, find_zero_sum_violations, replay_games
+
+
+def random_events(rng: np.random.Generator, size: int) -> dict:
+    is_tsumo = rng.random(size) < 0.4
+    winner = rng.integers(0, 4, size)
+    loser = (winner + rng.integers(1, 4, size)) % 4
+    return {
+        "winner_index": winner,
+        "dealer_index": rng.integers(0, 4, size),
+        "main_cost": rng.choice([1000, 2000, 3900, 8000, 12000], size),
+        "additional_cost": rng.choice([0, 500, 1000, 2000, 4000], size),
+        "is_tsumo": is_tsumo,
+        "honba": rng.integers(0, 4, size),
+        "riichi_sticks": rng.integers(0, 3, size),
+        "loser_index": np.where(is_tsumo, -1, loser),
+    }
+
+
+def apply_scalar(scores: list[int], events: dict, i: int) -> dict:
+    return apply_score_to_scores(
+        scores=scores,
+        winner_index=int(events["winner_index"][i]),
+        dealer_index=int(events["dealer_index"][i]),
+        cost={"main": int(events["main_cost"][i]), "additional": int(events["additional_cost"][i])},
+        is_tsumo=bool(events["is_tsumo"][i]),
+        honba=int(events["honba"][i]),
+        riichi_sticks=int(events["riichi_sticks"][i]),
+        loser_index=None if events["is_tsumo"][i] else int(events["loser_index"][i]),
+    )
+
+
+def test_batch_matches_scalar_for_random_results():
+    rng = np.random.default_rng(0)
+    events = random_events(rng, 500)
+    scores = rng.integers(-10000, 60000, (500, 4))
+
+    batch = apply_scores_batch(scores, **events)
+
+    for i in range(500):
+        expected = apply_scalar(scores[i].tolist(), events, i)
+        assert batch["scores"][i].tolist() == expected["scores"]
+        assert batch["diff"][i].tolist() == expected["diff"]
+    assert find_zero_sum_violations(batch["diff"], events["riichi_sticks"]).size == 0
+
+
+def test_replay_games_matches_sequential_application():
+    rng = np.random.default_rng(1)
+    events = random_events(rng, 300)
+    game_index = rng.integers(0, 7, 300)
+    initial = np.full((7, 4), 25000)
+
+    replay = replay_games(initial, game_index, **events)
+
+    scores = initial.tolist()
+    for i, game in enumerate(game_index):
+        scores[game] = apply_scalar(scores[game], events, i)["scores"]
+        assert replay["history"][i].tolist() == scores[game]
+    assert replay["scores"].tolist() == scores
+
+
+def test_zero_sum_violations_and_invalid_indices():
+    diff = np.array([[-1000, 1000, 0, 0], [-1000, 2000, 0, 0], [0, 1000, 0, 0]])
+    assert find_zero_sum_violations(diff, [0, 0, 1]).tolist() == [1]
+
+    with pytest.raises(ValueError):
+        apply_scores_batch([[25000] * 4], winner_index=[4], dealer_index=[0], main_cost=[1000],
+                           additional_cost=[0], is_tsumo=[True])
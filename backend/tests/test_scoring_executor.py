@@ -0,0 +1,50 @@
+import asyncio
+import threading
+
+import pytest
+
+from scoring_executor import BoundedExecutor, ExecutorSaturated
+
+
+def test_rejects_when_workers_and_queue_are_full():
+    executor = BoundedExecutor(max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        first = asyncio.create_task(executor.run(release.wait))
+        second = asyncio.create_task(executor.run(lambda: "queued"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(lambda: "rejected")
+
+        release.set()
+        return await first, await second
+
+    try:
+        assert asyncio.run(scenario()) == (True, "queued")
+    finally:
+        executor.shutdown()
+
+    stats = executor.stats()
+    assert stats["rejected"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["execution"]["count"] == 2
+    assert stats["queue_wait"]["count"] == 2
+
+
+def test_exceptions_propagate_and_release_slot():
+    executor = BoundedExecutor(max_workers=1, max_queue=0)
+
+    def fail():
+        raise ValueError("boom")
+
+    async def scenario():
+        with pytest.raises(ValueError):
+            await executor.run(fail)
+        return await executor.run(lambda: 42)
+
+    try:
+        assert asyncio.run(scenario()) == 42
+    finally:
+        executor.shutdown()
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    executions = []
+
+    async def compute(value):
+        executions.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def scenario():
+        return await asyncio.gather(
+            flight.do("a", lambda: compute(1)),
+            flight.do("a", lambda: compute(1)),
+            flight.do("b", lambda: compute(2)),
+        )
+
+    assert asyncio.run(scenario()) == [2, 2, 4]
+    assert executions == [1, 2]
+    assert flight.stats() == {"calls": 3, "coalesced": 1, "in_flight": 0, "coalescing_rate": 0.3333}
+
+
+def test_failure_is_shared_and_next_call_runs_again():
+    flight = SingleFlight()
+    calls = 0
+
+    async def fail():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def scenario():
+        results = await asyncio.gather(flight.do("a", fail), flight.do("a", fail), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        with pytest.raises(RuntimeError):
+            await flight.do("a", fail)
+
+    asyncio.run(scenario())
+    assert calls == 2
+
+
+def test_cancelled_caller_does_not_cancel_waiters():
+    flight = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def scenario():
+        first = asyncio.create_task(flight.do("a", compute))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(flight.do("a", compute))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(scenario()) == "done"
+
+
+def test_failed_submit_does_not_poison_next_call(monkeypatch):
+    from fastapi import HTTPException
+    from fastapi.testclient import TestClient
+
+    import main
+
+    run_scoring = main.run_scoring
+    attempts = 0
+
+    async def saturated_once(fn, *args):
+        nonlocal attempts
+        attempts += 1
+        if attempts == 1:
+            raise HTTPException(status_code=503, detail="Server busy", headers={"Retry-After": "1"})
+        return await run_scoring(fn, *args)
+
+    monkeypatch.setattr(main, "run_scoring", saturated_once)
+    main.score_cache.clear()
+    request = {"hand": {"man": "123", "pin": "456", "sou": "789", "honors": "11777"}, "win_tile": {"honors": "7"}}
+
+    with TestClient(main.app) as client:
+        busy = client.post("/calculate", json=request)
+        assert len(main.calculate_flight) == 0
+        retried = client.post("/calculate", json=request)
+
+    assert busy.status_code == 503
+    assert retried.status_code == 200 and retried.json()["han"] > 0
+    assert attempts == 2
@@ -0,0 +1,75 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+# 自動スケールで増えたワーカーが受け付けを始めるまでの時間に直結するので、超えたら失敗させる
+IMPORT_BUDGET_SECONDS = 3.0
+
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "modules": sorted(m for m in ("openai", "PIL") if m in sys.modules)}))
+"""
+
+
+def test_import_main_stays_within_budget_and_defers_optional_subsystems():
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=60,
+        env={**os.environ, "OPENAI_API_KEY": "sk-test"},
+    )
+    assert result.returncode == 0, result.stderr
+    probe = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert probe["seconds"] < IMPORT_BUDGET_SECONDS
+    assert probe["modules"] == []
+
+
+def test_ready_reports_unavailable_until_warm_up_finishes(monkeypatch):
+    warm_up = main.warm_up
+    monkeypatch.setattr(main, "warmup_state", {"ready": False, "seconds": None, "error": None})
+    monkeypatch.setattr(main, "warm_up", lambda: None)
+
+    with TestClient(main.app) as client:
+        warming = client.get("/ready")
+        warm_up()
+        ready = client.get("/ready")
+
+    assert warming.status_code == 503
+    assert warming.json()["detail"] == "Warming up"
+    assert ready.status_code == 200
+    assert ready.json()["ready"] is True
+    assert ready.json()["warmup_seconds"] >= 0
+
+
+def test_serve_refuses_multiple_workers_while_game_sessions_are_enabled(monkeypatch):
+    import serve
+
+    monkeypatch.setattr(sys, "argv", ["serve.py", "--workers", "2"])
+    monkeypatch.setattr(main, "GAME_SESSIONS_ENABLED", True)
+    monkeypatch.setattr(main, "warm_up", lambda: pytest.fail("should not warm up"))
+
+    with pytest.raises(SystemExit) as exc_info:
+        serve.main_cli()
+    assert exc_info.value.code == 2
+
+
+@pytest.mark.parametrize("value", ["", " "])
+def test_empty_batch_workers_falls_back_to_cpu_count(value):
+    # docker-compose の env_file では空の値がそのまま渡される
+    result = subprocess.run(
+        [sys.executable, "-c", "import main, os; print(main.CALCULATE_BATCH_WORKERS == (os.cpu_count() or 1))"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, timeout=60,
+        env={**os.environ, "CALCULATE_BATCH_WORKERS": value},
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip().splitlines()[-1] == "True"
@@ -0,0 +1,105 @@
+import io
+
+import pytest
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import main
+from rate_limiter import TokenBucketLimiter
+from benchmarks.bench_tile_classifier import evaluate, load_samples
+from tile_classifier import TILE_IDS, TileClassifier, render_strip, render_tile_face
+from vision_client import VisionBackend
+
+
+@pytest.fixture(scope="module")
+def classifier():
+    return TileClassifier.synthetic()
+
+
+def jpeg(image) -> bytes:
+    output = io.BytesIO()
+    image.convert("RGB").save(output, format="JPEG", quality=85)
+    return output.getvalue()
+
+
+def test_classifies_every_tile_with_high_confidence(classifier):
+    result = classifier.classify_bytes(jpeg(render_strip(TILE_IDS, tile_height=80, seed=1)))
+
+    assert [tile.tile_id for tile in result] == TILE_IDS
+    assert min(tile.confidence for tile in result) >= 0.8
+    assert all(left < right for (left, _, right, _) in (tile.box for tile in result))
+
+
+def test_checked_in_samples_stay_accurate(classifier):
+    report = evaluate(classifier, load_samples(), threshold=0.8, repeat=1)
+
+    assert report["segmentation_accuracy"] == 1.0
+    assert report["tile_accuracy"] >= 0.98
+    assert report["accepted_rate"] >= 0.5
+    assert report["accepted_accuracy"] == 1.0
+
+
+def test_non_tile_images_are_not_confident(classifier):
+    noise = Image.effect_noise((640, 240), 64)
+    gradient = Image.linear_gradient("L").resize((128, 64))
+
+    assert classifier.classify(Image.new("L", (320, 96), 200)) == []
+    for image in (noise, gradient):
+        assert all(tile.confidence < 0.5 for tile in classifier.classify(image))
+
+
+def test_loads_templates_from_sheet(tmp_path, classifier):
+    sheet = Image.new("L", (48 * len(TILE_IDS), 64), 255)
+    for index, tile_id in enumerate(TILE_IDS):
+        sheet.paste(render_tile_face(tile_id), (index * 48, 0))
+    sheet.save(tmp_path / "templates.png")
+
+    loaded = TileClassifier.from_sheet(str(tmp_path / "templates.png"))
+    strip = jpeg(render_strip(["1m", "9p", "5s", "7z"], seed=2))
+
+    assert [tile.tile_id for tile in loaded.classify_bytes(strip)] == ["1m", "9p", "5s", "7z"]
+
+
+def test_recognize_uses_local_result_without_vision_api(monkeypatch):
+    monkeypatch.setattr(main, "VISION_BACKEND", "openai")
+    monkeypatch.setattr(main, "RECOGNIZE_LOCAL_FIRST", True)
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    hand = ["1m", "2m", "3m", "4p", "5p", "6p", "7s", "8s", "9s", "1z", "1z", "1z", "7z", "7z"]
+
+    with TestClient(main.app) as client:
+        before = main.RECOGNIZE_LOCAL.value("accepted")
+        response = client.post("/recognize", files={"image": ("hand.jpg", jpeg(render_strip(hand, seed=3)), "image/jpeg")})
+
+    body = response.json()
+    assert [tile["id"] for tile in body["tiles"]] == hand
+    assert body["raw_response"].startswith("[LOCAL]")
+    assert main.RECOGNIZE_LOCAL.value("accepted") == before + 1
+
+
+def test_synthetic_templates_only_serve_as_offline_fallback(monkeypatch):
+    class VisionBackendStub(VisionBackend):
+        calls = 0
+
+        async def complete(self, messages):
+            VisionBackendStub.calls += 1
+            return '["1m"]'
+
+    monkeypatch.setattr(main, "recognition_cache", main.PerceptualCache(max_size=0, max_distance=0))
+    monkeypatch.setattr(main, "recognize_rate_limiter", TokenBucketLimiter(capacity=10, refill_per_second=1))
+    image = jpeg(render_strip(["1m", "2m", "3m"], seed=3))
+    # TILE_TEMPLATES_PATH が無い場合の既定 (ローカル認識を先に使わない)
+    monkeypatch.setattr(main, "RECOGNIZE_LOCAL_FIRST", False)
+
+    monkeypatch.setattr(main, "VISION_BACKEND", "fake")
+    monkeypatch.setattr(main, "create_vision_backend", lambda *args: VisionBackendStub())
+    with TestClient(main.app) as client:
+        remote = client.post("/recognize", files={"image": ("hand.jpg", image, "image/jpeg")}).json()
+    assert VisionBackendStub.calls == 1
+    assert [tile["id"] for tile in remote["tiles"]] == ["1m"]
+
+    monkeypatch.setattr(main, "VISION_BACKEND", "openai")
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    with TestClient(main.app) as client:
+        offline = client.post("/recognize", files={"image": ("hand.jpg", image, "image/jpeg")}).json()
+    assert [tile["id"] for tile in offline["tiles"]] == ["1m", "2m", "3m"]
+    assert offline["raw_response"].startswith("[LOCAL]")
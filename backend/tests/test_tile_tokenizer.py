@@ -0,0 +1,57 @@
+import pytest
+
+from main import parse_tile_response
+from tile_tokenizer import TileTokenizer, tokenize_tiles
+
+RESPONSE = '["1m", "2m", "?", "9s", "7z"] 東と一萬、1筒、發'
+EXPECTED = ["1m", "2m", "9s", "7z", "1z", "1m", "1p", "6z"]
+
+
+def test_tokenize_keeps_left_to_right_order():
+    assert tokenize_tiles(RESPONSE) == EXPECTED
+
+
+def test_ids_require_token_boundaries():
+    assert tokenize_tiles("11m 8z 3pz 5s") == ["5s"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 5, 8])
+def test_chunked_feed_matches_single_pass(chunk_size):
+    tokenizer = TileTokenizer()
+    tile_ids = []
+    for start in range(0, len(RESPONSE), chunk_size):
+        tile_ids += tokenizer.feed(RESPONSE[start:start + chunk_size])
+    tile_ids += tokenizer.close()
+
+    assert tile_ids == EXPECTED
+
+
+def test_token_split_across_chunks_is_held_until_complete():
+    tokenizer = TileTokenizer()
+    assert tokenizer.feed('["1') == []
+    assert tokenizer.feed('m') == []
+    assert tokenizer.feed('", "一') == ["1m"]
+    assert tokenizer.feed('萬"]') == ["1m"]
+    assert tokenizer.close() == []
+
+
+def test_parse_tile_response_fallback_preserves_order():
+    tiles = parse_tile_response("左から 中、二萬、東、五筒 です")
+
+    assert [tile.id for tile in tiles] == ["7z", "2m", "1z", "5p"]
+    assert all(tile.confidence == 0.8 for tile in tiles)
+
+
+ANNOTATED = "1z(東) 2z（南）、5z (白) 6z(中) 白"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 100])
+def test_id_with_parenthesized_name_counts_once(chunk_size):
+    tokenizer = TileTokenizer()
+    tile_ids = []
+    for start in range(0, len(ANNOTATED), chunk_size):
+        tile_ids += tokenizer.feed(ANNOTATED[start:start + chunk_size])
+    tile_ids += tokenizer.close()
+
+    # 括弧書きは ID の注釈として読み飛ばす (ID と牌名が食い違っていても ID を採る)
+    assert tile_ids == ["1z", "2z", "5z", "6z", "5z"]
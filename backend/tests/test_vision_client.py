@@ -0,0 +1,330 @@
+import asyncio
+import io
+import json
+
+import pytest
+from PIL import Image
+from fastapi.testclient import TestClient
+
+import main
+from rate_limiter import TokenBucketLimiter
+from vision_client import VisionBackend, VisionClient, VisionTransientError
+
+
+class FlakyBackend(VisionBackend):
+    def __init__(self, failures=0, delay=0.0, response='["1m", "2p", "7z"]'):
+        self.failures = failures
+        self.delay = delay
+        self.response = response
+        self.calls = 0
+        self.concurrent = 0
+        self.max_concurrent = 0
+
+    async def complete(self, messages):
+        self.calls += 1
+        self.concurrent += 1
+        self.max_concurrent = max(self.max_concurrent, self.concurrent)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.calls <= self.failures:
+                raise VisionTransientError("upstream unavailable")
+            return self.response
+        finally:
+            self.concurrent -= 1
+
+
+def test_backend_without_complete_fails_at_construction():
+    class Incomplete(VisionBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def make_client(backend, **kwargs):
+    options = {"backoff_base_seconds": 0.001, "backoff_max_seconds": 0.002}
+    options.update(kwargs)
+    return VisionClient(backend, **options)
+
+
+def test_retries_transient_failures():
+    backend = FlakyBackend(failures=2)
+    client = make_client(backend, max_retries=2)
+
+    assert asyncio.run(client.complete([])) == '["1m", "2p", "7z"]'
+    assert backend.calls == 3
+    assert client.stats()["retries"] == 2
+
+
+def test_gives_up_after_max_retries():
+    backend = FlakyBackend(failures=5)
+    client = make_client(backend, max_retries=1)
+
+    with pytest.raises(VisionTransientError):
+        asyncio.run(client.complete([]))
+    assert backend.calls == 2
+    assert client.stats()["failures"] == 1
+
+
+def test_semaphore_caps_in_flight_calls():
+    backend = FlakyBackend(delay=0.01)
+    client = make_client(backend, max_concurrency=2)
+
+    async def scenario():
+        await asyncio.gather(*(client.complete([]) for _ in range(6)))
+
+    asyncio.run(scenario())
+    assert backend.max_concurrent == 2
+
+
+def test_deadline_bounds_total_time():
+    backend = FlakyBackend(delay=1.0)
+    client = make_client(backend, attempt_timeout_seconds=0.05, deadline_seconds=0.08, max_retries=10)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(client.complete([]))
+
+
+def test_recognize_uses_configured_backend(monkeypatch):
+    backend = FlakyBackend()
+    monkeypatch.setattr(main, "VISION_BACKEND", "fake")
+    monkeypatch.setattr(main, "create_vision_backend", lambda *args: backend)
+    monkeypatch.setattr(main, "recognize_rate_limiter", TokenBucketLimiter(capacity=10, refill_per_second=1))
+
+    image = io.BytesIO()
+    Image.new("RGB", (64, 32), "white").save(image, format="PNG")
+
+    with TestClient(main.app) as client:
+        response = client.post("/recognize", files={"image": ("hand.png", image.getvalue(), "image/png")})
+
+    assert [tile["id"] for tile in response.json()["tiles"]] == ["1m", "2p", "7z"]
+    assert backend.calls == 1
+
+
+def strip_photo(tile_ids, brightness=0, quality=85):
+    from tile_classifier import render_strip
+
+    image = render_strip(tile_ids, seed=1, noise=4).point(lambda v: min(255, v + brightness))
+    output = io.BytesIO()
+    image.convert("RGB").save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+HAND = ["2m", "3m", "4m", "5p", "6p", "7p", "3s", "4s", "5s", "6s", "7s", "1z", "1z"]
+
+
+def test_recognize_serves_near_duplicates_from_cache_without_rate_limit(monkeypatch):
+    backend = FlakyBackend()
+    monkeypatch.setattr(main, "VISION_BACKEND", "fake")
+    monkeypatch.setattr(main, "create_vision_backend", lambda *args: backend)
+    monkeypatch.setattr(main, "recognize_rate_limiter", TokenBucketLimiter(capacity=1, refill_per_second=0))
+    monkeypatch.setattr(main, "recognition_cache", main.PerceptualCache(max_size=8, max_distance=4))
+    # ローカル認識は牌の並びの照合にだけ使い、結果は採用せず Vision API に回す
+    monkeypatch.setattr(main, "RECOGNIZE_LOCAL_FIRST", True)
+    monkeypatch.setattr(main, "RECOGNIZE_LOCAL_MIN_CONFIDENCE", 1.1)
+
+    with TestClient(main.app) as client:
+        first = client.post("/recognize", files={"image": ("a.jpg", strip_photo(HAND), "image/jpeg")}).json()
+        retake = client.post(
+            "/recognize", files={"image": ("b.jpg", strip_photo(HAND, brightness=3, quality=80), "image/jpeg")},
+        ).json()
+
+    assert backend.calls == 1
+    assert retake["tiles"] == first["tiles"]
+    assert retake["raw_response"].startswith("[CACHE HIT]")
+    assert main.recognition_cache.stats()["hits"] == 1
+
+
+def test_recognize_cache_hits_reencoded_photo_without_local_recognition(monkeypatch):
+    backend = FlakyBackend()
+    monkeypatch.setattr(main, "VISION_BACKEND", "fake")
+    monkeypatch.setattr(main, "create_vision_backend", lambda *args: backend)
+    monkeypatch.setattr(main, "recognize_rate_limiter", TokenBucketLimiter(capacity=10, refill_per_second=1))
+    monkeypatch.setattr(main, "recognition_cache", main.PerceptualCache(max_size=8, max_distance=4))
+    monkeypatch.setattr(main, "RECOGNIZE_LOCAL_ENABLED", False)
+
+    original = strip_photo(HAND, quality=95)
+    reencoded = strip_photo(HAND, brightness=5, quality=70)
+    assert main.preprocess_image(original, 1280).digest != main.preprocess_image(reencoded, 1280).digest
+
+    with TestClient(main.app) as client:
+        client.post("/recognize", files={"image": ("a.jpg", original, "image/jpeg")})
+        response = client.post("/recognize", files={"image": ("b.jpg", reencoded, "image/jpeg")}).json()
+
+    assert backend.calls == 1
+    assert response["raw_response"].startswith("[CACHE HIT]")
+
+
+@pytest.mark.parametrize("local_enabled", [True, False])
+def test_recognize_cache_misses_photo_differing_by_one_tile(monkeypatch, local_enabled):
+    backend = FlakyBackend()
+    monkeypatch.setattr(main, "VISION_BACKEND", "fake")
+    monkeypatch.setattr(main, "create_vision_backend", lambda *args: backend)
+    monkeypatch.setattr(main, "recognize_rate_limiter", TokenBucketLimiter(capacity=10, refill_per_second=1))
+    monkeypatch.setattr(main, "recognition_cache", main.PerceptualCache(max_size=8, max_distance=4))
+    monkeypatch.setattr(main, "RECOGNIZE_LOCAL_ENABLED", local_enabled)
+    monkeypatch.setattr(main, "RECOGNIZE_LOCAL_FIRST", local_enabled)
+    monkeypatch.setattr(main, "RECOGNIZE_LOCAL_MIN_CONFIDENCE", 1.1)
+
+    before = strip_photo(HAND)
+    # 打牌して 7s の代わりに 8s をツモった後の撮り直し (知覚ハッシュはほぼ同じになる)
+    after = strip_photo(HAND[:10] + ["8s"] + HAND[11:])
+    assert (main.preprocess_image(before, 1280).dhash ^ main.preprocess_image(after, 1280).dhash).bit_count() <= 4
+
+    with TestClient(main.app) as client:
+        client.post("/recognize", files={"image": ("a.jpg", before, "image/jpeg")})
+        response = client.post("/recognize", files={"image": ("b.jpg", after, "image/jpeg")}).json()
+
+    assert backend.calls == 2
+    assert not response["raw_response"].startswith("[CACHE HIT]")
+    assert main.recognition_cache.stats()["hits"] == 0
+
+
+class StreamingBackend(FlakyBackend):
+    async def stream(self, messages):
+        self.calls += 1
+        for chunk in ['["1', 'm", "2', 'p", ', '"7z"]']:
+            yield chunk
+
+
+def test_recognize_stream_emits_tiles_then_final_result(monkeypatch):
+    backend = StreamingBackend()
+    monkeypatch.setattr(main, "VISION_BACKEND", "fake")
+    monkeypatch.setattr(main, "create_vision_backend", lambda *args: backend)
+    monkeypatch.setattr(main, "recognize_rate_limiter", TokenBucketLimiter(capacity=10, refill_per_second=1))
+    monkeypatch.setattr(main, "recognition_cache", main.PerceptualCache(max_size=0, max_distance=0))
+
+    image = io.BytesIO()
+    Image.new("RGB", (64, 32), "white").save(image, format="PNG")
+
+    with TestClient(main.app) as client:
+        response = client.post("/recognize/stream", files={"image": ("hand.png", image.getvalue(), "image/png")})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    names = [lines[0].removeprefix("event: ") for lines in events]
+    payloads = [json.loads(lines[1].removeprefix("data: ")) for lines in events]
+
+    assert names == ["tile", "tile", "tile", "done"]
+    assert [payload["id"] for payload in payloads[:3]] == ["1m", "2p", "7z"]
+    assert [tile["id"] for tile in payloads[3]["tiles"]] == ["1m", "2p", "7z"]
+    assert backend.calls == 1
+
+
+def test_stream_retries_only_before_first_chunk():
+    class FlakyStream(FlakyBackend):
+        async def stream(self, messages):
+            self.calls += 1
+            if self.calls == 1:
+                raise VisionTransientError("connect failed")
+            yield "a"
+            if self.calls == 2:
+                raise VisionTransientError("dropped mid-stream")
+            yield "b"
+
+    backend = FlakyStream()
+    client = make_client(backend, max_retries=3)
+
+    async def collect():
+        return [chunk async for chunk in client.stream([])]
+
+    with pytest.raises(VisionTransientError):
+        asyncio.run(collect())
+    assert backend.calls == 2
+    assert client.stats()["retries"] == 1
+
+
+def test_identical_concurrent_recognitions_share_one_vision_call(monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+
+    backend = FlakyBackend(delay=0.3)
+    monkeypatch.setattr(main, "VISION_BACKEND", "fake")
+    monkeypatch.setattr(main, "create_vision_backend", lambda *args: backend)
+    monkeypatch.setattr(main, "recognize_rate_limiter", TokenBucketLimiter(capacity=10, refill_per_second=1))
+    monkeypatch.setattr(main, "recognition_cache", main.PerceptualCache(max_size=0, max_distance=0))
+    monkeypatch.setattr(main, "recognize_flight", main.SingleFlight())
+
+    image = io.BytesIO()
+    Image.new("RGB", (64, 32), "white").save(image, format="PNG")
+
+    with TestClient(main.app) as client:
+        def post(_):
+            return client.post("/recognize", files={"image": ("hand.png", image.getvalue(), "image/png")}).json()
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            responses = list(pool.map(post, range(4)))
+
+        metrics_text = client.get("/metrics").text
+
+    assert backend.calls == 1
+    assert all(response == responses[0] for response in responses)
+    assert main.recognize_flight.coalesced == 3
+    assert 'mahjong_singleflight_requests_total{endpoint="recognize",result="coalesced"} 3' in metrics_text
+
+
+def test_confident_local_recognition_skips_vision_api(monkeypatch):
+    from tile_classifier import render_strip
+
+    backend = FlakyBackend()
+    monkeypatch.setattr(main, "VISION_BACKEND", "fake")
+    monkeypatch.setattr(main, "create_vision_backend", lambda *args: backend)
+    monkeypatch.setattr(main, "recognize_rate_limiter", TokenBucketLimiter(capacity=1, refill_per_second=0))
+    monkeypatch.setattr(main, "RECOGNIZE_LOCAL_FIRST", True)
+
+    output = io.BytesIO()
+    render_strip(["2m", "3m", "4m", "6z", "6z"], seed=4).convert("RGB").save(output, format="JPEG")
+
+    with TestClient(main.app) as client:
+        for _ in range(3):
+            response = client.post("/recognize", files={"image": ("hand.jpg", output.getvalue(), "image/jpeg")})
+            assert [tile["id"] for tile in response.json()["tiles"]] == ["2m", "3m", "4m", "6z", "6z"]
+
+    assert backend.calls == 0
+
+
+def test_recognize_batch_fans_out_under_limit_and_reports_failures_per_image(monkeypatch):
+    backend = FlakyBackend(delay=0.05)
+    monkeypatch.setattr(main, "VISION_BACKEND", "fake")
+    monkeypatch.setattr(main, "create_vision_backend", lambda *args: backend)
+    monkeypatch.setattr(main, "recognize_rate_limiter", TokenBucketLimiter(capacity=1, refill_per_second=0))
+    monkeypatch.setattr(main, "recognition_cache", main.PerceptualCache(max_size=0, max_distance=0))
+    monkeypatch.setattr(main, "RECOGNIZE_BATCH_CONCURRENCY", 2)
+
+    def photo(brightness):
+        image = Image.linear_gradient("L").resize((128, 64)).point(lambda v: min(255, v + brightness))
+        output = io.BytesIO()
+        image.convert("RGB").save(output, format="JPEG")
+        return ("photo.jpg", output.getvalue(), "image/jpeg")
+
+    files = [
+        ("images", photo(0)),
+        ("images", ("notes.txt", b"hello", "text/plain")),
+        ("images", photo(20)),
+        ("images", ("broken.png", b"not an image", "image/png")),
+        ("images", photo(40)),
+        ("images", photo(60)),
+    ]
+    with TestClient(main.app) as client:
+        response = client.post("/recognize/batch", files=files)
+        # バッチ全体で1回分しか消費していないので、容量1の制限はここで超える
+        limited = client.post("/recognize", files={"image": photo(80)})
+
+    results = response.json()["results"]
+    assert response.status_code == 200
+    assert [result["error"] for result in results] == [
+        None, "unsupported_image_format", None, "invalid_image", None, None,
+    ]
+    assert all([tile["id"] for tile in results[i]["tiles"]] == ["1m", "2p", "7z"] for i in (0, 2, 4, 5))
+    assert backend.calls == 4
+    assert backend.max_concurrent == 2
+    assert limited.status_code == 429
+
+
+def test_recognize_batch_rejects_too_many_images(monkeypatch):
+    monkeypatch.setattr(main, "RECOGNIZE_BATCH_MAX_IMAGES", 2)
+    image = ("hand.png", b"x", "image/png")
+
+    with TestClient(main.app) as client:
+        response = client.post("/recognize/batch", files=[("images", image)] * 3)
+
+    assert response.status_code == 413
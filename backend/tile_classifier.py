@@ -0,0 +1,374 @@
+"""CPU だけで動くローカル牌認識 (Vision API の前段)
+
+牌を横一列に並べて撮った画像を前提に、
+1. 明るい牌の領域を二値化して上下の範囲を求め、列ごとの牌の割合から1枚ずつに切り分け
+2. 各牌の図柄を小さなグレースケール画像に縮小し、34種のテンプレートとの正規化相関で分類
+する。テンプレートは起動時に1回だけ用意する (既定は図柄を手続き的に描いた合成テンプレート、
+TILE_TEMPLATES_PATH で実際の牌から切り出したテンプレート画像に差し替えられる)。
+"""
+import io
+import random
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+
+TILE_IDS = [f"{number}{suit}" for suit in "mps" for number in range(1, 10)] + [f"{number}z" for number in range(1, 8)]
+
+# 牌の幅 / 高さ
+TILE_ASPECT = 0.75
+# テンプレートを描く図柄の大きさ (幅, 高さ)。テンプレート画像もこの大きさで1行に並べる
+FACE_SIZE = (48, 64)
+# 切り出した牌の外周のうち、縁として捨てる割合
+FACE_MARGIN = 0.1
+# 分類に使う特徴量 (縮小後の画素) の大きさ
+FEATURE_SIZE = (15, 20)
+# 位置ずれに強くするため、テンプレートを上下左右に FEATURE_SHIFT 画素ずらした版も持つ
+FEATURE_SHIFT = 1
+# 相関のソフトマックスの温度 (小さいほど1位と2位の差に敏感)
+SOFTMAX_TEMPERATURE = 0.015
+# この相関を下回る一致は牌ではないものとみなして信頼度を下げる
+MIN_CORRELATION = 0.3
+
+
+@dataclass
+class ClassifiedTile:
+    """分類された牌と、画像内の位置 (left, top, right, bottom)"""
+    tile_id: str
+    confidence: float
+    box: tuple[int, int, int, int]
+
+
+# 筒子・索子の図柄の配置 (図柄内の相対座標)
+PIP_LAYOUTS = {
+    1: [(0.5, 0.5)],
+    2: [(0.5, 0.25), (0.5, 0.75)],
+    3: [(0.22, 0.2), (0.5, 0.5), (0.78, 0.8)],
+    4: [(0.28, 0.28), (0.72, 0.28), (0.28, 0.72), (0.72, 0.72)],
+    5: [(0.25, 0.22), (0.75, 0.22), (0.5, 0.5), (0.25, 0.78), (0.75, 0.78)],
+    6: [(0.3, 0.18), (0.7, 0.18), (0.3, 0.5), (0.7, 0.5), (0.3, 0.82), (0.7, 0.82)],
+    7: [(0.2, 0.14), (0.5, 0.24), (0.8, 0.34), (0.3, 0.6), (0.7, 0.6), (0.3, 0.86), (0.7, 0.86)],
+    8: [(0.3, 0.13), (0.7, 0.13), (0.3, 0.38), (0.7, 0.38), (0.3, 0.62), (0.7, 0.62), (0.3, 0.87), (0.7, 0.87)],
+    9: [(x, y) for y in (0.17, 0.5, 0.83) for x in (0.2, 0.5, 0.8)],
+}
+
+# 索子は筒子と並びが違うので別に持つ
+SOU_LAYOUTS = {
+    2: [(0.5, 0.25), (0.5, 0.75)],
+    3: [(0.5, 0.25), (0.3, 0.75), (0.7, 0.75)],
+    4: [(0.3, 0.25), (0.7, 0.25), (0.3, 0.75), (0.7, 0.75)],
+    5: [(0.25, 0.25), (0.75, 0.25), (0.5, 0.5), (0.25, 0.75), (0.75, 0.75)],
+    6: [(x, y) for y in (0.25, 0.75) for x in (0.2, 0.5, 0.8)],
+    7: [(0.5, 0.15)] + [(x, y) for y in (0.5, 0.85) for x in (0.2, 0.5, 0.8)],
+    8: [(x, y) for y in (0.25, 0.75) for x in (0.14, 0.38, 0.62, 0.86)],
+    9: [(x, y) for y in (0.15, 0.5, 0.85) for x in (0.2, 0.5, 0.8)],
+}
+
+# 萬子の漢数字を単純化した線分 ((x0, y0), (x1, y1))。図柄の上半分に描く
+MAN_NUMERAL_STROKES = {
+    1: [((0.05, 0.5), (0.95, 0.5))],
+    2: [((0.2, 0.25), (0.8, 0.25)), ((0.05, 0.8), (0.95, 0.8))],
+    3: [((0.15, 0.1), (0.85, 0.1)), ((0.25, 0.5), (0.75, 0.5)), ((0.05, 0.9), (0.95, 0.9))],
+    4: [
+        ((0.1, 0.1), (0.9, 0.1)), ((0.1, 0.1), (0.1, 0.9)), ((0.9, 0.1), (0.9, 0.9)), ((0.1, 0.9), (0.9, 0.9)),
+        ((0.4, 0.1), (0.3, 0.6)), ((0.6, 0.1), (0.6, 0.6)),
+    ],
+    5: [
+        ((0.15, 0.1), (0.85, 0.1)), ((0.45, 0.1), (0.3, 0.9)), ((0.25, 0.45), (0.75, 0.45)),
+        ((0.75, 0.45), (0.75, 0.9)), ((0.05, 0.9), (0.95, 0.9)),
+    ],
+    6: [((0.5, 0.0), (0.55, 0.2)), ((0.05, 0.35), (0.95, 0.35)), ((0.4, 0.55), (0.15, 0.95)), ((0.6, 0.55), (0.85, 0.95))],
+    7: [((0.05, 0.4), (0.95, 0.3)), ((0.4, 0.05), (0.4, 0.85)), ((0.4, 0.85), (0.9, 0.85)), ((0.9, 0.85), (0.9, 0.65))],
+    8: [((0.4, 0.1), (0.1, 0.9)), ((0.6, 0.1), (0.9, 0.9))],
+    9: [((0.1, 0.35), (0.65, 0.35)), ((0.65, 0.35), (0.65, 0.9)), ((0.65, 0.9), (0.95, 0.8)), ((0.45, 0.05), (0.1, 0.95))],
+}
+
+# 字牌の図柄を単純化した線分 ((x0, y0), (x1, y1))
+HONOR_STROKES = {
+    "1z": [  # 東
+        ((0.1, 0.15), (0.9, 0.15)), ((0.5, 0.05), (0.5, 0.95)), ((0.2, 0.3), (0.8, 0.3)),
+        ((0.2, 0.3), (0.2, 0.6)), ((0.8, 0.3), (0.8, 0.6)), ((0.2, 0.45), (0.8, 0.45)), ((0.2, 0.6), (0.8, 0.6)),
+        ((0.45, 0.65), (0.1, 0.95)), ((0.55, 0.65), (0.9, 0.95)),
+    ],
+    "2z": [  # 南
+        ((0.1, 0.12), (0.9, 0.12)), ((0.5, 0.02), (0.5, 0.3)), ((0.15, 0.3), (0.85, 0.3)),
+        ((0.15, 0.3), (0.15, 0.98)), ((0.85, 0.3), (0.85, 0.98)), ((0.35, 0.42), (0.45, 0.52)),
+        ((0.65, 0.42), (0.55, 0.52)), ((0.3, 0.6), (0.7, 0.6)), ((0.3, 0.78), (0.7, 0.78)), ((0.5, 0.6), (0.5, 0.98)),
+    ],
+    "3z": [  # 西
+        ((0.05, 0.1), (0.95, 0.1)), ((0.15, 0.35), (0.85, 0.35)), ((0.15, 0.35), (0.15, 0.95)),
+        ((0.85, 0.35), (0.85, 0.95)), ((0.15, 0.95), (0.85, 0.95)), ((0.4, 0.1), (0.35, 0.7)),
+        ((0.6, 0.1), (0.6, 0.7)), ((0.35, 0.7), (0.15, 0.8)), ((0.6, 0.7), (0.85, 0.7)),
+    ],
+    "4z": [  # 北
+        ((0.35, 0.05), (0.35, 0.95)), ((0.65, 0.05), (0.65, 0.85)), ((0.05, 0.35), (0.35, 0.35)),
+        ((0.05, 0.75), (0.35, 0.6)), ((0.65, 0.4), (0.95, 0.25)), ((0.65, 0.85), (0.95, 0.95)),
+    ],
+    "5z": [  # 白 (枠だけ)
+        ((0.1, 0.1), (0.9, 0.1)), ((0.9, 0.1), (0.9, 0.9)), ((0.9, 0.9), (0.1, 0.9)), ((0.1, 0.9), (0.1, 0.1)),
+    ],
+    "6z": [  # 發
+        ((0.1, 0.1), (0.4, 0.1)), ((0.6, 0.05), (0.9, 0.25)), ((0.4, 0.1), (0.1, 0.35)), ((0.6, 0.25), (0.95, 0.4)),
+        ((0.15, 0.5), (0.45, 0.5)), ((0.15, 0.5), (0.1, 0.95)), ((0.45, 0.5), (0.45, 0.95)), ((0.1, 0.72), (0.45, 0.72)),
+        ((0.6, 0.5), (0.9, 0.5)), ((0.6, 0.5), (0.9, 0.95)), ((0.9, 0.5), (0.6, 0.95)),
+    ],
+    "7z": [  # 中
+        ((0.15, 0.3), (0.85, 0.3)), ((0.15, 0.3), (0.15, 0.7)), ((0.85, 0.3), (0.85, 0.7)),
+        ((0.15, 0.7), (0.85, 0.7)), ((0.5, 0.02), (0.5, 0.98)),
+    ],
+}
+
+
+def render_tile_face(tile_id: str, size: tuple[int, int] = FACE_SIZE):
+    """牌の図柄を白地に黒で描いたグレースケール画像 (合成テンプレート・サンプル生成用)"""
+    from PIL import Image, ImageDraw
+
+    width, height = size
+    image = Image.new("L", size, 255)
+    draw = ImageDraw.Draw(image)
+    number, suit = int(tile_id[0]), tile_id[1]
+    stroke = max(2, round(width / 12))
+
+    def point(x: float, y: float, box=(0.1, 0.08, 0.9, 0.92)) -> tuple[float, float]:
+        left, top, right, bottom = box
+        return (left + (right - left) * x) * width, (top + (bottom - top) * y) * height
+
+    if suit == "p":
+        radius = width * (0.3 if number == 1 else 0.17 if number <= 4 else 0.12)
+        for x, y in PIP_LAYOUTS[number]:
+            cx, cy = point(x, y)
+            draw.ellipse((cx - radius, cy - radius, cx + radius, cy + radius), outline=0, width=stroke)
+            draw.ellipse((cx - radius / 3, cy - radius / 3, cx + radius / 3, cy + radius / 3), fill=0)
+    elif suit == "s":
+        if number == 1:
+            # 一索は鳥の図柄なので、頭と胴と尾の塊で表す
+            draw.ellipse((*point(0.3, 0.1), *point(0.7, 0.35)), fill=0)
+            draw.polygon([point(0.5, 0.3), point(0.1, 0.9), point(0.9, 0.9)], outline=0, width=stroke)
+        else:
+            half_width, half_height = width * 0.05, height * (0.1 if number in (7, 9) else 0.16)
+            for x, y in SOU_LAYOUTS[number]:
+                cx, cy = point(x, y)
+                draw.rectangle((cx - half_width, cy - half_height, cx + half_width, cy + half_height), fill=0)
+                draw.line((cx - half_width * 2, cy, cx + half_width * 2, cy), fill=0, width=max(1, stroke // 2))
+    elif suit == "m":
+        for (x0, y0), (x1, y1) in MAN_NUMERAL_STROKES[number]:
+            draw.line((*point(x0, y0, (0.15, 0.06, 0.85, 0.46)), *point(x1, y1, (0.15, 0.06, 0.85, 0.46))), fill=0, width=stroke)
+        # 「萬」の代わりに全萬子共通の格子を下半分に描く
+        draw.rectangle((*point(0.15, 0.58), *point(0.85, 0.95)), outline=0, width=stroke)
+        draw.line((*point(0.5, 0.58), *point(0.5, 0.95)), fill=0, width=stroke)
+        draw.line((*point(0.15, 0.76), *point(0.85, 0.76)), fill=0, width=stroke)
+    else:
+        for (x0, y0), (x1, y1) in HONOR_STROKES[tile_id]:
+            draw.line((*point(x0, y0), *point(x1, y1)), fill=0, width=stroke)
+    return image
+
+
+def render_strip(
+    tile_ids: Sequence[str],
+    tile_height: int = 96,
+    gap: int = 3,
+    seed: Optional[int] = None,
+    noise: float = 0.0,
+    blur: float = 0.0,
+):
+    """卓の上に牌を横一列に並べた画像を合成する (ベンチマーク・テスト用のサンプル生成)"""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    rng = random.Random(seed)
+    tile_width = round(tile_height * TILE_ASPECT)
+    padding = tile_height // 4
+    strip = Image.new("L", (padding * 2 + len(tile_ids) * (tile_width + gap), tile_height + padding * 2), 70)
+    draw = ImageDraw.Draw(strip)
+    for index, tile_id in enumerate(tile_ids):
+        left = padding + index * (tile_width + gap) + rng.randint(-1, 1)
+        top = padding + rng.randint(-2, 2)
+        draw.rectangle((left, top, left + tile_width - 1, top + tile_height - 1), fill=235, outline=150, width=2)
+        inset_x, inset_y = round(tile_width * FACE_MARGIN), round(tile_height * FACE_MARGIN)
+        face_size = (tile_width - inset_x * 2, tile_height - inset_y * 2)
+        face = render_tile_face(tile_id, face_size)
+        # 図柄の黒 (0) だけを牌の上に描く
+        strip.paste(0, (left + inset_x, top + inset_y), face.point(lambda value: 255 - value))
+
+    if blur:
+        strip = strip.filter(ImageFilter.GaussianBlur(blur))
+    if noise:
+        pixels = np.asarray(strip, dtype=np.float32)
+        pixels = pixels + np.random.default_rng(seed).normal(0, noise, pixels.shape)
+        strip = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    return strip
+
+
+def otsu_threshold(pixels: np.ndarray) -> float:
+    """大津の方法で二値化の閾値を求める"""
+    histogram = np.bincount(pixels.ravel(), minlength=256).astype(np.float64)
+    weights = np.cumsum(histogram)
+    means = np.cumsum(histogram * np.arange(256))
+    total_weight, total_mean = weights[-1], means[-1]
+    background = weights[:-1]
+    foreground = total_weight - background
+    valid = (background > 0) & (foreground > 0)
+    between = np.zeros(255)
+    between[valid] = (
+        (total_mean * background[valid] - means[:-1][valid] * total_weight) ** 2
+        / (background[valid] * foreground[valid])
+    )
+    return float(np.argmax(between))
+
+
+def longest_run(mask: np.ndarray) -> Optional[tuple[int, int]]:
+    """True が連続する最長区間 [start, end)"""
+    best = None
+    for start, end in find_runs(mask):
+        if best is None or end - start > best[1] - best[0]:
+            best = (start, end)
+    return best
+
+
+def find_runs(mask: np.ndarray) -> list[tuple[int, int]]:
+    """True が連続する区間 [start, end) の一覧"""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+def segment_tiles(pixels: np.ndarray) -> list[tuple[int, int, int, int]]:
+    """グレースケール画像から牌1枚ずつの範囲 (left, top, right, bottom) を左から順に返す
+
+    牌は背景 (卓) より明るく、隣の牌とは縁の暗い線で区切られている前提。
+    区切りが見えずにつながった範囲は、高さと牌の縦横比から枚数を見積もって等分する。
+    """
+    if pixels.size == 0 or int(pixels.max()) - int(pixels.min()) < 32:
+        return []
+    mask = pixels > otsu_threshold(pixels)
+
+    rows = longest_run(mask.mean(axis=1) > 0.3)
+    if rows is None:
+        return []
+    top, bottom = rows
+    height = bottom - top
+    expected_width = height * TILE_ASPECT
+    if height < 12:
+        return []
+
+    # 図柄の黒い線で列が途切れないよう、縦方向の一部でも牌の色なら牌の列とみなす
+    columns = mask[top:bottom].mean(axis=0) > 0.25
+    boxes = []
+    for left, right in find_runs(columns):
+        width = right - left
+        if width < expected_width * 0.5:
+            continue
+        count = max(1, round(width / expected_width))
+        for index in range(count):
+            boxes.append((left + width * index // count, top, left + width * (index + 1) // count, bottom))
+    return boxes
+
+
+def face_pixels(image, boxes: Sequence[tuple[int, int, int, int]]) -> np.ndarray:
+    """各牌の図柄部分を FEATURE_SIZE に縮小した画素の行列 (枚数, 画素数)"""
+    from PIL import Image
+
+    features = np.empty((len(boxes), FEATURE_SIZE[0] * FEATURE_SIZE[1]), dtype=np.float32)
+    for index, (left, top, right, bottom) in enumerate(boxes):
+        inset_x, inset_y = (right - left) * FACE_MARGIN, (bottom - top) * FACE_MARGIN
+        face = image.resize(
+            FEATURE_SIZE, Image.Resampling.BOX, box=(left + inset_x, top + inset_y, right - inset_x, bottom - inset_y),
+        )
+        features[index] = np.asarray(face, dtype=np.float32).ravel()
+    return features
+
+
+def normalize_rows(features: np.ndarray) -> np.ndarray:
+    """平均0・ノルム1に正規化する (内積が正規化相関になる)"""
+    features = features - features.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(features, axis=1, keepdims=True)
+    return features / np.maximum(norms, 1e-6)
+
+
+def shifted_faces(face) -> np.ndarray:
+    """図柄を FEATURE_SIZE に縮小し、上下左右に少しずらした版も含めた画素の行列"""
+    from PIL import Image
+
+    scaled = np.asarray(face.convert("L").resize(FEATURE_SIZE, Image.Resampling.BOX), dtype=np.float32)
+    padded = np.pad(scaled, FEATURE_SHIFT, mode="edge")
+    width, height = FEATURE_SIZE
+    variants = [
+        padded[FEATURE_SHIFT + dy:FEATURE_SHIFT + dy + height, FEATURE_SHIFT + dx:FEATURE_SHIFT + dx + width].ravel()
+        for dy in range(-FEATURE_SHIFT, FEATURE_SHIFT + 1)
+        for dx in range(-FEATURE_SHIFT, FEATURE_SHIFT + 1)
+    ]
+    return np.stack(variants)
+
+
+class TileClassifier:
+    """34種のテンプレートとの正規化相関で牌を分類する"""
+
+    def __init__(self, faces: dict) -> None:
+        missing = [tile_id for tile_id in TILE_IDS if tile_id not in faces]
+        if missing:
+            raise ValueError(f"missing templates: {missing}")
+        templates = np.stack([shifted_faces(faces[tile_id]) for tile_id in TILE_IDS])
+        self._variants = templates.shape[1]
+        # (34 * ずらし数, 画素数)。分類は特徴量との行列積1回で済む
+        self._templates = normalize_rows(templates.reshape(-1, templates.shape[2]))
+
+    @classmethod
+    def synthetic(cls) -> "TileClassifier":
+        """手続き的に描いた合成テンプレートを使う"""
+        return cls({tile_id: render_tile_face(tile_id) for tile_id in TILE_IDS})
+
+    @classmethod
+    def from_sheet(cls, path: str) -> "TileClassifier":
+        """TILE_IDS の順に図柄を横1列に並べたテンプレート画像を読み込む"""
+        from PIL import Image
+
+        with Image.open(path) as sheet:
+            sheet = sheet.convert("L")
+            width = sheet.width // len(TILE_IDS)
+            return cls({
+                tile_id: sheet.crop((index * width, 0, (index + 1) * width, sheet.height))
+                for index, tile_id in enumerate(TILE_IDS)
+            })
+
+    def classify(self, image) -> list[ClassifiedTile]:
+        """PIL 画像 (牌を横一列に並べたもの) を分類する"""
+        gray = image.convert("L")
+        boxes = segment_tiles(np.asarray(gray))
+        if not boxes:
+            return []
+        scores = normalize_rows(face_pixels(gray, boxes)) @ self._templates.T
+        scores = scores.reshape(len(boxes), len(TILE_IDS), self._variants).max(axis=2)
+        best = scores.argmax(axis=1)
+        best_scores = scores[np.arange(len(boxes)), best]
+        # 1位の確からしさ (ソフトマックス) に、相関そのものの低さによる減点を掛ける
+        exponents = np.exp((scores - best_scores[:, None]) / SOFTMAX_TEMPERATURE)
+        probabilities = 1.0 / exponents.sum(axis=1)
+        fit = np.clip((best_scores - MIN_CORRELATION) / (1.0 - MIN_CORRELATION), 0.0, 1.0)
+        confidences = probabilities * np.sqrt(fit)
+        return [
+            ClassifiedTile(tile_id=TILE_IDS[tile], confidence=round(float(confidence), 3), box=box)
+            for tile, confidence, box in zip(best.tolist(), confidences.tolist(), boxes)
+        ]
+
+    def classify_bytes(self, data: bytes, max_edge: int = 1280) -> list[ClassifiedTile]:
+        """エンコード済みの画像を分類する (JPEG はデコード時点でグレースケール・縮小させる)"""
+        from PIL import Image
+
+        with Image.open(io.BytesIO(data)) as image:
+            image.draft("L", (max_edge, max_edge))
+            image = image.convert("L")
+            if max(image.size) > max_edge:
+                image.thumbnail((max_edge, max_edge))
+            return self.classify(image)
+
+
+def load_tile_classifier(path: Optional[str] = None) -> TileClassifier:
+    """テンプレート画像があればそれを、無ければ合成テンプレートを使う分類器を作る"""
+    if path:
+        return TileClassifier.from_sheet(path)
+    return TileClassifier.synthetic()
+
+
+def min_confidence(tiles: Sequence) -> float:
+    """信頼度 (confidence 属性) の最小値。牌が無ければ 0"""
+    return min((tile.confidence for tile in tiles), default=0.0)
+
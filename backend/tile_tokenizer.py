@@ -0,0 +1,104 @@
+import re
+
+# 牌名からIDへのマッピング
+TILE_NAME_TO_ID = {
+    # 萬子
+    "一萬": "1m", "二萬": "2m", "三萬": "3m", "四萬": "4m", "五萬": "5m",
+    "六萬": "6m", "七萬": "7m", "八萬": "8m", "九萬": "9m",
+    "1萬": "1m", "2萬": "2m", "3萬": "3m", "4萬": "4m", "5萬": "5m",
+    "6萬": "6m", "7萬": "7m", "8萬": "8m", "9萬": "9m",
+    # 筒子
+    "一筒": "1p", "二筒": "2p", "三筒": "3p", "四筒": "4p", "五筒": "5p",
+    "六筒": "6p", "七筒": "7p", "八筒": "8p", "九筒": "9p",
+    "1筒": "1p", "2筒": "2p", "3筒": "3p", "4筒": "4p", "5筒": "5p",
+    "6筒": "6p", "7筒": "7p", "8筒": "8p", "9筒": "9p",
+    # 索子
+    "一索": "1s", "二索": "2s", "三索": "3s", "四索": "4s", "五索": "5s",
+    "六索": "6s", "七索": "7s", "八索": "8s", "九索": "9s",
+    "1索": "1s", "2索": "2s", "3索": "3s", "4索": "4s", "5索": "5s",
+    "6索": "6s", "7索": "7s", "8索": "8s", "9索": "9s",
+    # 字牌
+    "東": "1z", "南": "2z", "西": "3z", "北": "4z",
+    "白": "5z", "發": "6z", "発": "6z", "中": "7z",
+}
+
+# IDから牌名へのマッピング
+TILE_ID_TO_NAME = {
+    "1m": "一萬", "2m": "二萬", "3m": "三萬", "4m": "四萬", "5m": "五萬",
+    "6m": "六萬", "7m": "七萬", "8m": "八萬", "9m": "九萬",
+    "1p": "一筒", "2p": "二筒", "3p": "三筒", "4p": "四筒", "5p": "五筒",
+    "6p": "六筒", "7p": "七筒", "8p": "八筒", "9p": "九筒",
+    "1s": "一索", "2s": "二索", "3s": "三索", "4s": "四索", "5s": "五索",
+    "6s": "六索", "7s": "七索", "8s": "八索", "9s": "九索",
+    "1z": "東", "2z": "南", "3z": "西", "4z": "北",
+    "5z": "白", "6z": "發", "7z": "中",
+}
+
+# 牌ID ("1m" など) と牌名をまとめて1パスで拾う。牌名は長いものを優先する。
+# "1z(東)" のように ID の直後に括弧書きの牌名が続く場合は、同じ牌を二重に数えないよう牌名ごと1つとして読む。
+TILE_NAME_ALTERNATIVES = "|".join(re.escape(name) for name in sorted(TILE_NAME_TO_ID, key=len, reverse=True))
+TILE_TOKEN_PATTERN = re.compile(
+    r"(?<![0-9A-Za-z])(?P<id>[1-9][mps]|[1-7]z)(?![0-9A-Za-z])"
+    rf"(?P<annotation>\s?[(（](?:{TILE_NAME_ALTERNATIVES})[)）])?"
+    rf"|(?P<name>{TILE_NAME_ALTERNATIVES})"
+)
+MAX_TOKEN_LENGTH = max(2, *(len(name) for name in TILE_NAME_TO_ID))
+# ID の後の括弧書き (空白1文字 + 括弧 + 牌名 + 括弧) の最大長
+MAX_ANNOTATION_LENGTH = MAX_TOKEN_LENGTH + 3
+
+
+class TileTokenizer:
+    """テキストを少しずつ受け取り、完成した牌を左から順に返すトークナイザ
+
+    チャンク末尾にかかるトークン (例: "1" と "m" が別チャンク) は次の入力まで保留する。
+    """
+
+    def __init__(self) -> None:
+        self._buffer = ""
+        self._pos = 0
+
+    def feed(self, text: str) -> list[str]:
+        self._buffer += text
+        return self._scan(final=False)
+
+    def close(self) -> list[str]:
+        return self._scan(final=True)
+
+    def _may_be_annotated(self, match: re.Match) -> bool:
+        # ID の直後が括弧書きの途中で切れている場合は、続きを受け取るまで待つ
+        if match.group("id") is None or match.group("annotation") is not None:
+            return False
+        rest = self._buffer[match.end():]
+        return len(rest) < MAX_ANNOTATION_LENGTH and re.match(r"\s?[(（]", rest + "(") is not None
+
+    def _scan(self, final: bool) -> list[str]:
+        tile_ids = []
+        held = None
+        for match in TILE_TOKEN_PATTERN.finditer(self._buffer, self._pos):
+            # 末尾のトークンは直後の文字次第で無効になりうるので確定させない
+            if not final and (match.end() == len(self._buffer) or self._may_be_annotated(match)):
+                held = match
+                break
+            tile_ids.append(match.group("id") or TILE_NAME_TO_ID[match.group("name")])
+            self._pos = match.end()
+
+        if final:
+            self._buffer, self._pos = "", 0
+            return tile_ids
+
+        if held is not None:
+            self._pos = held.start()
+        else:
+            self._pos = max(self._pos, len(self._buffer) - (MAX_TOKEN_LENGTH - 1))
+
+        # 先読み判定用に1文字だけ残してバッファを詰める
+        keep_from = max(0, self._pos - 1)
+        self._buffer = self._buffer[keep_from:]
+        self._pos -= keep_from
+        return tile_ids
+
+
+def tokenize_tiles(text: str) -> list[str]:
+    """テキスト中の牌を出現順に抽出"""
+    tokenizer = TileTokenizer()
+    return tokenizer.feed(text) + tokenizer.close()
@@ -0,0 +1,243 @@
+import abc
+import asyncio
+import importlib
+import random
+from typing import AsyncIterator, Optional
+
+VISION_SYSTEM_PROMPT = """あなたは麻雀牌を認識する専門家です。
+画像に写っている麻雀牌を左から右の順番で識別してください。
+
+出力形式は必ず以下のJSON配列のみを返してください：
+["1m", "2m", "3m", "4p", "5p", "6p", "7s", "8s", "9s", "1z", "1z", "1z", "7z", "7z"]
+
+牌のID形式：
+- 萬子: 1m, 2m, 3m, 4m, 5m, 6m, 7m, 8m, 9m
+- 筒子: 1p, 2p, 3p, 4p, 5p, 6p, 7p, 8p, 9p
+- 索子: 1s, 2s, 3s, 4s, 5s, 6s, 7s, 8s, 9s
+- 字牌: 1z(東), 2z(南), 3z(西), 4z(北), 5z(白), 6z(發), 7z(中)
+
+注意：
+- 同じ牌が複数ある場合は、その数だけIDを繰り返してください
+- 確認できない牌がある場合は "?" を使ってください
+- JSON配列のみを出力し、他の説明は不要です"""
+
+VISION_USER_PROMPT = "この画像の麻雀牌を左から順番に識別してください。JSON配列で返してください。"
+
+
+def build_vision_messages(base64_image: str, content_type: str) -> list[dict]:
+    """Vision API に送るメッセージを構築"""
+    return [
+        {
+            "role": "system",
+            "content": VISION_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": [
+                {
+                    "type": "text",
+                    "text": VISION_USER_PROMPT
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:{content_type};base64,{base64_image}"
+                    }
+                }
+            ]
+        }
+    ]
+
+
+class VisionTransientError(Exception):
+    """リトライしてよい一時的な失敗 (独自バックエンド用)"""
+
+
+class VisionBackend(abc.ABC):
+    """Vision API バックエンドの共通インターフェース
+
+    負荷試験用の偽サーバーなどに差し替える場合はこのクラスを継承し、
+    VISION_BACKEND="module:ClassName" で指定する。
+    """
+
+    # リトライ対象とする例外
+    transient_errors: tuple[type[BaseException], ...] = (VisionTransientError,)
+
+    @abc.abstractmethod
+    async def complete(self, messages: list[dict]) -> str:
+        """応答テキスト全体を返す"""
+
+    async def stream(self, messages: list[dict]) -> AsyncIterator[str]:
+        """応答テキストを逐次返す (既定では complete の結果を一度に返す)"""
+        yield await self.complete(messages)
+
+    async def aclose(self) -> None:
+        pass
+
+
+class OpenAIVisionBackend(VisionBackend):
+    """OpenAI (互換) Chat Completions API を使うバックエンド"""
+
+    def __init__(
+        self,
+        model: str = "gpt-4o",
+        max_tokens: int = 500,
+        base_url: Optional[str] = None,
+        max_connections: int = 20,
+    ) -> None:
+        import httpx
+        import openai
+
+        self.model = model
+        self.max_tokens = max_tokens
+        # 接続プールを全リクエストで共有する。リトライは VisionClient 側で行う。
+        self._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self._client = openai.AsyncOpenAI(base_url=base_url, http_client=self._http_client, max_retries=0)
+        self.transient_errors = (
+            VisionTransientError,
+            openai.APITimeoutError,
+            openai.APIConnectionError,
+            openai.RateLimitError,
+            openai.InternalServerError,
+        )
+
+    async def complete(self, messages: list[dict]) -> str:
+        response = await self._client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=self.max_tokens,
+        )
+        return response.choices[0].message.content or ""
+
+    async def stream(self, messages: list[dict]) -> AsyncIterator[str]:
+        response = await self._client.chat.completions.create(
+            model=self.model,
+            messages=messages,
+            max_tokens=self.max_tokens,
+            stream=True,
+        )
+        async with response:
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+    async def aclose(self) -> None:
+        await self._client.close()
+        await self._http_client.aclose()
+
+
+class VisionClient:
+    """同時実行数・タイムアウト・リトライを管理する Vision API クライアント"""
+
+    def __init__(
+        self,
+        backend: VisionBackend,
+        max_concurrency: int = 8,
+        attempt_timeout_seconds: float = 20.0,
+        deadline_seconds: float = 45.0,
+        max_retries: int = 2,
+        backoff_base_seconds: float = 0.5,
+        backoff_max_seconds: float = 4.0,
+    ) -> None:
+        self.backend = backend
+        self.attempt_timeout_seconds = attempt_timeout_seconds
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.retries = 0
+        self.failures = 0
+
+    def backoff_delay(self, attempt: int) -> float:
+        """full jitter による指数バックオフ"""
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * 2 ** attempt))
+
+    async def complete(self, messages: list[dict]) -> str:
+        try:
+            async with asyncio.timeout(self.deadline_seconds):
+                return await self._complete_with_retry(messages)
+        except Exception:
+            self.failures += 1
+            raise
+
+    async def _complete_with_retry(self, messages: list[dict]) -> str:
+        transient_errors = (TimeoutError,) + tuple(self.backend.transient_errors)
+        attempt = 0
+        while True:
+            try:
+                # バックオフ待機中は枠を占有しない
+                async with self._semaphore:
+                    self.in_flight += 1
+                    try:
+                        async with asyncio.timeout(self.attempt_timeout_seconds):
+                            return await self.backend.complete(messages)
+                    finally:
+                        self.in_flight -= 1
+            except transient_errors:
+                if attempt >= self.max_retries:
+                    raise
+            self.retries += 1
+            await asyncio.sleep(self.backoff_delay(attempt))
+            attempt += 1
+
+    async def stream(self, messages: list[dict]) -> AsyncIterator[str]:
+        """応答を逐次返す。リトライは最初のチャンクを受け取る前の失敗に限る"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_seconds
+        transient_errors = (TimeoutError,) + tuple(self.backend.transient_errors)
+        attempt = 0
+        try:
+            while True:
+                started = False
+                try:
+                    async with self._semaphore:
+                        self.in_flight += 1
+                        chunks = aiter(self.backend.stream(messages))
+                        try:
+                            while True:
+                                # チャンク間の待ち時間は attempt_timeout、全体は deadline で打ち切る
+                                timeout = min(self.attempt_timeout_seconds, deadline - loop.time())
+                                if timeout <= 0:
+                                    raise TimeoutError()
+                                try:
+                                    chunk = await asyncio.wait_for(anext(chunks), timeout)
+                                except StopAsyncIteration:
+                                    return
+                                started = True
+                                yield chunk
+                        finally:
+                            self.in_flight -= 1
+                            await chunks.aclose()
+                except transient_errors:
+                    if started or attempt >= self.max_retries or loop.time() >= deadline:
+                        raise
+                self.retries += 1
+                await asyncio.sleep(min(self.backoff_delay(attempt), max(0.0, deadline - loop.time())))
+                attempt += 1
+        except Exception:
+            self.failures += 1
+            raise
+
+    async def aclose(self) -> None:
+        await self.backend.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "retries": self.retries,
+            "failures": self.failures,
+        }
+
+
+def create_vision_backend(spec: str, model: str, base_url: Optional[str], max_connections: int) -> VisionBackend:
+    """VISION_BACKEND の指定からバックエンドを生成 ("openai" または "module:ClassName")"""
+    if spec == "openai":
+        return OpenAIVisionBackend(model=model, base_url=base_url, max_connections=max_connections)
+
+    module_name, _, class_name = spec.partition(":")
+    backend_class = getattr(importlib.import_module(module_name), class_name)
+    return backend_class()
@@ -0,0 +1,131 @@
+"""ディスクの計算結果キャッシュ (SCORE_CACHE_DISK_PATH) の事前投入
+
+使い方 (backend ディレクトリで):
+  python warm_score_cache.py [--path data/score_cache.sqlite3] [--corpus corpus.json]
+                             [--requests requests.ndjson] [--generate 200] [--workers 4]
+
+トラフィックを受ける前 (デプロイ直後や mahjong ライブラリの更新でキャッシュが破棄された後) に、
+よく来る手牌の結果を計算して保存しておく。保存済みの手牌は計算しない。入力は次の3種類:
+  --corpus    JSON 配列 (benchmarks.bench_backend --dump-corpus の出力、または /calculate のリクエストの配列)
+  --requests  1行に /calculate のリクエスト JSON か MPSZ 形式 (/calculate/compact) の手牌 1つ
+              (アクセスログから抜き出した入力など)
+  --generate  benchmarks/corpus.py の固定シードのコーパスをカテゴリごとに N 件
+対局ログ (/games/replay の NDJSON) は点数の移動だけで手牌を含まないため入力にはできない。
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator
+
+import main
+from compact_hand import CompactFormatError, parse_mpsz
+from score_cache import DiskScoreCache
+
+
+def corpus_requests(path: str) -> Iterator[dict]:
+    for entry in json.loads(Path(path).read_text(encoding="utf-8")):
+        yield entry.get("request", entry)
+
+
+def logged_requests(path: str) -> Iterator[dict]:
+    with open(path, encoding="utf-8") as lines:
+        for line_number, line in enumerate(lines, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+                yield entry.get("request", entry)
+                continue
+            try:
+                yield parse_mpsz(line).to_request_dict()
+            except CompactFormatError as e:
+                print(f"{path}:{line_number}: skipped ({e})")
+
+
+def generated_requests(per_category: int, seed: int) -> Iterator[dict]:
+    from benchmarks.corpus import build_hand_corpus
+
+    for entry in build_hand_corpus(per_category=per_category, seed=seed):
+        yield entry["request"]
+
+
+def warm(cache: DiskScoreCache, requests: Iterator[dict], workers: int = 0, chunk_size: int = 256) -> dict:
+    """キャッシュに無い手牌を計算して保存し、件数の内訳を返す"""
+    summary = {"read": 0, "invalid": 0, "duplicates": 0, "cached": 0, "computed": 0, "errors": 0}
+    pending: dict[str, main.CalculateRequest] = {}
+    for data in requests:
+        summary["read"] += 1
+        try:
+            request = main.CalculateRequest.model_validate(data)
+        except ValueError:
+            summary["invalid"] += 1
+            continue
+        fingerprint = main.calculate_fingerprint(request)
+        if fingerprint is None:
+            summary["invalid"] += 1
+        elif fingerprint in pending:
+            summary["duplicates"] += 1
+        elif cache.get(fingerprint) is not None:
+            summary["cached"] += 1
+        else:
+            pending[fingerprint] = request
+
+    fingerprints = list(pending)
+    chunks = [fingerprints[i:i + chunk_size] for i in range(0, len(fingerprints), chunk_size)]
+    batches = ([pending[fingerprint] for fingerprint in chunk] for chunk in chunks)
+    if workers > 1 and len(chunks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(main.score_hands, batches))
+    else:
+        results = [main.score_hands(batch) for batch in batches]
+
+    for chunk, scores in zip(chunks, results):
+        # 一時的な失敗の可能性がある calculation_failed は保存しない (main.store_scores と同じ)
+        items = [(fingerprint, score.model_dump_json())
+                 for fingerprint, score in zip(chunk, scores) if score.error != "calculation_failed"]
+        summary["errors"] += len(chunk) - len(items)
+        summary["computed"] += cache.set_many(items)
+    return summary
+
+
+def main_cli() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--path", default=os.getenv("SCORE_CACHE_DISK_PATH", ""), help="既定は SCORE_CACHE_DISK_PATH")
+    parser.add_argument("--max-entries", type=int, default=main.SCORE_CACHE_DISK_MAX_ENTRIES)
+    parser.add_argument("--corpus", action="append", default=[], help="JSON 配列のファイル (複数指定可)")
+    parser.add_argument("--requests", action="append", default=[], help="1行1手牌のファイル (複数指定可)")
+    parser.add_argument("--generate", type=int, default=0, help="生成するコーパスのカテゴリごとの件数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="計算に使うプロセス数")
+    args = parser.parse_args()
+    if not args.path:
+        parser.error("--path か SCORE_CACHE_DISK_PATH を指定してください")
+
+    def all_requests() -> Iterator[dict]:
+        for path in args.corpus:
+            yield from corpus_requests(path)
+        for path in args.requests:
+            yield from logged_requests(path)
+        if args.generate:
+            yield from generated_requests(args.generate, args.seed)
+
+    cache = DiskScoreCache(args.path, args.max_entries, main.score_cache_version())
+    if cache.invalidated:
+        print(f"{args.path}: version changed, cleared stale results")
+    started = time.perf_counter()
+    summary = warm(cache, all_requests(), workers=args.workers)
+    elapsed = time.perf_counter() - started
+    print(
+        f"read {summary['read']} (invalid {summary['invalid']}, duplicates {summary['duplicates']}), "
+        f"already cached {summary['cached']}, computed {summary['computed']}, errors {summary['errors']} "
+        f"in {elapsed:.1f}s; {len(cache)} entries in {args.path}"
+    )
+    cache.close()
+
+
+if __name__ == "__main__":
+    main_cli()